@@ -0,0 +1,179 @@
+"""
+API response cache benchmark
+
+Pages through a blog served from a local HTTP server built from the recorded /v2/blog/{host}/posts response in
+benchmarks/fixtures/posts_page.json, without any network access. Every page gets its own post IDs and an ETag, and
+the server answers conditional requests with 304 Not Modified. The same crawl is run:
+
+    no cache    every page is fetched from the API
+    cold        the cache is empty, every page is fetched and stored
+    warm        the first page is revalidated and found unchanged, every other page is served from the cache
+    stale       every cached page has expired and is revalidated with a conditional request
+    bounded     the cache is limited to a quarter of the pages, least recently used pages are evicted
+
+For each crawl the number of API requests (and how many of them were answered with 304), the wall time and the size
+of the cache are reported. The script exits with an error if any crawl yields different posts than the uncached one.
+
+Usage:
+    python benchmarks/api_cache.py [--pages 50] [--latency 0.02]
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from tumdlr.api import PAGE_SIZE, TumblrBlog  # noqa: E402
+from tumdlr.cache import ResponseCache  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'posts_page.json')
+
+
+def build_pages(pages):
+    """
+    Returns:
+        dict[int, bytes]: Response body by post offset, plus an empty page past the last one
+    """
+    with open(FIXTURE, 'rb') as fixture:
+        recorded = json.loads(fixture.read().decode('utf-8'))
+
+    recorded['response']['blog']['posts'] = recorded['response']['total_posts'] = pages * PAGE_SIZE
+    bodies = {}
+
+    for page in range(pages + 1):
+        offset = page * PAGE_SIZE
+        posts = [dict(post, id=offset + index + 1) for index, post in enumerate(recorded['response']['posts'])]
+        data = dict(recorded, response=dict(recorded['response'], posts=posts if page < pages else []))
+        bodies[offset] = json.dumps(data).encode('utf-8')
+
+    return bodies
+
+
+def serve(bodies, latency):
+    """
+    Start a local API server
+
+    Args:
+        bodies(dict[int, bytes]): Response body by post offset
+        latency(float): Seconds to wait before answering each request
+
+    Returns:
+        ThreadingHTTPServer
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(latency)
+            self.server.requests += 1
+
+            offset = int(parse_qs(urlsplit(self.path).query).get('offset', ['0'])[0])
+            body = bodies.get(offset, bodies[max(bodies)])
+            etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+
+            if self.headers.get('If-None-Match') == etag:
+                self.server.not_modified += 1
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.requests = server.not_modified = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def local_blog(server):
+    """
+    Returns:
+        type: TumblrBlog sending its API requests to the local server
+    """
+    host = 'http://{}:{}'.format(*server.server_address)
+
+    class LocalBlog(TumblrBlog):
+        def _api_endpoint(self, query=None, offset=None):
+            return super()._api_endpoint(query, offset).replace('https://api.tumblr.com', host, 1)
+
+    return LocalBlog
+
+
+def crawl(blog_class, server, cache):
+    """
+    Returns:
+        tuple[list[int], int, int, float]: Post IDs, API requests, 304 answers and seconds taken
+    """
+    server.requests = server.not_modified = 0
+
+    start = time.perf_counter()
+    blog = blog_class('https://example.tumblr.com', cache=cache)
+    ids = [post.id for post in blog.posts()]
+    elapsed = time.perf_counter() - start
+
+    return ids, server.requests, server.not_modified, elapsed
+
+
+def cache_size(path):
+    return sum(entry.stat().st_size for entry in os.scandir(path)) if os.path.isdir(path) else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds added to every API request')
+    args = parser.parse_args()
+
+    bodies = build_pages(args.pages)
+    server = serve(bodies, args.latency)
+    blog_class = local_blog(server)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'api')
+        bounded = os.path.join(tmp, 'bounded')
+        page_size = len(bodies[0]) + 128
+
+        crawls = [
+            ('no cache', None),
+            ('cold', ResponseCache(path, ttl=3600)),
+            ('warm', ResponseCache(path, ttl=3600)),
+            ('stale', ResponseCache(path, ttl=0)),
+            ('bounded', ResponseCache(bounded, ttl=3600, max_size=page_size * (args.pages // 4))),
+        ]
+
+        expected = None
+        for name, cache in crawls:
+            ids, requests, not_modified, elapsed = crawl(blog_class, server, cache)
+
+            if expected is None:
+                expected = ids
+            elif ids != expected:
+                sys.exit('The {} crawl yielded different posts than the uncached crawl'.format(name))
+
+            size = cache_size(cache.path) if cache else 0
+            print('{:<10} {:5d} posts {:5d} requests {:5d} not modified {:8.3f} s {:8.1f} KiB cached'
+                  .format(name, len(ids), requests, not_modified, elapsed, size / 1024))
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+API page parse benchmark
+
+Parses a recorded /v2/blog/{host}/posts response (benchmarks/fixtures/posts_page.json) into post containers the way
+TumblrBlog does, comparing the previous approach of decoding the body twice per page against a single decode with the
+standard library and with the fastest JSON backend installed (orjson or ujson).
+
+Usage:
+    python benchmarks/api_parse.py [--pages 500] [--fixture benchmarks/fixtures/posts_page.json]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from tumdlr import api  # noqa: E402
+from tumdlr.api import TumblrBlog  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'posts_page.json')
+
+
+class FixtureBlog(TumblrBlog):
+    """
+    A blog that never touches the network
+    """
+    def _load(self):
+        pass
+
+
+def parse_twice(blog, content):
+    # What _api_parse_response() used to do: one full decode for the blog info and another for the posts
+    blog._api_parse_blog(json.loads(content)['response'])
+    return blog._api_parse_posts(json.loads(content)['response']['posts'])
+
+
+def parse_once(loads):
+    def parse(blog, content):
+        return blog._api_parse_response(loads(content)['response'])
+
+    return parse
+
+
+def measure(parse, content, pages):
+    """
+    Returns:
+        tuple[float, int]: Milliseconds per page and peak traced memory in bytes
+    """
+    blog = FixtureBlog('https://example.tumblr.com')
+
+    start = time.perf_counter()
+    for __ in range(pages):
+        parse(blog, content)
+    elapsed = (time.perf_counter() - start) / pages * 1000
+
+    tracemalloc.start()
+    parse(blog, content)
+    __, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--fixture', default=FIXTURE)
+    args = parser.parse_args()
+
+    with open(args.fixture, 'rb') as fixture:
+        content = fixture.read()
+
+    variants = [
+        ('Two decodes (json)', parse_twice),
+        ('One decode (json)', parse_once(json.loads)),
+    ]
+
+    if api.json_loads is not json.loads:
+        variants.append(('One decode ({})'.format(api.json_loads.__module__), parse_once(api.json_loads)))
+
+    print('{} byte page, {} posts'.format(len(content), len(json.loads(content)['response']['posts'])))
+    for name, parse in variants:
+        elapsed, peak = measure(parse, content, args.pages)
+        print('{:<24} {:8.3f} ms/page {:10.1f} KiB peak'.format(name, elapsed, peak / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Per-file download latency benchmark
+
+Serves a fixed payload from a local HTTP server that adds an artificial delay to every request (standing in for the
+round trip to Tumblr's media CDN) and compares downloader.download() with and without the HEAD preflight.
+
+Usage:
+    python benchmarks/download.py [--files 50] [--size 65536] [--latency 0.02]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from requests import Session
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from tumdlr.downloader import download  # noqa: E402
+
+
+def serve(payload, latency):
+    """
+    Start a local HTTP server returning `payload` for every path
+
+    Args:
+        payload(bytes): Response body
+        latency(float): Seconds to wait before answering each request
+
+    Returns:
+        ThreadingHTTPServer
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def _headers(self):
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header('Content-Type', 'image/jpeg')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+
+        def do_HEAD(self):
+            self._headers()
+
+        def do_GET(self):
+            self._headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(base_url, files, preflight):
+    """
+    Returns:
+        float: Average seconds per file
+    """
+    session = Session()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        for i in range(files):
+            download('{}/{}.jpg'.format(base_url, i), os.path.join(tmp, '{}.jpg'.format(i)),
+                     session=session, preflight=preflight)
+
+        return (time.perf_counter() - start) / files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=50)
+    parser.add_argument('--size', type=int, default=64 * 1024)
+    parser.add_argument('--latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    server = serve(os.urandom(args.size), args.latency)
+    base_url = 'http://{}:{}'.format(*server.server_address)
+
+    with_head = run(base_url, args.files, preflight=True)
+    without_head = run(base_url, args.files, preflight=False)
+    server.shutdown()
+
+    print('HEAD + GET:   {:8.2f} ms/file'.format(with_head * 1000))
+    print('GET (stream): {:8.2f} ms/file'.format(without_head * 1000))
+    print('Saved:        {:8.2f} ms/file ({:.0%})'.format((with_head - without_head) * 1000,
+                                                         1 - without_head / with_head))
+
+
+if __name__ == '__main__':
+    main()
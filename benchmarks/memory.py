@@ -0,0 +1,97 @@
+"""
+Post container memory benchmark
+
+Enumerates a synthetic blog (100,000 posts by default) built from the recorded API page in
+benchmarks/fixtures/posts_page.json, and keeps every parsed post container alive the way a long enumeration or batch
+run does. Reports the traced memory per post, with and without the raw API data kept on the containers.
+
+Usage:
+    python benchmarks/memory.py [--posts 100000] [--fixture benchmarks/fixtures/posts_page.json]
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from tumdlr.api import json_loads  # noqa: E402
+from tumdlr.api import TumblrBlog  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'posts_page.json')
+
+
+class FixtureBlog(TumblrBlog):
+    """
+    A blog that never touches the network
+    """
+    def _load(self):
+        pass
+
+
+def synthetic_pages(content, posts):
+    """
+    Decode the fixture page over and over, with unique post IDs, until the requested number of posts is reached
+
+    Yields:
+        dict: The decoded `response` object of an API page
+    """
+    produced = 0
+
+    while produced < posts:
+        data = json_loads(content)['response']
+        data['posts'] = data['posts'][:posts - produced]
+
+        for post in data['posts']:
+            post['id'] = produced
+            produced += 1
+
+        yield data
+
+
+def measure(content, posts, **kwargs):
+    """
+    Returns:
+        tuple[int, float, float]: Number of posts held, bytes per post and seconds taken
+    """
+    blog = FixtureBlog('https://example.tumblr.com', **kwargs)
+    held = []
+
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+
+    for data in synthetic_pages(content, posts):
+        held.extend(blog._api_parse_response(data))
+
+    elapsed = time.perf_counter() - start
+    current, __ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return len(held), current / len(held), elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--fixture', default=FIXTURE)
+    args = parser.parse_args()
+
+    with open(args.fixture, 'rb') as fixture:
+        content = fixture.read()
+
+    variants = [
+        ('Raw API data kept', {'keep_raw': True}),
+        ('Raw API data dropped', {'keep_raw': False}),
+    ]
+
+    for name, kwargs in variants:
+        count, per_post, elapsed = measure(content, args.posts, **kwargs)
+        print('{:<22} {:8d} posts {:10.1f} bytes/post {:8.1f} MiB total {:6.2f}s'
+              .format(name, count, per_post, per_post * count / 1024 / 1024, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""
+Filename sanitizer benchmark
+
+Compares downloader.sanitize_filename() against the previous implementation, which compiled its regexes on every call
+and filtered control characters one character at a time. The caption corpus is made of the captions and titles in
+benchmarks/fixtures/posts_page.json plus generated captions mixing the things real captions are full of: HTML
+entities, line breaks, emoji, hashtags, URLs, non-latin scripts and long text. Three workloads are timed:
+
+    unique      every caption once, with the memo bypassed
+    files       the calls filepath() makes while archiving a blog: the blog name for every file and the caption (or
+                the page number prefixed caption) of every photo, so half the calls repeat a recent input
+    reserved    short names hitting the reserved character and reserved name rules
+
+Before timing anything, both implementations are run over the corpus and a set of randomly generated names and the
+outputs compared. The script exits with an error if any of them differ.
+
+Usage:
+    python benchmarks/sanitize.py [--rounds 20] [--fuzz 20000]
+"""
+import argparse
+import html
+import json
+import os
+import random
+import re
+import sys
+import time
+import unicodedata
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from tumdlr import downloader  # noqa: E402
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'posts_page.json')
+
+WORDS = ('summer', 'night', 'vintage', 'aesthetic', 'ocean', 'Tokyo', 'café', 'naïve', 'photography', 'mood',
+         '東京', 'ночь', 'مرحبا', '🌸', '✨', '😍', '#art', '#nature', 'https://example.com/a?b=c',
+         'C:\\temp', '&amp;', '&lt;3', '&#39;', '&quot;quoted&quot;', 'feat.', 'vol. 2', 'A/B', 'what?', 'yes!',
+         '...', '…', '\u200b', '\u202e', '\t', '\r\n')
+
+
+def reference_sanitize_filename(name):
+    """
+    The implementation sanitize_filename() replaced, kept verbatim to check the outputs against
+    """
+    if isinstance(name, int):
+        return str(name)
+
+    if os.sep == '/':
+        bad_chars = re.compile(r'^\.|\.$|^ | $|^$|\?|:|<|>|\||\*|\"|/')
+    else:
+        bad_chars = re.compile(r'^\.|\.$|^ | $|^$|\?|:|<|>|/|\||\*|\"|\\')
+
+    bad_names = re.compile(r'(aux|com[1-9]|con|lpt[1-9]|prn)(\.|$)')
+
+    # Unescape '&amp;', '&lt;', and '&gt;'
+    name = html.unescape(name)
+
+    # Replace bad characters with an underscore
+    name = bad_chars.sub('_', name)
+    if bad_names.match(name):
+        name = '_' + name
+
+    # Replace newlines with spaces
+    name = name.replace("\r", '')
+    name = name.replace("\n", ' ')
+
+    # Yavos (?)
+    while name.find('.\\') != -1:
+        name = name.replace('.\\', '\\')
+
+    name = name.replace('\\', os.sep)
+
+    # Replace tab characters with spaces
+    name = name.replace('\t', ' ')
+
+    # Cut to 125 characters
+    if len(name) > 125:
+        name = name[:125]
+
+    # Remove unicode control characters
+    name = ''.join(char for char in name if unicodedata.category(char)[0] != "C")
+
+    return name.strip()
+
+
+def caption_corpus(rng, count=2000):
+    with open(FIXTURE, 'rb') as fixture:
+        posts = json.loads(fixture.read().decode('utf-8'))['response']['posts']
+
+    corpus = [post.get('caption') or post.get('title') or '' for post in posts]
+
+    for __ in range(count):
+        lines = [' '.join(rng.choice(WORDS) for __ in range(rng.randint(1, 25))) for __ in range(rng.randint(1, 4))]
+        caption = rng.choice(('\n', '\n\n', '\r\n')).join(lines)
+        corpus.append(caption.capitalize() if rng.random() < 0.5 else caption)
+
+    return corpus
+
+
+def reserved_corpus(rng, count=2000):
+    names = ('con', 'aux.txt', 'com1', 'lpt9.tar', 'prn', 'console', '.hidden', 'trailing.', ' padded ', '', '\n',
+             'a.\n', 'a \n', 'x:y', 'a|b', 'what?', '<tag>', 'dir/file', 'back\\slash', 'dots..\\.\\x', 'tab\there')
+    return [rng.choice(names) + rng.choice(('', '', '1', '.', ' ', '\n')) for __ in range(count)]
+
+
+def file_stream(rng, corpus):
+    blog = 'example-blog'
+    calls = []
+
+    for caption in corpus:
+        pages = rng.choice((1, 1, 1, 2, 3, 4, 6, 10))
+
+        for page in range(1, pages + 1):
+            calls.append(blog)
+            calls.append('p{}_{}'.format(page, caption) if pages > 1 else caption)
+
+    return calls
+
+
+def fuzz_corpus(rng, count):
+    alphabet = ('.. \t\r\n\\\\//?:<>|*"&;#ampltgquo0123456789aconuxprmlt'
+                '\x00\x1f\x7f\x85\u200b\u2028\u00e9\u6771\U0001f338')
+    return [''.join(rng.choice(alphabet) for __ in range(rng.randint(0, 140))) for __ in range(count)]
+
+
+def check(corpora):
+    mismatches = 0
+
+    for corpus in corpora:
+        for name in corpus:
+            expected, actual = reference_sanitize_filename(name), downloader.sanitize_filename(name)
+            if expected != actual:
+                mismatches += 1
+                print('Mismatch for {!r}: {!r} != {!r}'.format(name, actual, expected), file=sys.stderr)
+
+    return mismatches
+
+
+def timed(function, names, rounds):
+    start = time.perf_counter()
+    for __ in range(rounds):
+        for name in names:
+            function(name)
+
+    return (time.perf_counter() - start) / (rounds * len(names)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--fuzz', type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    captions = caption_corpus(rng)
+    reserved = reserved_corpus(rng)
+    files = file_stream(rng, captions)
+
+    mismatches = check([captions, reserved, files, fuzz_corpus(rng, args.fuzz)])
+    if mismatches:
+        sys.exit('{} outputs differ from the previous implementation'.format(mismatches))
+
+    print('Outputs identical to the previous implementation')
+
+    workloads = [
+        ('unique', captions, downloader._sanitize_filename.__wrapped__),
+        ('files', files, downloader.sanitize_filename),
+        ('reserved', reserved, downloader._sanitize_filename.__wrapped__),
+    ]
+
+    for name, names, function in workloads:
+        downloader._sanitize_filename.cache_clear()
+        before = timed(reference_sanitize_filename, names, args.rounds)
+        after = timed(function, names, args.rounds)
+        print('{:<10} {:6d} calls {:8.2f} us/call before {:8.2f} us/call after {:6.1f}x'
+              .format(name, len(names), before, after, before / after))
+
+
+if __name__ == '__main__':
+    main()
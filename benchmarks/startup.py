@@ -0,0 +1,140 @@
+"""
+Command line startup benchmark
+
+Times how long the tumdlr command line takes to start, the cost scripts pay on every call when they run tumdlr once
+per blog. Each command is run in a fresh interpreter, the median wall time of the runs is reported, and
+`python -X importtime` is used to list the modules that take the longest to import:
+
+    import      import tumdlr.__main__ and every command module, without running anything
+    help        tumdlr --help
+    download    tumdlr download --help
+
+The runs use an empty temporary configuration directory (with the terms already agreed to), so the first run setup
+never starts. Pass --against with a git revision to run the same commands against that revision of the tree and
+compare.
+
+Usage:
+    python benchmarks/startup.py [--runs 10] [--top 10] [--against HEAD~1]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+IMPORTS = 'import tumdlr.__main__, tumdlr.commands.download, tumdlr.commands.download_batch, tumdlr.commands.setup'
+
+COMMANDS = [
+    ('import', ['-c', IMPORTS]),
+    ('help', ['-m', 'tumdlr', '--help']),
+    ('download', ['-m', 'tumdlr', 'download', '--help']),
+]
+
+
+def environment(tree, config_home):
+    env = dict(os.environ, PYTHONPATH=tree, XDG_CONFIG_HOME=config_home)
+    env.pop('PYTHONWARNINGS', None)
+    return env
+
+
+def write_config(config_home):
+    os.makedirs(os.path.join(config_home, 'tumdlr'))
+    with open(os.path.join(config_home, 'tumdlr', 'tumdlr.cfg'), 'w') as config:
+        config.write('[Development]\nAgreedToTerms = True\n')
+
+
+def export(revision, destination):
+    """
+    Extract a git revision of the tree into a directory
+    """
+    os.makedirs(destination)
+    archive = os.path.join(destination, 'tree.tar')
+    subprocess.run(['git', 'archive', '--format=tar', '-o', archive, revision], cwd=ROOT, check=True)
+
+    with tarfile.open(archive) as tar:
+        tar.extractall(destination)
+
+    os.remove(archive)
+    return destination
+
+
+def median_time(arguments, tree, env, runs):
+    # One untimed run first, so every timed run starts with compiled bytecode and warm file caches
+    run = dict(cwd=tree, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+    subprocess.run([sys.executable] + arguments, **run)
+
+    timings = []
+    for __ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + arguments, **run)
+        timings.append(time.perf_counter() - start)
+
+    return statistics.median(timings) * 1000
+
+
+def slowest_imports(tree, env, top):
+    """
+    Returns:
+        list[tuple[int, str]]: Cumulative import time in microseconds and module name, for the top level imports
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', IMPORTS], cwd=tree, env=env, check=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        __, cumulative, name = line[len('import time:'):].split('|')
+        # Nested imports are indented, their time is already counted in the module importing them
+        if not name[1:].startswith(' '):
+            imports.append((int(cumulative), name.strip()))
+
+    return sorted(imports, reverse=True)[:top]
+
+
+def measure(label, tree, config_home, runs, top):
+    env = environment(tree, config_home)
+    results = {}
+
+    print(label)
+    for name, arguments in COMMANDS:
+        results[name] = median_time(arguments, tree, env, runs)
+        print('  {:<10} {:8.1f} ms'.format(name, results[name]))
+
+    print('  slowest top level imports:')
+    for cumulative, module in slowest_imports(tree, env, top):
+        print('    {:<40} {:8.1f} ms'.format(module, cumulative / 1000))
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--top', type=int, default=10, help='Number of slow imports to list')
+    parser.add_argument('--against', metavar='REVISION', help='Git revision to compare the working tree with')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config_home = os.path.join(tmp, 'config')
+        write_config(config_home)
+
+        current = measure('working tree', ROOT, config_home, args.runs, args.top)
+
+        if args.against:
+            baseline = measure(args.against, export(args.against, os.path.join(tmp, 'baseline')), config_home,
+                               args.runs, args.top)
+
+            print('speedup')
+            for name, __ in COMMANDS:
+                print('  {:<10} {:8.1f}x'.format(name, baseline[name] / current[name]))
+
+
+if __name__ == '__main__':
+    main()
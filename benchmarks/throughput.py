@@ -0,0 +1,114 @@
+"""
+Download throughput benchmark
+
+Downloads a large file from a local HTTP server running in a separate process and reports the throughput in MB/s and
+the client's CPU time per GB transferred. The previous write loop (1 KiB chunks, flushed after every chunk) is
+compared with downloader.download() at several chunk sizes.
+
+Usage:
+    python benchmarks/throughput.py [--size 256] [--repeat 3]
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from requests import Session
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from tumdlr.downloader import download  # noqa: E402
+
+
+def serve(size, ready):
+    """
+    Serve `size` bytes for every path until the process is terminated. Runs in its own process so the server's CPU
+    time isn't counted against the client
+    """
+    payload = memoryview(os.urandom(1024 * 1024))
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'video/mp4')
+            self.send_header('Content-Length', str(size))
+            self.end_headers()
+
+            remaining = size
+            while remaining:
+                chunk = payload[:min(remaining, len(payload))]
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    ready.put(server.server_address)
+    server.serve_forever()
+
+
+def previous_download(url, filename, session):
+    # The write loop download() used to have
+    response = session.get(url, stream=True)
+    with response, open(filename, 'wb') as file:
+        for chunk in response.iter_content(1024):
+            if chunk:
+                file.write(chunk)
+                file.flush()
+
+
+def measure(function, size, repeat):
+    """
+    Returns:
+        tuple[float, float]: MB/s and CPU seconds per GB, best of `repeat` runs
+    """
+    best_wall = best_cpu = None
+
+    for __ in range(repeat):
+        with tempfile.TemporaryDirectory() as tmp:
+            wall, cpu = time.perf_counter(), time.process_time()
+            function(os.path.join(tmp, 'video.mp4'))
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+        best_wall = wall if best_wall is None else min(best_wall, wall)
+        best_cpu = cpu if best_cpu is None else min(best_cpu, cpu)
+
+    return size / best_wall / 1e6, best_cpu / (size / 1e9)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=256, help='File size in MiB')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    size = args.size * 1024 * 1024
+    ready = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(size, ready), daemon=True)
+    server.start()
+
+    url = 'http://{}:{}/video.mp4'.format(*ready.get())
+    session = Session()
+
+    variants = [('1 KiB + flush (previous)', lambda path: previous_download(url, path, session))]
+
+    for chunk_size in (64 * 1024, 256 * 1024, 1024 * 1024):
+        variants.append(('{} KiB'.format(chunk_size // 1024), lambda path, c=chunk_size: download(
+            url, path, session=session, chunk_size=c)))
+
+    try:
+        for name, function in variants:
+            throughput, cpu = measure(function, size, args.repeat)
+            print('{:<26} {:8.1f} MB/s {:8.2f} CPU s/GB'.format(name, throughput, cpu))
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
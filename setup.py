@@ -45,8 +45,12 @@ setup(
     include_package_data=True,
     entry_points={
         'console_scripts': [
-            'tumdlr = tumdlr.main:cli'
+            'tumdlr = tumdlr.__main__:cli'
         ]
     },
-    install_requires=['click', 'yurl', 'lxml', 'requests', 'humanize', 'appdirs', 'youtube_dl']
+    install_requires=['click', 'yurl', 'lxml', 'requests', 'humanize', 'appdirs', 'youtube_dl', 'sqlalchemy'],
+    extras_require={
+        'async': ['aiohttp'],
+        'speedups': ['orjson']
+    }
 )
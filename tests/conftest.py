@@ -0,0 +1,237 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from types import SimpleNamespace
+
+import pytest
+
+from tumdlr.api import TumblrBlog
+from tumdlr.containers import TumblrPhotoSet
+
+
+class MediaServer(ThreadingHTTPServer):
+    """
+    Local media host. Every path serves its own content, which can be replaced to simulate a file changing on the
+    server. Range and If-Range requests are handled the way Tumblr's media hosts handle them
+    """
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), MediaHandler)
+
+        self.files      = {}
+        self.errors     = {}    # Path => error responses to send before serving the file, as (status, headers)
+        self.truncated  = {}    # Path => number of bytes to send before dropping the connection, once
+        self.requests   = []
+        self.delay      = 0.0
+        self.lock       = threading.Lock()
+
+    def url(self, path):
+        return 'http://{}:{}{}'.format(*self.server_address, path)
+
+    @staticmethod
+    def etag(content):
+        return '"{}"'.format(hashlib.md5(content).hexdigest())
+
+    def serve(self, path, content):
+        """
+        Args:
+            path(str): URL path
+            content(bytes): File content
+
+        Returns:
+            str: URL of the file
+        """
+        self.files[path] = content
+        return self.url(path)
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append((self.path, dict(self.headers)))
+
+        errors = self.server.errors.get(self.path)
+        if errors:
+            status, headers = errors.pop(0)
+
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        content = self.server.files.get(self.path)
+        if content is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        etag = self.server.etag(content)
+        start = 0
+
+        range_header, if_range = self.headers.get('Range'), self.headers.get('If-Range')
+        if range_header and if_range in (None, etag):
+            start = int(range_header.split('=')[1].split('-')[0])
+
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */{}'.format(len(content)))
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, len(content) - 1, len(content)))
+        else:
+            self.send_response(200)
+
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(content) - start))
+        self.end_headers()
+
+        end = len(content)
+        if self.path in self.server.truncated:
+            end = start + self.server.truncated.pop(self.path)
+            self.close_connection = True
+
+        # Send the body in pieces, so concurrent downloads of the same file overlap
+        for offset in range(start, end, 8192):
+            self.wfile.write(content[offset:min(offset + 8192, end)])
+            time.sleep(self.server.delay)
+
+
+class ApiServer(ThreadingHTTPServer):
+    """
+    Local Tumblr API serving the posts of a single blog, newest first. Pages carry an ETag and conditional requests
+    are answered with 304 Not Modified, unless validators are turned off
+    """
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), ApiHandler)
+
+        self.posts      = []
+        self.requests   = []
+        self.validators = True
+
+    def publish(self, count, notes=0):
+        """
+        Add new photo posts at the top of the blog
+
+        Args:
+            count(int): Number of posts
+            notes(int|Callable[[int], int]): Note count of the posts, or a function of the post ID returning it
+        """
+        newest = self.posts[0]['id'] if self.posts else 0
+
+        for post_id in range(newest + 1, newest + count + 1):
+            self.posts.insert(0, {
+                'id': post_id, 'type': 'photo', 'post_url': 'http://blog.tumblr.com/post/{}'.format(post_id),
+                'date': '2020-01-01 00:00:00 GMT', 'timestamp': 1577836800 + post_id, 'tags': [],
+                'note_count': notes(post_id) if callable(notes) else notes, 'caption': 'post {}'.format(post_id),
+                'photos': [{'original_size': {'url': 'http://media.blog/{}.jpg'.format(post_id)}}]
+            })
+
+    def blog(self, **kwargs):
+        """
+        Returns:
+            TumblrBlog: The blog, sending its API requests to this server
+        """
+        host = 'http://{}:{}'.format(*self.server_address)
+
+        class LocalBlog(TumblrBlog):
+            def _api_endpoint(self, query=None, offset=None):
+                return super()._api_endpoint(query, offset).replace('https://api.tumblr.com', host, 1)
+
+        return LocalBlog('http://blog.tumblr.com', **kwargs)
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        query = {key: values[0] for key, values in parse_qs(urlsplit(self.path).query).items()}
+        self.server.requests.append(query)
+
+        posts = self.server.posts
+        offset, limit = int(query.get('offset', 0)), int(query.get('limit', 20))
+
+        body = json.dumps({'meta': {'status': 200}, 'response': {
+            'blog': {'title': 'Blog', 'url': 'http://blog.tumblr.com/', 'name': 'blog', 'description': '',
+                     'is_nsfw': False, 'posts': len(posts), 'updated': posts[0]['timestamp'] if posts else 0},
+            'posts': posts[offset:offset + limit],
+            'total_posts': len(posts)
+        }}).encode('utf-8')
+
+        etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+        if self.server.validators and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        if self.server.validators:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def _serve(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    yield server
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def media_server():
+    yield from _serve(MediaServer())
+
+
+@pytest.fixture
+def api_server():
+    yield from _serve(ApiServer())
+
+
+@pytest.fixture
+def old_image():
+    return b'old image ' * 3200
+
+
+@pytest.fixture
+def new_image():
+    return b'new image ' * 5000
+
+
+@pytest.fixture
+def photo_post():
+    """
+    Returns:
+        Callable[[int, str, str], TumblrPhotoSet]: Builds a photo post of a single image from its ID, URL and caption
+    """
+    def build(post_id, url, caption='same'):
+        blog = SimpleNamespace(name='blog', keep_raw=False)
+        data = {'id': post_id, 'type': 'photo', 'date': '2020-01-01 00:00:00 GMT', 'caption': caption,
+                'photos': [{'original_size': {'url': url, 'width': 10, 'height': 10}}]}
+
+        return TumblrPhotoSet(data, blog)
+
+    return build
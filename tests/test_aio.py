@@ -0,0 +1,122 @@
+import asyncio
+import os
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from tumdlr.paths import PathPlanner
+from tumdlr.throttle import Throttle
+
+aiohttp = pytest.importorskip('aiohttp')
+
+from tumdlr.aio import AsyncTumblrBlog, download  # noqa: E402
+
+
+def run(coroutine_function, *args):
+    async def main():
+        async with aiohttp.ClientSession() as session:
+            return await coroutine_function(session, *args)
+
+    return asyncio.run(main())
+
+
+def test_truncated_file_is_downloaded_again(media_server, tmp_path, new_image):
+    url = media_server.serve('/new.jpg', new_image)
+    filename = str(tmp_path / 'new.jpg')
+
+    with open(filename, 'wb') as file:
+        file.write(new_image[:1000])
+
+    run(download, url, filename)
+
+    with open(filename, 'rb') as file:
+        assert file.read() == new_image
+
+
+def test_existing_file_of_another_url_is_replaced(media_server, tmp_path, old_image, new_image):
+    filename = str(tmp_path / 'same.jpg')
+    with open(filename, 'wb') as file:
+        file.write(old_image)
+
+    run(download, media_server.serve('/new.jpg', new_image), filename)
+
+    with open(filename, 'rb') as file:
+        assert file.read() == new_image
+
+
+def test_rate_limited_requests_are_retried_through_the_throttle(media_server, tmp_path, new_image):
+    url = media_server.serve('/limited.jpg', new_image)
+    media_server.errors['/limited.jpg'] = [(429, {'Retry-After': '0'}), (503, {})]
+
+    throttle = Throttle(max_concurrency=4, retries=3, backoff=0.01)
+    filename = str(tmp_path / 'limited.jpg')
+
+    run(download, url, filename, None, 8192, True, throttle)
+
+    with open(filename, 'rb') as file:
+        assert file.read() == new_image
+
+    assert throttle.limit < throttle.max_concurrency
+    assert len(media_server.requests) == 3
+
+
+def test_concurrent_downloads_to_the_same_path(media_server, tmp_path, photo_post, new_image):
+    media_server.delay = 0.001
+    url = media_server.serve('/reblogged.jpg', new_image * 4)
+    posts = [photo_post(post_id, url) for post_id in range(1, 9)]
+
+    context = SimpleNamespace(planner=PathPlanner(str(tmp_path)), media=None)
+
+    async def main(session):
+        blog = AsyncTumblrBlog('http://blog.tumblr.com', session=session, workers=4)
+        return await asyncio.gather(*(blog.download(post.files[0], context) for post in posts))
+
+    paths = run(main)
+
+    assert len(set(paths)) == 1
+
+    with open(paths[0], 'rb') as file:
+        assert file.read() == new_image * 4
+
+    assert os.listdir(os.path.dirname(paths[0])) == ['same.jpg']
+
+
+def test_disk_and_database_work_is_kept_off_the_event_loop(media_server, tmp_path, photo_post, new_image):
+    post = photo_post(1, media_server.serve('/new.jpg', new_image))
+    threads = []
+
+    class Media:
+        def link(self, url, path):
+            threads.append(threading.current_thread())
+
+        def add(self, url, path, sha1=None):
+            threads.append(threading.current_thread())
+
+    context = SimpleNamespace(planner=PathPlanner(str(tmp_path)), media=Media())
+
+    async def main(session):
+        blog = AsyncTumblrBlog('http://blog.tumblr.com', session=session)
+        return await blog.download(post.files[0], context), threading.current_thread()
+
+    path, loop_thread = run(main)
+
+    with open(path, 'rb') as file:
+        assert file.read() == new_image
+
+    assert len(threads) == 2 and loop_thread not in threads
+
+
+def test_offset_is_the_page_of_the_current_post(api_server):
+    api_server.publish(50)
+    host = 'http://{}:{}'.format(*api_server.server_address)
+
+    class LocalBlog(AsyncTumblrBlog):
+        def _api_endpoint(self, query=None, offset=None):
+            return super()._api_endpoint(query, offset).replace('https://api.tumblr.com', host, 1)
+
+    async def main(session):
+        async with LocalBlog('http://blog.tumblr.com', session=session, workers=4) as blog:
+            return [blog.offset async for __ in blog.posts()]
+
+    assert run(main) == [0] * 20 + [20] * 20 + [40] * 10
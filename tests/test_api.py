@@ -0,0 +1,24 @@
+import pytest
+
+
+def test_blog_information_is_only_taken_from_the_first_page(api_server):
+    api_server.publish(100)
+    blog = api_server.blog(workers=4)
+    updated, total_posts = blog.updated, blog.total_posts
+
+    # Posts published mid-crawl change the blog information the workers' pages carry
+    api_server.publish(5)
+    ids = [post.id for post in blog.posts()]
+
+    assert (blog.updated, blog.total_posts) == (updated, total_posts)
+    assert len(ids) == len(set(ids))
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_offset_is_the_page_of_the_current_post(api_server, workers):
+    api_server.publish(50)
+    blog = api_server.blog(workers=workers)
+
+    offsets = [blog.offset for __ in blog.posts()]
+
+    assert offsets == [0] * 20 + [20] * 20 + [40] * 10
@@ -0,0 +1,38 @@
+import pytest
+
+from tumdlr.cache import ResponseCache
+
+
+def crawl(api_server, cache):
+    blog = api_server.blog(cache=cache)
+    return blog, [post.id for post in blog.posts()]
+
+
+@pytest.mark.parametrize('validators', [True, False])
+def test_unchanged_blog_is_served_from_the_cache(api_server, tmp_path, validators):
+    api_server.validators = validators
+    api_server.publish(60)
+    cache = ResponseCache(str(tmp_path), ttl=3600)
+
+    __, first = crawl(api_server, cache)
+    del api_server.requests[:]
+    __, second = crawl(api_server, cache)
+
+    assert second == first
+    assert len(api_server.requests) == 1
+
+
+@pytest.mark.parametrize('validators', [True, False])
+def test_changed_blog_is_not_served_from_the_cache(api_server, tmp_path, validators):
+    api_server.validators = validators
+    api_server.publish(60)
+    cache = ResponseCache(str(tmp_path), ttl=3600)
+    blog, __ = crawl(api_server, cache)
+    updated = blog.updated
+
+    # New posts push every older post to a later offset
+    api_server.publish(5)
+    blog, ids = crawl(api_server, cache)
+
+    assert blog.updated > updated
+    assert ids == [post['id'] for post in api_server.posts]
@@ -0,0 +1,55 @@
+import threading
+
+import pytest
+
+from tumdlr.buffer import PostBuffer
+
+
+def test_posts_come_out_in_order():
+    buffer = PostBuffer()
+    buffer.extend(range(5))
+    buffer.finish()
+
+    assert [buffer.get() for __ in range(6)] == [0, 1, 2, 3, 4, None]
+
+
+def test_producer_waits_for_room():
+    buffer = PostBuffer(maxsize=2)
+    buffer.extend([1, 2])
+
+    producer = threading.Thread(target=buffer.put, args=(3,))
+    producer.start()
+    producer.join(0.1)
+    assert producer.is_alive() and len(buffer) == 2
+
+    assert buffer.get() == 1
+    producer.join(5)
+    assert not producer.is_alive() and len(buffer) == 2
+
+
+def test_closing_releases_a_waiting_producer():
+    buffer = PostBuffer(maxsize=1)
+    buffer.put(1)
+    results = []
+
+    producer = threading.Thread(target=lambda: results.append(buffer.extend([2, 3])))
+    producer.start()
+    producer.join(0.1)
+
+    buffer.close()
+    producer.join(5)
+
+    assert results == [False]
+    assert len(buffer) == 0 and not buffer.put(4)
+
+
+def test_producer_error_is_raised_once_drained():
+    buffer = PostBuffer()
+    buffer.put(1)
+    buffer.finish(IOError('API error'))
+    buffer.finish()
+
+    assert buffer.get() == 1
+
+    with pytest.raises(IOError):
+        buffer.get()
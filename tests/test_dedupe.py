@@ -0,0 +1,84 @@
+import hashlib
+import os
+
+import pytest
+
+from tumdlr import dedupe
+from tumdlr.database.store import ArchiveStore
+from tumdlr.dedupe import IN_PLACE, LINKED, MediaStore
+
+URL = 'http://64.media.tumblr.com/abc/tumblr_x_1280.jpg'
+
+
+@pytest.fixture
+def media(tmp_path):
+    return MediaStore(ArchiveStore(str(tmp_path / 'tumdlr.db')))
+
+
+@pytest.fixture
+def saved(media, tmp_path):
+    path = str(tmp_path / 'first.jpg')
+    with open(path, 'wb') as file:
+        file.write(b'image' * 100)
+
+    media.add(URL, path)
+    return path
+
+
+def test_file_already_in_place(media, saved):
+    assert media.link(URL, saved) == IN_PLACE
+
+
+def test_known_copy_is_linked(media, saved, tmp_path):
+    path = str(tmp_path / 'second.jpg')
+
+    # Served from another numbered media host, but it's the same file
+    assert media.link(URL.replace('64.', '66.'), path) == LINKED
+    assert os.path.samefile(saved, path)
+    assert media.link(URL, path) == IN_PLACE
+
+
+def test_unknown_media(media, tmp_path):
+    assert media.link('http://64.media.tumblr.com/other.jpg', str(tmp_path / 'other.jpg')) is None
+
+
+def test_changed_copy_is_not_linked(media, saved, tmp_path):
+    with open(saved, 'ab') as file:
+        file.write(b'appended by someone else')
+
+    path = str(tmp_path / 'second.jpg')
+
+    assert media.link(URL, path) is None
+    assert not os.path.exists(path)
+    assert media.link(URL, saved) is None
+
+
+def test_digest_from_the_download_is_used(media, saved, tmp_path, monkeypatch):
+    monkeypatch.setattr(dedupe, '_hash', lambda filename: pytest.fail('The file was read back to hash it'))
+
+    path = str(tmp_path / 'second.jpg')
+    with open(path, 'wb') as file:
+        file.write(b'image' * 100)
+
+    media.add('http://64.media.tumblr.com/def/tumblr_y_1280.jpg', path, hashlib.sha1(b'image' * 100).hexdigest())
+    assert os.path.samefile(saved, path)
+
+
+def test_duplicate_is_kept_when_linking_fails(media, saved, tmp_path, monkeypatch):
+    def fail(source, target):
+        open(target, 'wb').close()
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(dedupe, '_make_link', fail)
+
+    path = str(tmp_path / 'second.jpg')
+    with open(path, 'wb') as file:
+        file.write(b'image' * 100)
+
+    with pytest.raises(OSError):
+        media.add('http://64.media.tumblr.com/def/tumblr_y_1280.jpg', path)
+
+    with open(path, 'rb') as file:
+        assert file.read() == b'image' * 100
+
+    assert not os.path.exists(path + dedupe.LINK_EXT)
@@ -0,0 +1,154 @@
+import hashlib
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from tumdlr.downloader import PART_EXT, PART_INFO_EXT, download, record_partial
+from tumdlr.paths import PathPlanner
+from tumdlr.pool import DownloadPool
+
+
+def test_existing_file_is_replaced_not_appended_to(media_server, tmp_path, old_image, new_image):
+    # An earlier run saved a different, shorter image to the same path
+    filename = str(tmp_path / 'same.jpg')
+    with open(filename, 'wb') as file:
+        file.write(old_image)
+
+    download(media_server.serve('/new.jpg', new_image), filename)
+
+    with open(filename, 'rb') as file:
+        assert file.read() == new_image
+
+    assert not os.path.exists(filename + PART_EXT)
+    assert all('If-Range' not in headers for path, headers in media_server.requests)
+
+
+def test_complete_file_is_kept(media_server, tmp_path, new_image):
+    filename = str(tmp_path / 'same.jpg')
+    with open(filename, 'wb') as file:
+        file.write(new_image)
+
+    download(media_server.serve('/new.jpg', new_image), filename)
+
+    with open(filename, 'rb') as file:
+        assert file.read() == new_image
+
+    assert len(media_server.requests) == 1
+
+
+def test_partial_download_of_another_url_is_discarded(media_server, tmp_path, old_image, new_image):
+    filename = str(tmp_path / 'same.jpg')
+    partname = filename + PART_EXT
+
+    with open(partname, 'wb') as file:
+        file.write(old_image[:10000])
+    record_partial(partname, media_server.url('/old.jpg'), {'etag': '"old"'}, len(old_image))
+
+    download(media_server.serve('/new.jpg', new_image), filename)
+
+    with open(filename, 'rb') as file:
+        assert file.read() == new_image
+
+    assert not os.path.exists(partname + PART_INFO_EXT)
+    assert all('Range' not in headers for path, headers in media_server.requests)
+
+
+def test_partial_download_is_resumed_with_if_range(media_server, tmp_path, new_image):
+    url = media_server.serve('/new.jpg', new_image)
+    filename = str(tmp_path / 'same.jpg')
+    partname = filename + PART_EXT
+
+    with open(partname, 'wb') as file:
+        file.write(new_image[:20000])
+    record_partial(partname, url, {'etag': media_server.etag(new_image)}, len(new_image))
+
+    download(url, filename)
+
+    with open(filename, 'rb') as file:
+        assert file.read() == new_image
+
+    headers = media_server.requests[-1][1]
+    assert headers['Range'] == 'bytes=20000-'
+    assert headers['If-Range'] == media_server.etag(new_image)
+
+
+def test_partial_download_of_a_changed_file_starts_over(media_server, tmp_path, old_image, new_image):
+    filename = str(tmp_path / 'same.jpg')
+    partname = filename + PART_EXT
+
+    with open(partname, 'wb') as file:
+        file.write(old_image[:10000])
+
+    # Same URL, but the file changed on the server since the partial download was started
+    url = media_server.serve('/same.jpg', new_image)
+    record_partial(partname, url, {'etag': media_server.etag(old_image)}, len(old_image))
+
+    download(url, filename)
+
+    with open(filename, 'rb') as file:
+        assert file.read() == new_image
+
+
+def test_concurrent_downloads_to_the_same_path(media_server, tmp_path, photo_post, new_image):
+    # Reblogs of the same image with the same caption are planned to the same path
+    media_server.delay = 0.001
+    url = media_server.serve('/reblogged.jpg', new_image * 4)
+    posts = [photo_post(post_id, url) for post_id in range(1, 9)]
+
+    context = SimpleNamespace(planner=PathPlanner(str(tmp_path)), media=None)
+
+    with DownloadPool(jobs=4) as pool:
+        for post in posts:
+            pool.submit(post.files[0], context)
+
+        results = list(pool.join())
+
+    assert [error for file, path, error in results] == [None] * len(posts)
+    assert len({path for file, path, error in results}) == 1
+
+    with open(results[0][1], 'rb') as file:
+        assert file.read() == new_image * 4
+
+    assert sorted(os.listdir(os.path.dirname(results[0][1]))) == ['same.jpg']
+
+
+def test_saved_content_is_hashed(media_server, tmp_path, new_image):
+    url = media_server.serve('/new.jpg', new_image)
+    filename = str(tmp_path / 'same.jpg')
+    partname = filename + PART_EXT
+
+    # Fresh, resumed and already complete downloads
+    fresh = hashlib.sha1()
+    download(url, str(tmp_path / 'fresh.jpg'), digest=fresh)
+
+    with open(partname, 'wb') as file:
+        file.write(new_image[:20000])
+    record_partial(partname, url, {'etag': media_server.etag(new_image)}, len(new_image))
+
+    resumed = hashlib.sha1()
+    download(url, filename, digest=resumed)
+
+    complete = hashlib.sha1()
+    download(url, filename, digest=complete)
+
+    expected = hashlib.sha1(new_image).hexdigest()
+    assert [fresh.hexdigest(), resumed.hexdigest(), complete.hexdigest()] == [expected] * 3
+
+
+def test_truncated_download_is_not_kept(media_server, tmp_path, new_image):
+    url = media_server.serve('/new.jpg', new_image)
+    media_server.truncated['/new.jpg'] = 20000
+    filename = str(tmp_path / 'new.jpg')
+
+    # Either urllib3 or our own length check notices
+    with pytest.raises(Exception):
+        download(url, filename)
+
+    # Never taken for the whole file
+    assert not os.path.exists(filename)
+
+    download(url, filename)
+
+    with open(filename, 'rb') as file:
+        assert file.read() == new_image
@@ -0,0 +1,37 @@
+import pytest
+
+from tumdlr.filters import PostFilter, parse_date
+
+
+def matching(api_server, min_notes):
+    return [post['id'] for post in api_server.posts if post['note_count'] >= min_notes]
+
+
+@pytest.mark.parametrize('prefetch', [0, 2])
+def test_first_page_without_matching_posts(api_server, prefetch):
+    api_server.publish(10, notes=10)
+    api_server.publish(30, notes=0)
+
+    blog = api_server.blog(prefetch=prefetch, post_filter=PostFilter(min_notes=5))
+
+    assert [post.id for post in blog.posts()] == matching(api_server, 5)
+
+
+@pytest.mark.parametrize('prefetch', [0, 2])
+def test_every_other_post_matching(api_server, prefetch):
+    api_server.publish(100, notes=lambda post_id: 10 * (post_id % 2))
+
+    blog = api_server.blog(prefetch=prefetch, post_filter=PostFilter(min_notes=5))
+    ids = [post.id for post in blog.posts()]
+
+    assert ids == matching(api_server, 5)
+    assert len(ids) == 50
+
+
+def test_parse_date():
+    assert parse_date('2020-01-01') == 1577836800
+    assert parse_date('2020-01-01 00:01:00') == 1577836860
+    assert parse_date('1577836800') == 1577836800
+
+    with pytest.raises(ValueError):
+        parse_date('yesterday')
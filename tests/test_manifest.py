@@ -0,0 +1,85 @@
+import os
+from types import SimpleNamespace
+
+from tumdlr.commands.reorganize import _reorganize
+from tumdlr.manifest import Manifest
+from tumdlr.paths import PathPlanner
+
+
+def save(planner, file):
+    """
+    Write a file to its planned path, the way a download would
+    """
+    path = file.filepath(SimpleNamespace(planner=planner))
+    planner.makedirs(os.path.dirname(path))
+
+    with open(path, 'wb') as handle:
+        handle.write(file.url.as_string().encode('utf-8'))
+
+    return path
+
+
+def test_posts_are_written_once_their_files_are_reported(tmp_path, photo_post):
+    manifest = Manifest(str(tmp_path / 'blog.jsonl'), 'blog', 'http://blog.tumblr.com/')
+    first, second = photo_post(1, 'http://media.blog/1.jpg'), photo_post(2, 'http://media.blog/2.jpg')
+
+    with manifest:
+        manifest.post(first)
+        manifest.post(second)
+        manifest.file(second.files[0], '/saved/2.jpg')
+        manifest.file(first.files[0])
+
+    # In the order they were completed, not enumerated
+    records = Manifest(manifest.path).records()
+    assert [record['id'] for record in records] == [2, 1]
+    assert records[0]['files'] == [{'url': 'http://media.blog/2.jpg', 'path': '/saved/2.jpg', 'category': 'photos',
+                                    'page_no': False}]
+    assert records[1]['files'] == []
+
+
+def test_later_runs_are_merged_and_compacted(tmp_path, photo_post):
+    path = str(tmp_path / 'blog.jsonl')
+    post = photo_post(1, 'http://media.blog/1.jpg')
+
+    # A failed download followed by a successful one
+    for saved in (None, '/saved/1.jpg'):
+        with Manifest(path, 'blog') as manifest:
+            manifest.post(post)
+            manifest.file(post.files[0], saved)
+
+    manifest = Manifest(path)
+    assert [record['files'][0]['path'] for record in manifest.records()] == ['/saved/1.jpg']
+    assert manifest.blog == 'blog'
+
+    with open(path) as file:
+        assert len(file.readlines()) == 2
+
+
+def test_reorganize_moves_files_into_the_new_layout(tmp_path, photo_post):
+    save_path = str(tmp_path / 'save')
+    manifest = Manifest(str(tmp_path / 'blog.jsonl'), 'blog')
+    posts = [photo_post(1, 'http://media.blog/1.jpg', 'one'), photo_post(2, 'http://media.blog/2.jpg', 'two')]
+
+    old = PathPlanner(save_path, by_type=True)
+    with manifest:
+        for post in posts:
+            manifest.post(post)
+            manifest.file(post.files[0], save(old, post.files[0]))
+
+    # The second file has gone missing since
+    os.remove(os.path.join(save_path, 'blog', 'photos', 'two.jpg'))
+
+    relocated = []
+    ctx = SimpleNamespace(planner=PathPlanner(save_path, by_type=False),
+                          database=SimpleNamespace(relocate=lambda *paths: relocated.append(paths)))
+
+    assert _reorganize(ctx, manifest) == {'moved': 1, 'unchanged': 0, 'missing': 1, 'failed': 0}
+
+    new = os.path.join(save_path, 'blog', 'one.jpg')
+    assert relocated == [(os.path.join(save_path, 'blog', 'photos', 'one.jpg'), new)]
+    assert os.path.isfile(new) and not os.path.exists(os.path.join(save_path, 'blog', 'photos'))
+    assert manifest.records()[0]['files'][0]['path'] == new
+
+    # Running it again finds the file already in place
+    ctx.planner = PathPlanner(save_path, by_type=False)
+    assert _reorganize(ctx, manifest)['unchanged'] == 1
@@ -0,0 +1,80 @@
+import os
+from types import SimpleNamespace
+
+from tumdlr.paths import PathPlanner
+
+
+def test_claims_within_a_run(tmp_path):
+    planner = PathPlanner(str(tmp_path))
+    base = str(tmp_path / 'same')
+
+    assert planner.claim(base, '.jpg', 'http://a/1.jpg', 1) == base + '.jpg'
+    assert planner.claim(base, '.jpg', 'http://a/2.jpg', 2) == base + ' (2).jpg'
+    assert planner.claim(base, '.jpg', 'http://a/1.jpg', 3) == base + '.jpg'
+
+
+def test_paths_recorded_by_earlier_runs_keep_their_url(tmp_path):
+    base = str(tmp_path / 'same')
+    recorded = {base + '.jpg': 'http://a/1.jpg', base + ' (2).jpg': 'http://a/2.jpg'}
+    planner = PathPlanner(str(tmp_path), owner=recorded.get)
+
+    assert planner.claim(base, '.jpg', 'http://a/3.jpg', 3) == base + ' (3).jpg'
+    assert planner.claim(base, '.jpg', 'http://a/2.jpg', 2) == base + ' (2).jpg'
+    assert planner.claim(base, '.jpg', 'http://A/1.jpg', 1) == base + '.jpg'
+
+
+def test_unrecorded_files_on_disk_are_claimed_by_their_url(tmp_path, old_image):
+    # Saved by an older version, or by a run that was interrupted before it recorded the file
+    base = str(tmp_path / 'same')
+    with open(base + '.jpg', 'wb') as file:
+        file.write(old_image)
+
+    planner = PathPlanner(str(tmp_path), owner=lambda path: None)
+    assert planner.claim(base, '.jpg', 'http://a/1.jpg', 1) == base + '.jpg'
+    assert planner.claim(base, '.jpg', 'http://a/2.jpg', 2) == base + ' (2).jpg'
+
+
+def test_unrecorded_complete_file_is_kept(media_server, tmp_path, photo_post, new_image):
+    url = media_server.serve('/new.jpg', new_image)
+    post = photo_post(1, url)
+
+    context = SimpleNamespace(planner=PathPlanner(str(tmp_path), owner=lambda path: None), media=None)
+    path = context.planner.photo_path('blog', 1, 'same', url)
+    context.planner.makedirs(os.path.dirname(path))
+
+    with open(path, 'wb') as file:
+        file.write(new_image)
+
+    context.planner = PathPlanner(str(tmp_path), owner=lambda path: None)
+
+    assert post.files[0].download(context) == path
+    assert os.listdir(os.path.dirname(path)) == ['same.jpg']
+    assert all('Range' in headers for __, headers in media_server.requests)
+
+
+def test_new_post_with_the_same_caption_in_a_later_run(media_server, tmp_path, photo_post, old_image,
+                                                      new_image):
+    recorded = {}
+
+    def run(post):
+        context = SimpleNamespace(planner=PathPlanner(str(tmp_path), owner=recorded.get), media=None)
+        path = post.files[0].download(context)
+        recorded[path] = post.files[0].url.as_string()
+
+        return path
+
+    first = run(photo_post(1, media_server.serve('/old.jpg', old_image)))
+    second = run(photo_post(2, media_server.serve('/new.jpg', new_image)))
+
+    assert first != second
+
+    with open(first, 'rb') as file:
+        assert file.read() == old_image
+
+    with open(second, 'rb') as file:
+        assert file.read() == new_image
+
+    # Both keep their paths on the next run
+    assert run(photo_post(1, media_server.url('/old.jpg'))) == first
+    assert run(photo_post(2, media_server.url('/new.jpg'))) == second
+    assert sorted(os.listdir(os.path.dirname(first))) == ['same (2).jpg', 'same.jpg']
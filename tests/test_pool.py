@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+
+from tumdlr.pool import DownloadPool
+
+
+class File:
+    """
+    Stand-in for a TumblrFile, noting how many downloads run at once overall and per host
+    """
+    lock    = threading.Lock()
+    active  = Counter()
+    peak    = Counter()
+
+    def __init__(self, host, duration=0.05):
+        self.url = SimpleNamespace(host=host)
+        self.duration = duration
+
+    def download(self, context, **kwargs):
+        with self.lock:
+            for key in (None, self.url.host):
+                self.active[key] += 1
+                self.peak[key] = max(self.peak[key], self.active[key])
+
+        time.sleep(self.duration)
+
+        with self.lock:
+            for key in (None, self.url.host):
+                self.active[key] -= 1
+
+        return self.url.host
+
+
+class Video(File):
+    """
+    Stand-in for a TumblrVideo, only served from its real host once resolved
+    """
+    def __init__(self, host, resolved):
+        super().__init__(host)
+        self.resolved = resolved
+
+    def resolve(self):
+        self.url = SimpleNamespace(host=self.resolved)
+
+
+class BrokenVideo(File):
+    def resolve(self):
+        raise IOError('Extraction failed')
+
+
+def setup_function():
+    File.active.clear()
+    File.peak.clear()
+
+
+def test_results_are_in_submission_order():
+    files = [File('a', duration) for duration in (0.1, 0.05, 0)] + [File('b', 0)]
+
+    with DownloadPool(jobs=4) as pool:
+        for file in files:
+            pool.submit(file, None)
+
+        results = list(pool.join())
+
+    assert [file for file, path, error in results] == files
+    assert [path for file, path, error in results] == ['a', 'a', 'a', 'b']
+
+
+def test_downloads_stay_within_the_job_and_host_limits():
+    files = [File(host) for host in 'aaaaabbbbbcccc']
+
+    with DownloadPool(jobs=3, per_host=2) as pool:
+        for file in files:
+            pool.submit(file, None)
+
+        results = list(pool.join())
+
+    assert [error for file, path, error in results] == [None] * len(files)
+    assert File.peak[None] <= 3
+    assert max(File.peak[host] for host in 'abc') <= 2
+
+
+def test_a_file_waiting_for_its_host_does_not_hold_a_worker():
+    with DownloadPool(jobs=2, per_host=1) as pool:
+        pool.submit(File('a', 0.2), None)
+
+        submitting = threading.Thread(target=pool.submit, args=(File('a'), None))
+        submitting.start()
+        time.sleep(0.1)
+
+        # The second file is still waiting for host a, the other worker stays available
+        assert submitting.is_alive()
+        assert pool._slots.acquire(blocking=False)
+        pool._slots.release()
+
+        submitting.join()
+        list(pool.join())
+
+
+def test_videos_take_the_slot_of_the_host_they_resolve_to():
+    videos = [Video('www.tumblr.com', 'vt.tumblr.com'), Video('vimeo.com', 'vt.tumblr.com')]
+
+    with DownloadPool(jobs=2, per_host=1) as pool:
+        for video in videos:
+            pool.submit(video, None)
+
+        results = list(pool.join())
+
+    assert [path for file, path, error in results] == ['vt.tumblr.com'] * 2
+    assert File.peak['vt.tumblr.com'] == 1
+
+
+def test_failed_video_extraction_is_reported_as_a_result():
+    with DownloadPool(jobs=2) as pool:
+        pool.submit(BrokenVideo('www.tumblr.com'), None)
+        pool.submit(File('a'), None)
+
+        results = list(pool.join())
+
+    assert isinstance(results[0][2], IOError)
+    assert results[1][1:] == ('a', None)
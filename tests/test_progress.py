@@ -0,0 +1,58 @@
+import io
+import json
+from types import SimpleNamespace
+
+from tumdlr.progress import FAILED, POST, SAVED, SKIPPED, JsonRenderer, Progress
+
+
+class Recorder:
+    interval = None
+
+    def __init__(self):
+        self.events = []
+        self.closed = None
+
+    def event(self, kind, key, data, progress):
+        self.events.append((kind, key))
+
+    def refresh(self, progress):
+        pass
+
+    def close(self, progress):
+        self.closed = progress.summary()
+
+
+def test_events_are_counted_and_rendered_in_order():
+    renderer = Recorder()
+
+    with Progress(renderer) as progress:
+        progress.post(SimpleNamespace(id=1, type='photo'), total=3)
+        progress.start('http://a', '/a.jpg', size=10)
+        progress.advance('http://a', 4)
+        progress.advance('http://a', 6)
+        progress.done('http://a', '/a.jpg')
+        progress.skip('http://b', '/b.jpg', 'duplicate')
+        progress.start('http://c', '/c.jpg')
+        progress.fail('http://c', IOError('Connection reset'))
+
+    assert renderer.events == [(POST, 1), ('start', 'http://a'), (SAVED, 'http://a'), (SKIPPED, 'http://b'),
+                               ('start', 'http://c'), (FAILED, 'http://c')]
+    assert dict(renderer.closed, seconds=0) == {'posts': 1, 'saved': 1, 'skipped': 1, 'failed': 1, 'active': 0,
+                                                'bytes': 10, 'seconds': 0}
+    assert progress.total_posts == 3
+
+
+def test_json_output_has_a_line_per_event_and_a_summary():
+    renderer = JsonRenderer()
+    renderer.stream = io.StringIO()
+
+    with Progress(renderer) as progress:
+        progress.post(SimpleNamespace(id=1, type='photo'))
+        progress.done('http://a', '/a.jpg')
+        progress.message('Done', blog='blog')
+
+    records = [json.loads(line) for line in renderer.stream.getvalue().splitlines()]
+
+    assert [record['event'] for record in records] == ['post', 'saved', 'message', 'summary']
+    assert records[0]['id'] == 1 and records[1]['path'] == '/a.jpg' and records[2]['blog'] == 'blog'
+    assert records[3]['saved'] == 1
@@ -0,0 +1,37 @@
+import configparser
+import os
+
+from tumdlr import DATA_DIR
+from tumdlr.session import build_session
+
+
+def session(**throttling):
+    config = configparser.ConfigParser()
+    config.read_dict({'Throttling': dict({'MaxRetries': '3'}, **throttling), 'Connection': {'Retries': '3'}})
+
+    return build_session(config)
+
+
+def test_rate_limits_are_left_to_the_throttle(media_server, new_image):
+    url = media_server.serve('/limited.jpg', new_image)
+    media_server.errors['/limited.jpg'] = [(429, {'Retry-After': '0'}), (503, {'Retry-After': '0'})]
+
+    http = session()
+    failures = []
+    failure = http.throttle.failure
+    http.throttle.failure = lambda retry_after=None: failures.append(retry_after) or failure(retry_after)
+
+    response = http.get(url)
+
+    assert response.status_code == 200
+    assert response.content == new_image
+    assert failures == [0.0, 0.0]
+    assert http.throttle.limit < http.throttle.max_concurrency
+
+
+def test_no_pause_by_default():
+    config = configparser.ConfigParser()
+    config.read(os.path.join(DATA_DIR, 'config', 'tumdlr.cfg'))
+
+    assert build_session(config).throttle.pause is None
+    assert session(Pause='True', PauseMin='100', PauseMax='500').throttle.pause == (0.1, 0.5)
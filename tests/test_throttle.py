@@ -0,0 +1,52 @@
+import asyncio
+import threading
+import time
+
+from tumdlr.throttle import Throttle, ThrottledSession
+
+
+def test_streamed_download_holds_its_slot_until_closed(media_server, new_image):
+    url = media_server.serve('/new.jpg', new_image)
+    session = ThrottledSession(Throttle(max_concurrency=1))
+
+    first = session.get(url, stream=True)
+    assert session.throttle.in_flight == 1
+
+    second = []
+    waiting = threading.Thread(target=lambda: second.append(session.get(url)))
+    waiting.start()
+
+    # The body of the first download hasn't been read yet, so the second request has to wait for it
+    waiting.join(0.2)
+    assert waiting.is_alive()
+
+    assert first.content == new_image
+    waiting.join(5)
+
+    assert second[0].content == new_image
+    assert session.throttle.in_flight == 0
+
+
+def test_closing_an_unread_response_frees_its_slot(media_server, new_image):
+    url = media_server.serve('/new.jpg', new_image)
+    session = ThrottledSession(Throttle(max_concurrency=1))
+
+    with session.get(url, stream=True):
+        assert session.throttle.in_flight == 1
+
+    assert session.throttle.in_flight == 0
+
+
+def test_tasks_are_woken_by_slots_freed_in_other_threads():
+    throttle = Throttle(max_concurrency=1)
+    throttle.acquire()
+
+    async def main():
+        started = time.monotonic()
+        threading.Timer(0.1, throttle.release).start()
+
+        async with throttle.async_slot():
+            return time.monotonic() - started
+
+    assert 0.1 <= asyncio.run(main()) < 1
+    assert throttle.in_flight == 0
@@ -24,4 +24,6 @@ SITE_CONFIG_DIR = appdirs.site_config_dir('tumdlr')
 USER_DATA_DIR   = appdirs.user_data_dir('tumdlr')
 SITE_DATA_DIR   = appdirs.site_config_dir('tumdlr')
 
+USER_CACHE_DIR  = appdirs.user_cache_dir('tumdlr')
+
 USER_LOG_DIR    = appdirs.user_log_dir('tumdlr')
@@ -1,18 +1,32 @@
+import importlib
 import logging
 import os
-import pkgutil
 from subprocess import call
 
 import click
 
+from tumdlr import USER_DATA_DIR, metrics
 from tumdlr.config import load_config, write_user_config
+from tumdlr.dedupe import MediaStore
 
 CONTEXT_SETTINGS = dict(auto_envvar_prefix='TUMDLR', max_content_width=100)
 
+# Command name => module providing it. Adding a command means adding its module here
+COMMANDS = {
+    'download':         'tumdlr.commands.download',
+    'download-batch':   'tumdlr.commands.download_batch',
+    'reorganize':       'tumdlr.commands.reorganize',
+    'setup':            'tumdlr.commands.setup',
+}
+
 
 class Context(object):
     """
     CLI Context
+
+    The archive database, path planner, API response cache and HTTP session are built on first use, and the modules
+    behind them (which pull in SQLAlchemy and requests) are only imported then, so commands that never touch them
+    start quickly.
     """
     def __init__(self):
         self.cookiejar      = None
@@ -20,7 +34,91 @@ class Context(object):
         self.config_path    = None
         self.log            = None
         self.cache          = True
-        self.database       = NotImplemented
+        self.output         = 'auto'
+        self._api_cache     = False
+        self._database      = None
+        self._media         = False
+        self._planner       = None
+        self._session       = None
+
+    @property
+    def api_cache(self):
+        """
+        On-disk API response cache, or None if caching is disabled
+
+        Returns:
+            tumdlr.cache.ResponseCache|None
+        """
+        if self._api_cache is False:
+            from tumdlr.cache import ResponseCache
+
+            self._api_cache = ResponseCache.from_config(self.config) if self.cache else None
+
+        return self._api_cache
+
+    @property
+    def database(self):
+        """
+        Archive state store, opened on first use
+
+        Returns:
+            tumdlr.database.store.ArchiveStore
+        """
+        if self._database is None:
+            from tumdlr.database.store import ArchiveStore
+
+            path = self.config['Tumdlr'].get('Database') or os.path.join(USER_DATA_DIR, 'tumdlr.db')
+            self._database = ArchiveStore(os.path.expanduser(path))
+
+        return self._database
+
+    @property
+    def media(self):
+        """
+        Media deduplication store, or None if deduplication is disabled in the configuration
+
+        Returns:
+            MediaStore|None
+        """
+        if self._media is False:
+            enabled = self.config['Tumdlr'].getboolean('Deduplicate', True)
+            self._media = MediaStore(self.database) if enabled else None
+
+        return self._media
+
+    @property
+    def planner(self):
+        """
+        Output path planner for this run, built from the configuration on first use
+
+        Returns:
+            tumdlr.paths.PathPlanner
+        """
+        if self._planner is None:
+            from tumdlr.paths import PathPlanner
+
+            self._planner = PathPlanner.from_config(self.config, owner=lambda path: self.database.file_owner(path))
+
+        return self._planner
+
+    @property
+    def session(self):
+        """
+        Shared HTTP session, built from the configuration on first use
+
+        Returns:
+            requests.Session
+        """
+        if self._session is None:
+            from tumdlr.session import build_session
+
+            self._session = build_session(self.config)
+
+        return self._session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
 
 
 class CommandLine(click.MultiCommand):
@@ -35,24 +133,20 @@ class CommandLine(click.MultiCommand):
         Returns:
             list
         """
-        commands_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'commands')
-        command_list = [name for __, name, ispkg in pkgutil.iter_modules([commands_path]) if not ispkg]
-        command_list.sort()
-        return command_list
+        return sorted(COMMANDS)
 
     def get_command(self, ctx, name):
         """
-        Fetch a command module
+        Fetch a command, importing its module only when the command is actually used
 
         Args:
             ctx:        Context
             name(str):  Command name
         """
-        try:
-            mod = pkgutil.importlib.import_module('tumdlr.commands.{name}'.format(name=name))
-            return mod.cli
-        except (ImportError, AttributeError):
-            raise
+        if name not in COMMANDS:
+            return None
+
+        return importlib.import_module(COMMANDS[name]).cli
 
 
 pass_context = click.make_pass_decorator(Context, ensure=True)
@@ -65,11 +159,35 @@ pass_context = click.make_pass_decorator(Context, ensure=True)
               help='Path to the TumDLR configuration file (currently does nothing)')
 @click.option('-q', '--quiet', help='Silence all output except for fatal errors', is_flag=True)
 @click.option('-d', '--debug', help='Output information used for debugging', is_flag=True)
+@click.option('--output', help='Progress output: on the terminal, as JSON lines for unattended runs, or none at all',
+              type=click.Choice(['auto', 'json', 'quiet']), default='auto')
+@click.option('--cache/--no-cache', help='Reuse cached API responses instead of fetching every page again',
+              default=None)
+@click.option('--stats', help='Print where the time went at the end of the run', is_flag=True)
+@click.option('--metrics', 'metrics_path', type=click.Path(dir_okay=False, writable=True), metavar='FILE',
+              help='Write the run metrics to FILE, as JSON if it ends in .json and in the Prometheus text format '
+                   'otherwise')
+@click.option('--profile', type=click.Path(dir_okay=False, writable=True), metavar='FILE',
+              help='Profile the run with cProfile and write the stats of all threads to FILE')
 @pass_context
-def cli(ctx, config, quiet, debug):
+def cli(ctx, config, quiet, debug, output, cache, stats, metrics_path, profile):
     """
     Tumblr Downloader CLI utility
     """
+    ctx.output = 'quiet' if quiet else output
+    ctx.cache = ctx.config['Cache'].getboolean('Enabled', False) if cache is None else cache
+
+    # Metrics are always collected, they're only reported when asked for
+    metrics.REGISTRY.reset()
+
+    profiler = None
+    if profile:
+        profiler = metrics.Profiler()
+        profiler.start()
+
+    if stats or metrics_path or profiler:
+        click.get_current_context().call_on_close(lambda: report_run(stats, metrics_path, profiler, profile))
+
     # Logging setup
     if debug:
         log_level = logging.DEBUG
@@ -89,6 +207,28 @@ def cli(ctx, config, quiet, debug):
         first_run(ctx)
 
 
+def report_run(stats=False, metrics_path=None, profiler=None, profile_path=None):
+    """
+    Report the metrics and profile of the run once the command has finished
+
+    Args:
+        stats(bool): Print a summary of the metrics
+        metrics_path(Optional[str]): File to export the metrics to
+        profiler(Optional[tumdlr.metrics.Profiler]): Profiler started for the run
+        profile_path(Optional[str]): File to write the profile to
+    """
+    if profiler:
+        profiler.stop(profile_path)
+        click.echo('Profile written to {}'.format(profile_path), err=True)
+
+    if metrics_path:
+        metrics.REGISTRY.write(metrics_path)
+
+    if stats:
+        for line in metrics.REGISTRY.summary():
+            click.echo(line, err=True)
+
+
 def first_run(ctx):
     """
     Run the setup and other tasks for first-time use
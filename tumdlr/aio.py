@@ -0,0 +1,410 @@
+import asyncio
+import hashlib
+import os
+import time
+import urllib
+import weakref
+from collections import deque
+
+from tumdlr import __version__, metrics
+from tumdlr.api import PAGE_SIZE, TumblrBlog, json_loads
+from tumdlr.buffer import PostBuffer
+from tumdlr.containers import TumblrVideo
+from tumdlr.dedupe import LINKED
+from tumdlr.downloader import CHUNK_SIZE, PART_EXT, check_length, finish_partial, hash_file, is_complete_copy, \
+    record_partial, remove_partial, resume_matches, resume_point, total_length
+from tumdlr.throttle import RETRY_STATUSES, Throttle, parse_retry_after, release_on_close
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class AsyncTumblrBlog(TumblrBlog):
+    """
+    asyncio counterpart of TumblrBlog, built on aiohttp
+
+    Nothing is fetched in the constructor. The blog is loaded with `await blog.load()`, or by using it as an async
+    context manager, after which posts are iterated with `async for` and files downloaded with
+    `await blog.download()`. The same post and file containers are used as with TumblrBlog, so a single event loop
+    can archive many blogs at once without a thread per blog::
+
+        async with AsyncTumblrBlog(url) as blog:
+            async for post in blog.posts():
+                for file in post.files:
+                    await blog.download(file, context)
+    """
+    def __init__(self, url, session=None, **kwargs):
+        """
+        Args:
+            url(URL|str): Tumblr profile URL
+            session(Optional[aiohttp.ClientSession]): An optional shared aiohttp session
+
+        Keyword Args:
+            semaphore(asyncio.Semaphore): Limits concurrent requests. Share one between blogs for a global cap
+            throttle(tumdlr.throttle.Throttle): Rate limiter and retry policy. Share one between blogs (and with the
+                threaded downloader, e.g. `context.session.throttle`) so they all back off together
+            (See TumblrBlog for the remaining keyword arguments)
+        """
+        if aiohttp is None:
+            raise ImportError('AsyncTumblrBlog requires aiohttp, install it with: pip install tumdlr[async]')
+
+        self._owns_session = session is None
+        self._semaphore = kwargs.get('semaphore') or asyncio.Semaphore(max(kwargs.get('workers', 1), 4))
+        self.throttle = kwargs.get('throttle') or Throttle(max_concurrency=max(kwargs.get('workers', 1), 4))
+
+        super().__init__(url, session, **kwargs)
+
+    def _create_session(self):
+        # aiohttp sessions have to be created inside the event loop, see load()
+        return None
+
+    def _load(self):
+        pass
+
+    async def load(self):
+        """
+        Fetch the blog information along with the first page of posts
+
+        Returns:
+            AsyncTumblrBlog
+        """
+        if self.session is None:
+            self.session = aiohttp.ClientSession(headers={'User-Agent': self._uagent.format(version=__version__)})
+
+        await self._load_first_page()
+        return self
+
+    async def close(self):
+        """
+        Close the aiohttp session, unless it was provided by the caller
+        """
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+
+    async def __aenter__(self):
+        return await self.load()
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def _load_first_page(self):
+        self._posts = PostBuffer()
+        self.offset = 0
+
+        __, posts = await self._api_fetch_page(0)
+        self._posts.extend(posts)
+        self._next_offset = PAGE_SIZE
+
+    async def _api_fetch_page(self, offset):
+        """
+        Fetch and parse a single API page
+
+        Args:
+            offset(int): Post offset of the page
+
+        Returns:
+            tuple[int, list[TumblrPost]]: The number of posts the API returned and the successfully parsed posts
+        """
+        key = self._api_cache_key(offset=offset)
+        cached, fresh = self._api_cache_lookup(key, offset)
+
+        if fresh:
+            metrics.count('api_cache_hits')
+            content = cached.content
+        else:
+            async with self._semaphore:
+                with metrics.timer('api_request'):
+                    async with await get(self.session, self._api_endpoint(offset=offset), self.throttle,
+                                         headers=self._api_headers(cached)) as response:
+                        response.raise_for_status()
+                        content = await response.read()
+
+                metrics.count('api_pages')
+
+                if self.cache is not None:
+                    content = self._api_cache_store(key, cached, offset, response.status, response.headers, content)
+
+        with metrics.timer('api_decode'):
+            data = json_loads(content)['response']
+
+        return len(data['posts']), self._api_parse_response(data, offset)
+
+    async def posts(self, since=None):
+        """
+        Args:
+            since(Optional[int]): Stop paging at the first post published at or before this timestamp
+
+        Yields:
+            TumblrPost
+        """
+        for index, post_type in enumerate(self.post_types or [None]):
+            if index:
+                self._post_type = post_type
+                await self._load_first_page()
+
+            stream = self._prefetched_posts()
+
+            async for post in stream:
+                if self._past_range(post, since):
+                    await stream.aclose()
+                    break
+
+                yield post
+
+    async def _prefetched_posts(self):
+        """
+        Keeps up to max(prefetch, workers) upcoming pages in flight while the current page is consumed. Posts are
+        yielded in offset order and de-duplicated by ID, and the offset points at the page of the current post, like
+        TumblrBlog._prefetched_posts()
+
+        Yields:
+            TumblrPost
+        """
+        offset = self._next_offset
+        window = max(self.prefetch, self.workers, 1)
+        pages = deque()
+        seen = set()
+
+        try:
+            while True:
+                while len(pages) < window and offset < self.total_posts:
+                    pages.append((offset, asyncio.ensure_future(self._api_fetch_page(offset))))
+                    offset += PAGE_SIZE
+
+                while self._posts:
+                    post = self._posts.popleft()
+
+                    if post.id in seen:
+                        continue
+
+                    seen.add(post.id)
+                    yield post
+
+                if not pages:
+                    break
+
+                page_offset, page = pages.popleft()
+                count, posts = await page
+                if not count:
+                    break
+
+                self.offset = page_offset
+                self._posts.extend(posts)
+        finally:
+            for __, page in pages:
+                page.cancel()
+
+    async def download(self, file, context, **kwargs):
+        """
+        Download a file belonging to one of this blog's posts
+
+        Args:
+            file(tumdlr.containers.TumblrFile): File to download
+            context(tumdlr.__main__.Context): CLI request context
+            kwargs(dict): Additional arguments for download()
+
+        Returns:
+            str: Path to the saved file
+        """
+        # Video extraction runs on the extractor worker pool, don't block the event loop on it
+        if isinstance(file, TumblrVideo):
+            file.resolve(await asyncio.wrap_future(file.container.extract()))
+
+        # Planning the path may look up the archive database, and like everything else touching the disk it's done in
+        # the default executor so that other blogs sharing the event loop keep going meanwhile
+        filename = await _in_thread(file.filepath, context)
+        await _in_thread(context.planner.makedirs, os.path.dirname(filename))
+
+        media = getattr(context, 'media', None)  # type: tumdlr.dedupe.MediaStore
+        kwargs.setdefault('headers', {'Referer': urllib.parse.quote(str(file.container))})
+        kwargs.setdefault('throttle', self.throttle)
+
+        # Reblogs of the same media are planned to the same path, only one task may save to it at a time
+        writer = _writers.get(filename)
+        if writer is None:
+            writer = _writers[filename] = asyncio.Lock()
+
+        async with writer:
+            linked = await _in_thread(media.link, file.url, filename) if media else None
+            if linked:
+                metrics.count('downloads_linked' if linked == LINKED else 'downloads_skipped')
+                return filename
+
+            digest = hashlib.sha1() if media else None
+
+            async with self._semaphore:
+                await download(self.session, file.url.as_string(), filename, create_dirs=False, digest=digest,
+                               **kwargs)
+
+            if media:
+                await _in_thread(media.add, file.url, filename, digest.hexdigest())
+
+        return filename
+
+
+async def download(session, url, filename, headers=None, chunk_size=CHUNK_SIZE, create_dirs=True, throttle=None,
+                   digest=None):
+    """
+    Download a file without blocking the event loop on the network or the disk. Complete files are skipped and
+    partial downloads are resumed with an If-Range request, the same as tumdlr.downloader.download()
+
+    Args:
+        session(aiohttp.ClientSession): aiohttp session
+        url(str): Download URL
+        filename(str): Path to save the file to
+        headers(Optional[dict]): Additional request headers
+        chunk_size(int): Read size in bytes
+        create_dirs(bool): Create the parent directory of the file
+        throttle(Optional[tumdlr.throttle.Throttle]): Rate limiter and retry policy for the requests
+        digest(Optional[hashlib.Hash]): Hash to update with the content of the saved file
+
+    Returns:
+        str: Path to the saved file
+    """
+    started = time.perf_counter()
+
+    if create_dirs:
+        await _in_thread(os.makedirs, os.path.dirname(filename), 0o755, True)
+
+    # Is the file we already have complete?
+    if os.path.isfile(filename):
+        size = os.path.getsize(filename)
+        request_headers = dict(headers or {}, Range='bytes={size}-'.format(size=size))
+
+        async with await get(session, url, throttle, headers=request_headers) as response:
+            if is_complete_copy(response.status, total_length(response.status, response.headers), size):
+                if digest is not None:
+                    await _in_thread(hash_file, digest, filename)
+
+                metrics.count('downloads_skipped')
+                return filename
+
+    partname = filename + PART_EXT
+    offset, validator = await _in_thread(resume_point, partname, url)
+
+    request_headers = dict(headers or {})
+    if offset:
+        request_headers['Range'] = 'bytes={offset}-'.format(offset=offset)
+        request_headers['If-Range'] = validator
+
+    async with await get(session, url, throttle, headers=request_headers) as response:
+        length = total_length(response.status, response.headers)
+        resumed = offset if response.status in (206, 416) else 0
+
+        if resumed and not await _in_thread(resume_matches, partname, response.status, length):
+            response.release()
+            await _in_thread(remove_partial, partname)
+            return await download(session, url, filename, headers, chunk_size, False, throttle, digest)
+
+        if resumed and digest is not None:
+            await _in_thread(hash_file, digest, partname)
+
+        # Nothing left to fetch, the partial download was in fact complete
+        if resumed and response.status == 416:
+            await _in_thread(finish_partial, partname, filename)
+            metrics.count('downloads_skipped')
+            return filename
+
+        response.raise_for_status()
+
+        if not resumed:
+            await _in_thread(record_partial, partname, url, response.headers, length)
+
+        file = await _in_thread(open, partname, 'ab' if resumed else 'wb')
+
+        try:
+            async for chunk in response.content.iter_chunked(chunk_size):
+                await _in_thread(_write, file, chunk, digest)
+
+            written = file.tell() - resumed
+        finally:
+            await _in_thread(file.close)
+
+    check_length(url, length, resumed + written)
+    await _in_thread(finish_partial, partname, filename)
+
+    metrics.observe('download', time.perf_counter() - started)
+    metrics.count('downloads_saved')
+    metrics.count('download_bytes', written)
+
+    return filename
+
+
+def _write(file, chunk, digest=None):
+    """
+    Write a downloaded chunk, hashing it along the way
+    """
+    file.write(chunk)
+
+    if digest is not None:
+        digest.update(chunk)
+
+
+def _in_thread(function, *args):
+    """
+    Run blocking file system or database work in the event loop's default executor
+
+    Returns:
+        asyncio.Future: Resolves to the result of the function
+    """
+    return asyncio.get_event_loop().run_in_executor(None, function, *args)
+
+
+async def get(session, url, throttle=None, **kwargs):
+    """
+    Send a GET request through a throttle, retrying rate limited and failed requests the same way
+    tumdlr.throttle.ThrottledSession does
+
+    Args:
+        session(aiohttp.ClientSession): aiohttp session
+        url(str): Request URL
+        throttle(Optional[tumdlr.throttle.Throttle]): Rate limiter and retry policy, the request is sent as is if
+            not given
+        kwargs(dict): Additional arguments for session.get()
+
+    Returns:
+        aiohttp.ClientResponse: To be used as an async context manager
+    """
+    if throttle is None:
+        return await session.get(url, **kwargs)
+
+    attempt = 0
+
+    while True:
+        await throttle.acquire_async()
+
+        try:
+            response = await session.get(url, **kwargs)
+        except BaseException as e:
+            throttle.release()
+
+            if isinstance(e, aiohttp.ClientError):
+                throttle.failure()
+
+            raise
+
+        # The body is read after we return, hold the slot until the response is released
+        release_on_close(response, throttle.release, 'release', 'close')
+
+        if response.status not in RETRY_STATUSES:
+            throttle.success()
+            return response
+
+        retry_after = parse_retry_after(response.headers.get('retry-after'))
+        throttle.failure(retry_after)
+
+        if attempt >= throttle.retries:
+            return response
+
+        delay = throttle.delay(attempt, retry_after)
+        throttle.log.warning('%s returned %d, retrying in %.1f seconds', url, response.status, delay)
+
+        response.release()
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+# Path => lock held by the task saving a file to it
+_writers = weakref.WeakValueDictionary()
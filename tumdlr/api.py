@@ -1,12 +1,28 @@
+import threading
 import urllib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from requests import Session
 from yurl import URL
 
-from tumdlr import __version__
+from tumdlr import __version__, metrics
+from tumdlr.buffer import PostBuffer
 from tumdlr.containers import TumblrPost, TumblrPhotoSet, TumblrVideoPost
 from tumdlr.errors import TumdlrParserError
 
+# Use a faster JSON decoder when one is installed
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    try:
+        from ujson import loads as json_loads
+    except ImportError:
+        from json import loads as json_loads
+
+# Number of posts returned per API page (the maximum the API allows)
+PAGE_SIZE = 20
+
 
 class TumblrBlog:
 
@@ -21,21 +37,28 @@ class TumblrBlog:
         Keyword Args:
             api_key(str): Tumblr API key
             uagent(str): Custom User-Agent header
+            prefetch(int): Number of API pages to fetch in the background ahead of the post being consumed. This also
+                bounds how many pages are held in memory at once. 0 disables read-ahead
+            workers(int): Number of API pages to fetch in parallel. Since the post count is known after the first
+                request, the remaining offset range is split into page sized shards and fetched by a bounded pool
+            post_types(Iterable[str]): Only fetch posts of these API post types (e.g. photo, link, video). The API
+                filters on a single type per query, so each type is paged through separately
+            keep_raw(bool): Keep the raw API data on the post and file containers after parsing. Archiving runs turn
+                this off so that long enumerations only hold on to the fields that are actually used
+            cache(tumdlr.cache.ResponseCache): Cache API responses on disk. Nothing is cached if not given
+            post_filter(tumdlr.filters.PostFilter): Only yield the posts this filter accepts
         """
         self._url = url if isinstance(url, URL) else URL(url)
         self._api_url = URL(scheme='https', host='api.tumblr.com', path='/v2/')
-        self._api_response = None  # type: Response
         self._api_key = kwargs.get('api_key', 'fuiKNFp9vQFvjLNvx4sUwti4Yb5yGutBN4Xh10LXZhhRKjWlV4')
         self._uagent = kwargs.get('user_agent', 'tumdlr/{version}')
 
         if not session:
-            session = Session()
-            session.headers.update({
-                'Referer': urllib.parse.quote(self._url.as_string()),
-                'User-Agent': self._uagent.format(version=__version__)
-            })
+            session = self._create_session()
 
+        # The session may be shared with other blogs and downloads, so the Referer is sent per request
         self.session = session
+        self._headers = {'Referer': urllib.parse.quote(self._url.as_string())}
 
         self.title          = None  # type: str
         self.url            = None  # type: URL
@@ -44,24 +67,150 @@ class TumblrBlog:
         self.is_nsfw        = None  # type: bool
         self.likes          = None  # type: int|False
         self.post_count     = None  # type: int
+        self.total_posts    = None  # type: int
         self.updated        = None  # type: int
 
-        self._posts = []
-        self.offset = 0
+        post_types = kwargs.get('post_types')
+        self.post_types = tuple(post_types) if post_types is not None else None
+        self._post_type = self.post_types[0] if self.post_types else None
+
+        self.keep_raw = bool(kwargs.get('keep_raw', True))
+        self.cache = kwargs.get('cache')  # type: tumdlr.cache.ResponseCache
+        self._cache_current = False
+        self.post_filter = kwargs.get('post_filter') or None  # type: tumdlr.filters.PostFilter
+
+        self._posts = PostBuffer()
+        self.offset = 0  # Post offset of the API page the posts being yielded were fetched from
+        self.prefetch = max(0, int(kwargs.get('prefetch', 0)))
+        self.workers = max(1, int(kwargs.get('workers', 1)))
+        self._next_offset = 0
 
         self._api_url = self._api_url.replace(
             path=self._api_url.path + 'blog/{host}/posts'.format(host=self._url.host)
         )
+        self._load()
+
+    def _create_session(self):
+        """
+        Create a session for a blog that wasn't given one
+
+        Returns:
+            Session
+        """
+        session = Session()
+        session.headers.update({
+            'User-Agent': self._uagent.format(version=__version__)
+        })
+
+        return session
+
+    def _load(self):
+        """
+        Fetch the blog information along with the first page of posts
+        """
         self._api_get()
 
-    def _api_get(self, query=None, parse=True):
+    def _api_get(self, query=None, parse=True, offset=None):
         """
         Execute an API query
 
         Args:
             query(Optional[dict]): Extra query parameters
             parse(Optional[bool]): Parse the API response immediately
+            offset(Optional[int]): Post offset to query from. Defaults to the current offset
+
+        Returns:
+            dict: The decoded `response` object of the API response
+        """
+        offset = self.offset if offset is None else offset
+        endpoint = self._api_endpoint(query, offset)
+        key = self._api_cache_key(query, offset)
+        cached, fresh = self._api_cache_lookup(key, offset)
+
+        if fresh:
+            metrics.count('api_cache_hits')
+            content = cached.content
+        else:
+            with metrics.timer('api_request'):
+                response = self.session.get(endpoint, headers=self._api_headers(cached))  # type: Response
+
+            metrics.count('api_pages')
+            response.raise_for_status()
+
+            content = response.content
+            if self.cache is not None:
+                content = self._api_cache_store(key, cached, offset, response.status_code, response.headers, content)
+
+        # Decode the body once, the response itself isn't needed past this point
+        with metrics.timer('api_decode'):
+            data = json_loads(content)['response']
+
+        if parse:
+            self._posts.extend(self._api_parse_response(data, offset))
+            self._next_offset = offset + PAGE_SIZE
+
+        return data
+
+    def _api_cache_lookup(self, key, offset):
+        """
+        Look up a cached API page. The first page carries the blog's last update time and post count, so it is always
+        fetched again. The other pages are only used without asking the API when the first page turned out not to
+        have changed, since new posts shift the offset of every cached page
+
+        Args:
+            key(str): Cache key of the page
+            offset(int): Post offset of the page
+
+        Returns:
+            tuple[Optional[tumdlr.cache.CachedResponse], bool]: The cached page, if any, and whether it can be used
+                as is
+        """
+        if self.cache is None:
+            return None, False
+
+        if offset == 0 or not self._cache_current:
+            return self.cache.get(key), False
+
+        return self.cache.lookup(key)
+
+    def _api_cache_store(self, key, cached, offset, status, headers, content):
+        """
+        Store an API response, noting whether the first page is still the one that was cached. Not every response
+        carries validators to make the request conditional on, so the blog information of both pages is compared
+
+        Args:
+            key(str): Cache key of the page
+            cached(Optional[tumdlr.cache.CachedResponse]): The cached page the request was conditional on
+            offset(int): Post offset of the page
+            status(int): Response status
+            headers(Mapping): Response headers
+            content(bytes): Response body
+
+        Returns:
+            bytes: The page content
+        """
+        content = self.cache.store(key, cached, status, headers, content)
+
+        if offset == 0:
+            self._cache_current = cached is not None and \
+                (status == 304 or _blog_state(cached.content) == _blog_state(content))
+
+        return content
+
+    def _api_endpoint(self, query=None, offset=None):
+        """
+        Build the URL of an API query
+
+        Args:
+            query(Optional[dict]): Extra query parameters
+            offset(Optional[int]): Post offset to query from. Defaults to the current offset
+
+        Returns:
+            str
         """
+        offset = self.offset if offset is None else offset
+        query = self._api_query(query)
+
         # Parse extra query parameters
         query_extra = []
 
@@ -81,24 +230,89 @@ class TumblrBlog:
             query_extra = ''
 
         endpoint = self._api_url.replace(
-            query='api_key={api_key}&filter=text&offset={offset}{extra}'.format(
-                api_key=self._api_key, offset=self.offset, extra=query_extra
+            query='api_key={api_key}&filter=text&limit={limit}&offset={offset}{extra}'.format(
+                api_key=self._api_key, limit=PAGE_SIZE, offset=offset, extra=query_extra
             )
         )
 
-        response = self.session.get(endpoint.as_string())  # type: Response
-        response.raise_for_status()
+        return endpoint.as_string()
 
-        self._api_response = response
-        if parse:
-            self._api_parse_response()
+    def _api_query(self, query=None):
+        """
+        Args:
+            query(Optional[dict]): Extra query parameters
+
+        Returns:
+            dict: Extra query parameters, including the post type and post filters
+        """
+        query = dict(query or {})
+
+        # Let the API filter by post type, and by whatever else it can
+        if self._post_type:
+            query['type'] = self._post_type
+
+        if self.post_filter:
+            query.update(self.post_filter.api_query())
+
+        return query
+
+    def _api_cache_key(self, query=None, offset=None):
+        """
+        Args:
+            query(Optional[dict]): Extra query parameters
+            offset(Optional[int]): Post offset to query from. Defaults to the current offset
+
+        Returns:
+            str|None: Cache key of an API query, or None when responses aren't cached
+        """
+        if self.cache is None:
+            return None
+
+        offset = self.offset if offset is None else offset
+        return self.cache.key(self._url.host, offset, dict(self._api_query(query), filter='text', limit=PAGE_SIZE))
+
+    def _api_headers(self, cached=None):
+        """
+        Args:
+            cached(Optional[tumdlr.cache.CachedResponse]): Stale cached response to revalidate
+
+        Returns:
+            dict: Headers to send with an API query
+        """
+        if cached is None:
+            return self._headers
+
+        return dict(self._headers, **cached.validators)
+
+    def _api_parse_response(self, data, offset=0):
+        """
+        Parse an API response. The blog information is only taken from the first page, later pages may be parsed by
+        the read-ahead workers while the blog is in use and only contribute their posts
+
+        Args:
+            data(dict): The decoded `response` object of an API response
+            offset(int): Post offset of the page
+
+        Returns:
+            list[TumblrPost]: The parsed posts
+        """
+        with metrics.timer('api_parse'):
+            if offset == 0:
+                self._api_parse_blog(data)
+
+            posts = self._api_parse_posts(data['posts'])
 
-    def _api_parse_response(self):
+        metrics.count('posts_parsed', len(posts))
+        return posts
+
+    def _api_parse_blog(self, data):
         """
-        Parse an API response
+        Update the blog information from a decoded API response
 
+        Args:
+            data(dict): The `response` object of an API response
         """
-        blog = self._api_response.json()['response']['blog']
+        blog = data['blog']
 
         self.title          = blog['title']
         self.url            = URL(blog['url'])
@@ -109,38 +323,231 @@ class TumblrBlog:
         self.post_count     = blog['posts']
         self.updated        = blog['updated']
 
-        posts = self._api_response.json()['response']['posts']
+        # Number of posts matching our query, used to plan the remaining pages
+        self.total_posts = data.get('total_posts', self.post_count)
+
+    def _api_parse_posts(self, posts):
+        """
+        Build post containers from decoded API post data
+
+        Args:
+            posts(list[dict]): The `posts` list of an API response
+
+        Returns:
+            list[TumblrPost]: The successfully parsed posts
+        """
+        parsed = []
 
         for post in posts:
+            # Never build containers for post types we weren't asked for
+            if self.post_types is not None and post['type'] not in self.post_types:
+                continue
+
+            # Or for filtered out posts, except for the first one past the date range, which ends the pagination
+            if self.post_filter and not self.post_filter.accepts(post) \
+                    and not self.post_filter.ended(post.get('timestamp')):
+                continue
+
             try:
                 if post['type'] in ['photo', 'link']:
-                    self._posts.append(TumblrPhotoSet(post, self))
+                    parsed.append(TumblrPhotoSet(post, self))
                     continue
                 elif post['type'] == 'video':
-                    self._posts.append(TumblrVideoPost(post, self))
+                    parsed.append(TumblrVideoPost(post, self))
                     continue
 
-                self._posts.append(TumblrPost(post, self))
+                parsed.append(TumblrPost(post, self))
             except TumdlrParserError:
                 continue
 
-    def posts(self):
+        return parsed
+
+    def _api_fetch_page(self, offset):
+        """
+        Fetch and parse a single API page without touching the local post buffer. Used by the read-ahead pager
+
+        Args:
+            offset(int): Post offset of the page
+
+        Returns:
+            tuple[int, list[TumblrPost]]: The number of posts the API returned and the successfully parsed posts
+        """
+        data = self._api_get(parse=False, offset=offset)
+        return len(data['posts']), self._api_parse_response(data, offset)
+
+    def posts(self, since=None):
+        """
+        Args:
+            since(Optional[int]): Stop paging at the first post published at or before this timestamp. The API
+                returns posts newest first, so nothing past that point would be newer. Paging stops the same way at
+                the lower date bound of the post filter
+
+        Yields:
+            TumblrPost
+        """
+        for index, post_type in enumerate(self.post_types or [None]):
+            # The first page of the first post type was fetched when the blog was loaded
+            if index:
+                self._post_type = post_type
+                self._posts = PostBuffer()
+                self.offset = 0
+                self._api_get()
+
+            stream = self._prefetched_posts() if (self.prefetch or self.workers > 1) else self._paged_posts()
+
+            for post in stream:
+                if self._past_range(post, since):
+                    stream.close()
+                    break
+
+                yield post
+
+    def _past_range(self, post, since=None):
+        """
+        Args:
+            post(TumblrPost)
+            since(Optional[int]): Timestamp of the last post archived by a previous run
+
+        Returns:
+            bool: The post is older than the posts we want. The API returns posts newest first, so no later post will
+                be any newer
+        """
+        if since and post.timestamp and post.timestamp <= since:
+            return True
+
+        return bool(self.post_filter) and self.post_filter.ended(post.timestamp)
+
+    def _paged_posts(self):
         """
+        Fetch one page at a time, only once the previous page has been consumed
+
         Yields:
             TumblrPost
         """
+        seen = set()
+
         while True:
             # Out of posts?
             if not self._posts:
-                # Do we have any more to query?
-                self._api_get()
+                # Page through by the API's page size. Posts left out because of their type or the post filter still
+                # take up their offsets, and a page may not have any posts we want at all
+                self.offset = self._next_offset
 
-                if not self._posts:
+                if not self._api_get()['posts']:
                     # Nope, we've queried everything, break now
                     break
 
-            # Pop our next post and increment the offset
-            post = self._posts.pop(0)
-            self.offset += 1
+                continue
+
+            post = self._posts.popleft()
 
+            # New posts published during the crawl shift later offsets, see _prefetched_posts()
+            if post.id in seen:
+                continue
+
+            seen.add(post.id)
             yield post
+
+    def _prefetched_posts(self):
+        """
+        Read-ahead variant of posts(). A background producer thread pages through the API with `workers` threads and
+        hands the parsed posts over through the bounded post buffer, so the API round trips are kept out of the
+        consumer's critical path. At most max(prefetch, workers) pages are in flight, no more than that many pages of
+        posts are buffered, and posts are always yielded in offset order.
+
+        New posts published during the crawl shift every later offset, which makes neighbouring pages overlap. Posts
+        are therefore de-duplicated by their ID.
+
+        The producer notes where each page starts in the buffer, so the offset points at the page of the current post
+        the same as it does with _paged_posts().
+
+        Yields:
+            TumblrPost
+        """
+        window = max(self.prefetch, self.workers)
+        buffer = self._posts
+        buffer.maxsize = PAGE_SIZE * window
+        boundaries = deque([(self.offset, len(buffer))])  # Post offset and number of buffered posts of each page
+        remaining = 0
+        seen = set()
+
+        producer = threading.Thread(target=self._produce_posts, args=(buffer, boundaries, self._next_offset, window),
+                                    name='tumdlr-pager', daemon=True)
+        producer.start()
+
+        try:
+            while True:
+                post = buffer.get()
+                if post is None:
+                    break
+
+                # A page's boundary is noted before its posts are buffered
+                while not remaining:
+                    self.offset, remaining = boundaries.popleft()
+
+                remaining -= 1
+
+                if post.id in seen:
+                    continue
+
+                seen.add(post.id)
+                yield post
+        finally:
+            # The consumer may stop early, release the producer and let it cancel its queued page requests
+            buffer.close()
+            producer.join()
+
+    def _produce_posts(self, buffer, boundaries, offset, window):
+        """
+        Producer side of _prefetched_posts(). Keeps the read-ahead window of page requests full and feeds their posts
+        into the buffer in offset order until the blog is exhausted or the consumer closes the buffer
+
+        Args:
+            buffer(PostBuffer): Hand-off buffer to the consumer
+            boundaries(deque[tuple[int, int]]): Receives the post offset and number of posts of every page, ahead of
+                its posts
+            offset(int): Post offset of the first page to fetch
+            window(int): Maximum number of page requests in flight
+        """
+        pages = deque()
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            try:
+                while not buffer.closed:
+                    while len(pages) < window and offset < self.total_posts:
+                        pages.append((offset, executor.submit(self._api_fetch_page, offset)))
+                        offset += PAGE_SIZE
+
+                    if not pages:
+                        break
+
+                    page_offset, page = pages.popleft()
+                    count, posts = page.result()
+                    if not count:
+                        break
+
+                    boundaries.append((page_offset, len(posts)))
+                    if not buffer.extend(posts):
+                        break
+            except Exception as e:
+                buffer.finish(e)
+            finally:
+                for __, page in pages:
+                    page.cancel()
+
+                buffer.finish()
+
+
+def _blog_state(content):
+    """
+    Args:
+        content(bytes): Body of an API response
+
+    Returns:
+        tuple|None: The blog's last update time and number of posts matching the query, or None if unreadable
+    """
+    try:
+        data = json_loads(content)['response']
+        return data['blog']['updated'], data.get('total_posts', data['blog']['posts'])
+    except (ValueError, KeyError, TypeError):
+        return None
@@ -0,0 +1,127 @@
+import threading
+from collections import deque
+
+
+class PostBuffer:
+    """
+    Bounded FIFO of parsed posts, handed from the thread fetching API pages to the thread downloading their files.
+
+    Both ends are O(1). A producer blocks in put() while the buffer is full, so API fetching never runs further ahead
+    of the downloads than `maxsize` posts, and a consumer blocks in get() until a post arrives or the producer is
+    done. Either side can stop early: the producer with finish(), optionally passing on the error that stopped it,
+    and the consumer with close(), which releases a producer waiting for room.
+    """
+    def __init__(self, maxsize=0):
+        """
+        Args:
+            maxsize(int): Maximum number of buffered posts. 0 means unbounded
+        """
+        self.maxsize = max(0, int(maxsize))
+
+        self._posts     = deque()
+        self._condition = threading.Condition()
+        self._finished  = False
+        self._closed    = False
+        self._error     = None  # type: Exception
+
+    def put(self, post):
+        """
+        Append a post, blocking while the buffer is full
+
+        Args:
+            post(tumdlr.containers.TumblrPost)
+
+        Returns:
+            bool: False if the consumer has closed the buffer and the post was discarded
+        """
+        with self._condition:
+            while self.maxsize and len(self._posts) >= self.maxsize and not self._closed:
+                self._condition.wait()
+
+            if self._closed:
+                return False
+
+            self._posts.append(post)
+            self._condition.notify_all()
+            return True
+
+    def extend(self, posts):
+        """
+        Append several posts, blocking while the buffer is full
+
+        Args:
+            posts(Iterable[tumdlr.containers.TumblrPost])
+
+        Returns:
+            bool: False if the consumer has closed the buffer
+        """
+        return all(self.put(post) for post in posts)
+
+    def get(self):
+        """
+        Take the oldest post, blocking until one is available
+
+        Returns:
+            tumdlr.containers.TumblrPost|None: None once the producer has finished and the buffer is drained
+        """
+        with self._condition:
+            while not self._posts and not self._finished:
+                self._condition.wait()
+
+            if self._posts:
+                post = self._posts.popleft()
+                self._condition.notify_all()
+                return post
+
+            if self._error is not None:
+                raise self._error
+
+            return None
+
+    def popleft(self):
+        """
+        Take the oldest post without blocking
+
+        Returns:
+            tumdlr.containers.TumblrPost
+
+        Raises:
+            IndexError: The buffer is empty
+        """
+        with self._condition:
+            post = self._posts.popleft()
+            self._condition.notify_all()
+            return post
+
+    def finish(self, error=None):
+        """
+        Producer side: no more posts will be added. Only the first call has any effect
+
+        Args:
+            error(Optional[Exception]): Raised to the consumer once it has drained the buffer
+        """
+        with self._condition:
+            if not self._finished:
+                self._finished = True
+                self._error = error
+                self._condition.notify_all()
+
+    def close(self):
+        """
+        Consumer side: stop accepting posts and discard what is left
+        """
+        with self._condition:
+            self._closed = True
+            self._posts.clear()
+            self._condition.notify_all()
+
+    @property
+    def closed(self):
+        """
+        Returns:
+            bool
+        """
+        return self._closed
+
+    def __len__(self):
+        return len(self._posts)
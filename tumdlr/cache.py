@@ -0,0 +1,332 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from tumdlr import USER_CACHE_DIR
+
+# File extension of cache entries, anything else in the cache directory is left alone
+ENTRY_EXT = '.page'
+
+
+class CachedResponse:
+    """
+    A cached API response body along with the validators needed to revalidate it
+    """
+    __slots__ = ('key', 'content', 'etag', 'last_modified', 'stored')
+
+    def __init__(self, key, content, etag=None, last_modified=None, stored=None):
+        """
+        Args:
+            key(str): Cache key
+            content(bytes): Response body
+            etag(Optional[str]): ETag header of the response
+            last_modified(Optional[str]): Last-Modified header of the response
+            stored(Optional[float]): When the response was fetched or last revalidated, as a UNIX timestamp
+        """
+        self.key            = key
+        self.content        = content
+        self.etag           = etag
+        self.last_modified  = last_modified
+        self.stored         = time.time() if stored is None else stored
+
+    @property
+    def validators(self):
+        """
+        Returns:
+            dict: Conditional request headers to revalidate the response with
+        """
+        headers = {}
+
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+
+        return headers
+
+    def __repr__(self):
+        return "<CachedResponse key='{key}' size='{size}'>".format(key=self.key, size=len(self.content))
+
+
+class ResponseCache:
+    """
+    On-disk cache of API responses.
+
+    Every API page is stored in its own file, keyed by the blog, the post offset and the query parameters. A response
+    younger than `ttl` is used without contacting the API at all. An older one is revalidated with a conditional
+    request when the API sent an ETag or Last-Modified header, and a 304 Not Modified answer reuses the stored body.
+
+    The cache is bounded by the total size of its entries. When it grows past `max_size`, the least recently used
+    entries are evicted first. The modification time of an entry's file records when it was last used, so the order
+    carries over between runs. Responses can be put into the cache by hand too, e.g. to replay recorded fixtures
+    without a network connection.
+    """
+    def __init__(self, path, ttl=3600, max_size=64 * 1024 * 1024):
+        """
+        Args:
+            path(str): Cache directory, created on first write
+            ttl(Optional[float]): Seconds a response is used without revalidating it. None never expires responses,
+                0 revalidates every response
+            max_size(int): Maximum total size of the cached responses in bytes
+        """
+        self.log = logging.getLogger('tumdlr.cache')
+
+        self.path       = path
+        self.ttl        = ttl
+        self.max_size   = max_size
+
+        self.hits           = 0
+        self.revalidated    = 0
+        self.misses         = 0
+
+        self._entries   = None  # type: OrderedDict[str, int]
+        self._size      = 0
+        self._lock      = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Build a cache from the [Cache] configuration section
+
+        Args:
+            config(configparser.ConfigParser): Tumdlr configuration
+
+        Returns:
+            ResponseCache
+        """
+        section = config['Cache'] if config.has_section('Cache') else {}
+
+        path = section.get('Path') or os.path.join(USER_CACHE_DIR, 'api')
+        ttl = section.get('TTL', '3600')
+
+        return cls(
+            path=os.path.expanduser(path),
+            ttl=float(ttl) if str(ttl).strip() else None,
+            max_size=int(float(section.get('MaxSize', 64)) * 1024 * 1024)
+        )
+
+    @staticmethod
+    def key(blog, offset, query=None):
+        """
+        Args:
+            blog(str): Blog host name
+            offset(int): Post offset of the page
+            query(Optional[dict]): Query parameters, besides the API key and the offset
+
+        Returns:
+            str
+        """
+        parts = json.dumps([blog.lower(), offset, sorted((query or {}).items())], separators=(',', ':'))
+        return hashlib.sha1(parts.encode('utf-8')).hexdigest()
+
+    def fresh(self, response):
+        """
+        Args:
+            response(CachedResponse)
+
+        Returns:
+            bool: The response can be used without revalidating it
+        """
+        return self.ttl is None or time.time() - response.stored < self.ttl
+
+    def get(self, key):
+        """
+        Args:
+            key(str): Cache key
+
+        Returns:
+            CachedResponse|None
+        """
+        filename = self._filename(key)
+
+        with self._lock:
+            self._load()
+            if key not in self._entries:
+                return None
+
+        try:
+            with open(filename, 'rb') as file:
+                header = json.loads(file.readline().decode('utf-8'))
+                content = file.read()
+
+            os.utime(filename)
+        except (OSError, ValueError) as e:
+            self.log.info('Dropping unreadable cache entry %s: %s', key, e)
+            self._forget(key)
+            return None
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+
+        return CachedResponse(key, content, header.get('etag'), header.get('last_modified'), header.get('stored'))
+
+    def put(self, key, content, etag=None, last_modified=None):
+        """
+        Store a response, replacing any cached response with the same key
+
+        Args:
+            key(str): Cache key
+            content(bytes): Response body
+            etag(Optional[str]): ETag header of the response
+            last_modified(Optional[str]): Last-Modified header of the response
+
+        Returns:
+            CachedResponse
+        """
+        response = CachedResponse(key, content, etag, last_modified)
+        header = json.dumps({'etag': etag, 'last_modified': last_modified, 'stored': response.stored})
+        entry = header.encode('utf-8') + b'\n' + content
+
+        os.makedirs(self.path, 0o755, True)
+
+        # Write to a temporary file first, so a concurrent run never reads half an entry
+        fd, temp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(entry)
+
+            os.replace(temp, self._filename(key))
+        except OSError:
+            os.unlink(temp)
+            raise
+
+        with self._lock:
+            self._load()
+            self._size += len(entry) - self._entries.pop(key, 0)
+            self._entries[key] = len(entry)
+            self._evict()
+
+        return response
+
+    def lookup(self, key):
+        """
+        Look up the cached response for an API request about to be made
+
+        Args:
+            key(Optional[str]): Cache key. Nothing is looked up without one
+
+        Returns:
+            tuple[Optional[CachedResponse], bool]: The cached response, if any, and whether it is fresh enough to be
+                used without making the request
+        """
+        cached = self.get(key) if key is not None else None
+
+        if cached is None or not self.fresh(cached):
+            return cached, False
+
+        self._count('hits')
+        self.log.debug('Using cached response %s', key)
+        return cached, True
+
+    def store(self, key, cached, status, headers, content):
+        """
+        Record the answer to a (possibly conditional) API request
+
+        Args:
+            key(Optional[str]): Cache key. Nothing is stored without one
+            cached(Optional[CachedResponse]): The cached response the request revalidated
+            status(int): HTTP status code
+            headers(Mapping[str, str]): Response headers
+            content(bytes): Response body
+
+        Returns:
+            bytes: The body to use, the cached one if the API answered 304 Not Modified
+        """
+        if key is None:
+            return content
+
+        if cached is not None and status == 304:
+            self._count('revalidated')
+            self.log.debug('Cached response %s is still valid', key)
+            content, etag, last_modified = cached.content, cached.etag, cached.last_modified
+        else:
+            self._count('misses')
+            etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+
+        # A cache that can't be written to shouldn't stop the crawl
+        try:
+            self.put(key, content, etag, last_modified)
+        except OSError as e:
+            self.log.warning('Failed to cache response %s: %s', key, e)
+
+        return content
+
+    def summary(self):
+        """
+        Returns:
+            dict: Number of responses served from the cache, revalidated with the API and fetched from the API
+        """
+        return {'hits': self.hits, 'revalidated': self.revalidated, 'misses': self.misses}
+
+    def clear(self):
+        """
+        Remove every cached response
+        """
+        with self._lock:
+            self._load()
+            for key in list(self._entries):
+                self._remove(key)
+
+    def __len__(self):
+        with self._lock:
+            self._load()
+            return len(self._entries)
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _filename(self, key):
+        return os.path.join(self.path, key + ENTRY_EXT)
+
+    def _load(self):
+        """
+        Index the entries already on disk, least recently used first. Must be called with the lock held
+        """
+        if self._entries is not None:
+            return
+
+        entries = []
+
+        try:
+            with os.scandir(self.path) as scan:
+                for entry in scan:
+                    if entry.name.endswith(ENTRY_EXT) and entry.is_file():
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, entry.name[:-len(ENTRY_EXT)], stat.st_size))
+        except FileNotFoundError:
+            pass
+
+        entries.sort()
+        self._entries = OrderedDict((key, size) for __, key, size in entries)
+        self._size = sum(self._entries.values())
+        self._evict()
+
+    def _evict(self):
+        """
+        Remove the least recently used entries until the cache fits in max_size. Must be called with the lock held
+        """
+        while self._size > self.max_size and self._entries:
+            key = next(iter(self._entries))
+            self.log.debug('Evicting cached response %s', key)
+            self._remove(key)
+
+    def _remove(self, key):
+        self._size -= self._entries.pop(key, 0)
+
+        try:
+            os.remove(self._filename(key))
+        except FileNotFoundError:
+            pass
+
+    def _forget(self, key):
+        with self._lock:
+            if self._entries is not None:
+                self._remove(key)
@@ -0,0 +1,104 @@
+import os
+
+# API post types archived when none are skipped
+POST_TYPES = ('photo', 'link', 'video')
+
+
+def enabled_post_types(ctx, images, videos):
+    """
+    Work out which API post types to archive, falling back to the configuration when not given on the command line
+
+    Args:
+        ctx(tumdlr.__main__.Context): CLI request context
+        images(Optional[bool]): Archive photo posts
+        videos(Optional[bool]): Archive video posts
+
+    Returns:
+        list[str]
+    """
+    images = ctx.config['Tumdlr'].getboolean('SavePhotos', True) if images is None else images
+    videos = ctx.config['Tumdlr'].getboolean('SaveVideos', True) if videos is None else videos
+
+    return (['photo', 'link'] if images else []) + (['video'] if videos else [])
+
+
+def all_post_types(types):
+    """
+    Args:
+        types(list[str]): API post types being archived
+
+    Returns:
+        bool: No post type is skipped, so a run without failures has archived everything up to the blog's last update
+    """
+    return set(types) >= set(POST_TYPES)
+
+
+def transfer_options(ctx):
+    """
+    Read the download tuning options from the [Connection] configuration section
+
+    Args:
+        ctx(tumdlr.__main__.Context): CLI request context
+
+    Returns:
+        dict: Keyword arguments for tumdlr.downloader.download()
+    """
+    connection = ctx.config['Connection'] if ctx.config.has_section('Connection') else {}
+
+    return {
+        'chunk_size': max(1, int(connection.get('ChunkSize', 256))) * 1024
+    }
+
+
+def record_post(ctx, archive, post, progress=None, manifest=None, total=None):
+    """
+    Record an enumerated post
+
+    Args:
+        ctx(tumdlr.__main__.Context): CLI request context
+        archive(tumdlr.database.models.Archive): Archive the post belongs to
+        post(tumdlr.containers.TumblrPost): Enumerated post
+        progress(Optional[tumdlr.progress.Progress]): Where to report the post
+        manifest(Optional[tumdlr.manifest.Manifest]): Manifest of the blog the post belongs to
+        total(Optional[int]): Number of posts expected
+    """
+    ctx.database.record_post(archive, post)
+
+    if progress:
+        progress.post(post, total)
+
+    if manifest:
+        manifest.post(post)
+
+
+def report_file(ctx, archive, file, path, error, progress=None, manifest=None):
+    """
+    Report and record the outcome of a single file download
+
+    Args:
+        ctx(tumdlr.__main__.Context): CLI request context
+        archive(tumdlr.database.models.Archive): Archive the file belongs to
+        file(tumdlr.containers.TumblrFile): Downloaded file
+        path(str): Path the file was saved to
+        error(Exception): Download error, if the download failed
+        progress(Optional[tumdlr.progress.Progress]): Where to report failed downloads
+        manifest(Optional[tumdlr.manifest.Manifest]): Manifest of the blog the file belongs to
+
+    Returns:
+        bool: True if the file was downloaded successfully
+    """
+    if error:
+        if progress:
+            progress.fail(file.url.as_string(), error)
+
+        if manifest:
+            manifest.file(file)
+
+        return False
+
+    ctx.database.record_file(archive, file, path, os.path.getsize(path))
+
+    if manifest:
+        manifest.file(file, path)
+
+    return True
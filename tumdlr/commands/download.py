@@ -1,48 +1,145 @@
 import logging
 import urllib
-from collections import OrderedDict
 
 import click
-from requests import Session
 
-from tumdlr.api import TumblrBlog
-from tumdlr.errors import TumdlrDownloadError
+from tumdlr.commands.common import all_post_types, enabled_post_types, record_post, report_file, transfer_options
+from tumdlr.filters import PostFilter, parse_date
+from tumdlr.pool import DownloadPool
+from tumdlr.progress import Progress
 from tumdlr.__main__ import pass_context
 
 
+def _date(ctx, param, value):
+    """
+    Convert a date option to a UNIX timestamp
+
+    Args:
+        ctx(click.Context)
+        param(click.Parameter): Option being converted
+        value(Optional[str]): Option value
+
+    Returns:
+        Optional[int]
+    """
+    if value is None:
+        return None
+
+    try:
+        return parse_date(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param=param)
+
+
 # noinspection PyIncorrectDocstring,PyUnusedLocal
 @click.command('download', short_help='Download posts from a Tumblr account')
 @click.argument('URL')
-@click.option('--images/--skip-images', help='Toggles the downloading of image posts', default=True, envvar='IMAGES')
-@click.option('--videos/--skip-videos', help='Toggles the downloading of video posts', default=True, envvar='VIDEOS')
+@click.option('--images/--skip-images', help='Toggles the downloading of image posts', default=None, envvar='IMAGES')
+@click.option('--videos/--skip-videos', help='Toggles the downloading of video posts', default=None, envvar='VIDEOS')
+@click.option('-j', '--jobs', help='Number of files to download concurrently', default=1, type=click.IntRange(1),
+              envvar='JOBS')
+@click.option('--per-host', help='Maximum number of concurrent downloads from a single host', type=click.IntRange(1),
+              envvar='PER_HOST')
+@click.option('--prefetch', help='Number of API pages to fetch ahead of the downloads (0 disables read-ahead)',
+              default=2, type=click.IntRange(0), envvar='PREFETCH')
+@click.option('--api-workers', help='Number of API pages to fetch in parallel', default=1, type=click.IntRange(1),
+              envvar='API_WORKERS')
+@click.option('--preflight', help='Test each file with a HEAD request before downloading it', is_flag=True,
+              envvar='PREFLIGHT')
+@click.option('--incremental', help='Only download posts published since the last complete run', is_flag=True,
+              envvar='INCREMENTAL')
+@click.option('--since', help='Only download posts published on or after this date (YYYY-MM-DD, YYYY-MM-DD HH:MM:SS '
+                              'or a UNIX timestamp, in UTC)', metavar='DATE', callback=_date,
+              envvar='SINCE')
+@click.option('--until', help='Only download posts published before this date', metavar='DATE',
+              callback=_date, envvar='UNTIL')
+@click.option('--tag', 'tags', help='Only download posts with this tag. Can be given more than once to download '
+                                    'posts with any of the tags', multiple=True, metavar='TAG', envvar='TAG')
+@click.option('--min-notes', help='Only download posts with at least this many notes', type=click.IntRange(0),
+              envvar='MIN_NOTES')
 @pass_context
-def cli(ctx, url, images, videos):
+def cli(ctx, url, images, videos, jobs, per_host, prefetch, api_workers, preflight, incremental, since, until, tags,
+        min_notes):
     """
     Download posts from a Tumblr account.
+
+    The filter options are applied as early as possible. A single --tag and --until are handled by the Tumblr API
+    itself, and paging stops at the first post older than --since.
     """
+    # Imported here rather than at the top so `tumdlr --help` doesn't have to load requests
+    from tumdlr.api import TumblrBlog
+    from tumdlr.manifest import Manifest
+    from tumdlr.session import build_session
+
     log = logging.getLogger('tumdlr.commands.downloader')
     log.info('Starting a new download session for %s', url)
 
+    post_types = enabled_post_types(ctx, images, videos)
+    if not post_types:
+        click.echo('Both image and video posts are disabled, nothing to download', err=True)
+        return
+
+    # Make sure the shared connection pool can serve every concurrent download and API request
+    ctx.session = build_session(ctx.config, min_pool_size=jobs + api_workers)
+
+    post_filter = PostFilter(since, until, tags, min_notes)
+    if post_filter:
+        log.info('Only archiving posts matching %r', post_filter)
+
     # Get our post information
-    tumblr = TumblrBlog(url)
-    progress = 0
-
-    for post in tumblr.posts():  # type: TumblrPost
-        # Generic data
-        progress_data = OrderedDict([
-            ('Progress', '{cur} / {total} posts processed'.format(cur=progress, total=tumblr.post_count)),
-            ('Type', post.type.title()),
-            ('Post Date', post.post_date),
-            ('Tags', post.tags)
-        ])
-
-        session = Session()
-        session.headers.update({'referer': urllib.parse.quote(post.url.as_string())})
-
-        for file in post.files:
-            try:
-                file.download(ctx, session=session, progress_data=progress_data)
-            except TumdlrDownloadError:
-                click.echo('File download failed, skipping', err=True)
-
-        progress += 1
+    # Incremental runs only fetch what's new, cached pages would only hide it
+    tumblr = TumblrBlog(url, ctx.session, prefetch=prefetch, workers=api_workers, post_types=post_types,
+                        keep_raw=False, cache=None if incremental else ctx.api_cache, post_filter=post_filter)
+    failures = 0
+
+    # Look up where the previous run left off
+    archive = ctx.database.archive(tumblr)
+    updated = tumblr.updated
+    sync_since = None  # Publish time of the newest post the previous run archived, --since is in the post filter
+
+    manifest = Manifest.for_blog(ctx.config, tumblr.name, tumblr.url.as_string())
+
+    # Records are committed in batches, keep the ones made so far if the run is interrupted
+    try:
+        with Progress.create(ctx.output) as progress, manifest:
+            if incremental and archive.complete and archive.last_updated:
+                if updated <= archive.last_updated:
+                    progress.message('{name} is already up to date'.format(name=tumblr.name), blog=tumblr.name)
+                    return
+
+                sync_since = archive.last_updated
+                log.info('Incremental run, only archiving posts published after %d', sync_since)
+
+            transfer = transfer_options(ctx)
+
+            with DownloadPool(jobs, per_host) as pool:
+                for post in tumblr.posts(sync_since):  # type: TumblrPost
+                    record_post(ctx, archive, post, progress, manifest,
+                                tumblr.total_posts if post_filter else tumblr.post_count)
+
+                    headers = {'Referer': urllib.parse.quote(post.url.as_string())}
+
+                    # Start extracting the video metadata now, so it runs alongside the downloads already in flight
+                    if post.is_video:
+                        post.extract()
+
+                    for file in post.files:
+                        pool.submit(file, ctx, session=ctx.session, headers=headers, progress=progress,
+                                    preflight=preflight, **transfer)
+
+                        for result in pool.completed():
+                            failures += not report_file(ctx, archive, *result, progress=progress, manifest=manifest)
+
+                for result in pool.join():
+                    failures += not report_file(ctx, archive, *result, progress=progress, manifest=manifest)
+
+            # Only move the sync point forward when nothing was missed, so failed files are retried on the next run.
+            # Filtered runs and runs skipping a post type leave posts out on purpose and never move it either
+            if failures:
+                progress.message('{count} file downloads failed'.format(count=failures), err=True, failures=failures)
+
+            if not failures and not post_filter and all_post_types(post_types):
+                ctx.database.mark_synced(archive, updated)
+    finally:
+        ctx.database.commit()
+
@@ -0,0 +1,274 @@
+import json
+import logging
+import os
+import time
+import urllib
+from collections import OrderedDict, deque
+
+import click
+
+from tumdlr.commands.common import all_post_types, enabled_post_types, record_post, report_file, transfer_options
+from tumdlr.pool import DownloadPool
+from tumdlr.progress import Progress
+from tumdlr.__main__ import pass_context
+
+
+class BlogJob:
+    """
+    Archive state of a single blog within a batch run
+
+    A job is finished, and its sync point, manifest and summary line written, as soon as its posts have all been
+    enumerated and the last of its files has been reported, not at the end of the batch.
+    """
+    def __init__(self, url):
+        """
+        Args:
+            url(str): Blog URL
+        """
+        self.url        = url
+        self.started    = time.monotonic()
+        self.finished   = None
+        self.status     = 'ok'
+        self.error      = None
+        self.posts      = 0
+        self.files      = 0
+        self.failures   = 0
+        self.bytes      = 0
+        self.pending    = 0     # Files submitted for download and not reported yet
+        self.enumerated = False
+
+        self.blog       = None  # type: tumdlr.api.TumblrBlog
+        self.manifest   = None  # type: tumdlr.manifest.Manifest
+        self.archive    = None  # type: tumdlr.database.models.Archive
+        self.updated    = None  # type: int
+        self._posts     = iter(())
+
+    def open(self, ctx, post_types, prefetch=2, incremental=False):
+        """
+        Load the blog and work out where the previous run left off
+
+        Args:
+            ctx(tumdlr.__main__.Context): CLI request context
+            post_types(list[str]): API post types to archive
+            prefetch(int): Number of API pages to fetch ahead
+            incremental(bool): Only archive posts published since the last complete run
+        """
+        from tumdlr.api import TumblrBlog
+        from tumdlr.manifest import Manifest
+
+        # Incremental runs only fetch what's new, cached pages would only hide it
+        self.blog = TumblrBlog(self.url, ctx.session, prefetch=prefetch, post_types=post_types, keep_raw=False,
+                               cache=None if incremental else ctx.api_cache)
+        self.manifest = Manifest.for_blog(ctx.config, self.blog.name, self.blog.url.as_string())
+        self.archive = ctx.database.archive(self.blog)
+        self.updated = self.blog.updated
+
+        since = None
+        if incremental and self.archive.complete and self.archive.last_updated:
+            since = self.archive.last_updated
+            if self.updated <= since:
+                self.status = 'up to date'
+
+        if self.status != 'up to date':
+            self._posts = self.blog.posts(since)
+
+    def next_post(self):
+        """
+        Returns:
+            tumdlr.containers.TumblrPost|None: The next post, or None once the blog has been fully enumerated
+        """
+        try:
+            post = next(self._posts)
+        except StopIteration:
+            self.enumerated = True
+            return None
+
+        self.posts += 1
+        return post
+
+    @property
+    def done(self):
+        """
+        Returns:
+            bool: Every post has been enumerated and every file reported
+        """
+        return self.enumerated and not self.pending
+
+    def summary(self):
+        """
+        Returns:
+            OrderedDict
+        """
+        return OrderedDict([
+            ('url', self.url),
+            ('name', self.blog.name if self.blog else None),
+            ('status', self.status),
+            ('posts', self.posts),
+            ('files', self.files),
+            ('failures', self.failures),
+            ('bytes', self.bytes),
+            ('seconds', round((self.finished or time.monotonic()) - self.started, 2)),
+            ('error', self.error)
+        ])
+
+
+# noinspection PyIncorrectDocstring,PyUnusedLocal
+@click.command('download-batch', short_help='Download posts from a list of Tumblr accounts')
+@click.argument('SOURCE', type=click.File('r'), default='-')
+@click.option('--images/--skip-images', help='Toggles the downloading of image posts', default=None, envvar='IMAGES')
+@click.option('--videos/--skip-videos', help='Toggles the downloading of video posts', default=None, envvar='VIDEOS')
+@click.option('-j', '--jobs', help='Number of files to download concurrently across all blogs', default=8,
+              type=click.IntRange(1), envvar='JOBS')
+@click.option('--per-host', help='Maximum number of concurrent downloads from a single host', type=click.IntRange(1),
+              envvar='PER_HOST')
+@click.option('-b', '--blogs', help='Number of blogs to archive at the same time', default=4, type=click.IntRange(1),
+              envvar='BLOGS')
+@click.option('--prefetch', help='Number of API pages to fetch ahead of the downloads, per blog', default=2,
+              type=click.IntRange(0), envvar='PREFETCH')
+@click.option('--incremental', help='Only download posts published since the last complete run', is_flag=True,
+              envvar='INCREMENTAL')
+@click.option('--summary', help='Write a JSON summary line per blog to this file',
+              type=click.Path(dir_okay=False, writable=True), envvar='SUMMARY')
+@pass_context
+def cli(ctx, source, images, videos, jobs, per_host, blogs, prefetch, incremental, summary):
+    """
+    Download posts from a list of Tumblr accounts.
+
+    Blog URLs are read one per line from SOURCE, or from standard input when no file is given. Blank lines and lines
+    starting with # are ignored. Blogs are archived a few at a time with their posts interleaved round-robin, and all
+    of them share one pool of downloads.
+    """
+    from tumdlr.session import build_session
+
+    log = logging.getLogger('tumdlr.commands.download_batch')
+
+    urls = deque(line.strip() for line in source if line.strip() and not line.lstrip().startswith('#'))
+    log.info('Starting a batch download session for %d blogs', len(urls))
+
+    post_types = enabled_post_types(ctx, images, videos)
+    if not post_types:
+        click.echo('Both image and video posts are disabled, nothing to download', err=True)
+        return
+
+    ctx.session = build_session(ctx.config, min_pool_size=jobs + blogs)
+    transfer = transfer_options(ctx)
+
+    active = deque()
+    jobs_by_blog = {}
+
+    def open_job(url):
+        job = BlogJob(url)
+
+        try:
+            job.open(ctx, post_types, prefetch, incremental)
+        except Exception as e:
+            log.warning('Failed to load %s', url, exc_info=e)
+            job.status, job.error = 'error', str(e)
+            finish(job)
+            return
+
+        if job.status == 'up to date':
+            job.enumerated = True
+            finish(job)
+            return
+
+        jobs_by_blog[id(job.blog)] = job
+        active.append(job)
+
+    def collect(results):
+        for file, path, error in results:
+            job = jobs_by_blog[id(file.container.blog)]
+            job.pending -= 1
+
+            try:
+                if report_file(ctx, job.archive, file, path, error, progress=progress, manifest=job.manifest):
+                    job.files += 1
+                    job.bytes += os.path.getsize(path)
+                else:
+                    job.failures += 1
+            except Exception as e:
+                log.warning('Failed to record %s', file, exc_info=e)
+                job.failures += 1
+
+            if job.done:
+                finish(job)
+
+    def finish(job):
+        """
+        Record how far a blog got: its sync point, manifest and summary line
+        """
+        job.finished = time.monotonic()
+        jobs_by_blog.pop(id(job.blog), None)
+
+        try:
+            if job.manifest:
+                job.manifest.close()
+
+            if job.blog and job.status == 'ok':
+                if job.failures:
+                    job.status = 'incomplete'
+                    ctx.database.commit()
+                elif not all_post_types(post_types):
+                    # Posts of the skipped types still have to be fetched by a later run
+                    ctx.database.commit()
+                else:
+                    ctx.database.mark_synced(job.archive, job.updated)
+        except Exception as e:
+            log.warning('Failed to record the archive state of %s', job.url, exc_info=e)
+            job.status, job.error = 'error', str(e)
+
+        result = job.summary()
+        progress.message('{url}: {status}, {posts} posts, {files} files ({failures} failed) in {seconds}s'
+                         .format(**result), err=job.status in ('error', 'incomplete'), **result)
+
+        if summary_file:
+            summary_file.write(json.dumps(result) + '\n')
+            summary_file.flush()
+
+    summary_file = open(summary, 'w') if summary else None
+
+    try:
+        with Progress.create(ctx.output) as progress, DownloadPool(jobs, per_host) as pool:
+            while urls or active:
+                # Keep the configured number of blogs in progress
+                while urls and len(active) < blogs:
+                    open_job(urls.popleft())
+
+                if not active:
+                    continue
+
+                # Take one post from the blog at the front and move it to the back of the queue
+                job = active.popleft()
+
+                try:
+                    post = job.next_post()
+                except Exception as e:
+                    log.warning('Failed to fetch posts from %s', job.url, exc_info=e)
+                    job.status, job.error, job.enumerated, post = 'error', str(e), True, None
+
+                if post is None:
+                    # Done once the downloads still in flight have been reported
+                    if job.done:
+                        finish(job)
+
+                    continue
+
+                active.append(job)
+                record_post(ctx, job.archive, post, progress, job.manifest)
+                headers = {'Referer': urllib.parse.quote(post.url.as_string())}
+
+                if post.is_video:
+                    post.extract()
+
+                for file in post.files:
+                    job.pending += 1
+                    pool.submit(file, ctx, session=ctx.session, headers=headers, progress=progress, **transfer)
+                    collect(pool.completed())
+
+            collect(pool.join())
+    finally:
+        # Records are committed in batches, keep the ones made so far if the run is interrupted
+        ctx.database.commit()
+
+        if summary_file:
+            summary_file.close()
@@ -0,0 +1,202 @@
+import errno
+import glob
+import logging
+import os
+import shutil
+
+import click
+
+from tumdlr.__main__ import pass_context
+
+
+# noinspection PyIncorrectDocstring,PyUnusedLocal
+@click.command('reorganize', short_help='Move downloaded files into the configured directory layout')
+@click.argument('BLOGS', nargs=-1)
+@click.option('--link', help='Hard link the files into the new layout and keep them where they are', is_flag=True)
+@click.option('--dry-run', help='Only show where the files would go', is_flag=True)
+@pass_context
+def cli(ctx, blogs, link, dry_run):
+    """
+    Move downloaded files into the directory layout of the current configuration.
+
+    The target path of every file is planned again from the manifests written by earlier runs, using the current save
+    path and [Categorization] settings, and files are moved (or linked) there in bulk. Nothing is fetched from
+    Tumblr. BLOGS are blog names, every blog with a manifest is reorganized when none are given.
+    """
+    from tumdlr.manifest import MANIFEST_EXT, Manifest
+
+    log = logging.getLogger('tumdlr.commands.reorganize')
+
+    directory = Manifest.directory(ctx.config)
+    if blogs:
+        manifests = [Manifest.for_blog(ctx.config, blog) for blog in blogs]
+    else:
+        manifests = [Manifest(path) for path in sorted(glob.glob(os.path.join(directory, '*' + MANIFEST_EXT)))]
+
+    if not manifests:
+        click.echo('No manifests found in {}, download something first'.format(directory), err=True)
+        return
+
+    try:
+        for manifest in manifests:
+            if not os.path.isfile(manifest.path):
+                click.echo('No manifest found for {}'.format(manifest.blog), err=True)
+                continue
+
+            log.info('Reorganizing %s', manifest.path)
+            counts = _reorganize(ctx, manifest, link, dry_run)
+
+            click.echo('{blog}: {moved} {action}, {unchanged} unchanged, {missing} missing, {failed} failed'
+                       .format(blog=manifest.blog, action='linked' if link else 'moved', **counts))
+    finally:
+        # Files that have been moved already have to keep their new paths in the database, even if a later one fails
+        if not dry_run:
+            ctx.database.commit()
+
+
+def _reorganize(ctx, manifest, link=False, dry_run=False):
+    """
+    Relocate the files of a single blog and update its manifest
+
+    Args:
+        ctx(tumdlr.__main__.Context): CLI request context
+        manifest(tumdlr.manifest.Manifest): Manifest of the blog
+        link(bool): Hard link the files instead of moving them
+        dry_run(bool): Only show where the files would go
+
+    Returns:
+        dict: Number of files moved, unchanged, missing and failed
+    """
+    log = logging.getLogger('tumdlr.commands.reorganize')
+
+    records = manifest.records()
+    counts = {'moved': 0, 'unchanged': 0, 'missing': 0, 'failed': 0}
+    vacated = set()
+
+    for record in records:
+        for entry in record['files']:
+            old, new = entry['path'], _plan(ctx.planner, manifest.blog, record, entry)
+
+            if old == new:
+                counts['unchanged'] += 1
+                continue
+
+            if dry_run:
+                click.echo('{} -> {}'.format(old, new))
+                counts['moved'] += 1
+                continue
+
+            try:
+                moved = _relocate(ctx.planner, old, new, link)
+            except OSError as e:
+                log.warning('Failed to relocate %s to %s: %s', old, new, e)
+                click.echo('{} {} ({})'.format(click.style('Failed:', bold=True, fg='red'), old, e), err=True)
+                counts['failed'] += 1
+                continue
+
+            if moved is None:
+                counts['missing'] += 1
+                continue
+
+            counts['moved'] += 1
+            entry['path'] = new
+            ctx.database.relocate(old, new)
+
+            if not link:
+                vacated.add(os.path.dirname(old))
+
+    if not dry_run:
+        manifest.rewrite(records)
+        _prune(vacated, ctx.planner.save_path)
+
+    return counts
+
+
+def _plan(planner, blog, record, entry):
+    """
+    Plan the path of a file from its manifest entry, the same way it would be planned during a download
+
+    Args:
+        planner(tumdlr.paths.PathPlanner)
+        blog(str): Blog name
+        record(dict): Manifest record of the post
+        entry(dict): Manifest entry of the file
+
+    Returns:
+        str
+    """
+    if 'page_no' in entry:
+        return planner.photo_path(blog, record['id'], record['caption'], entry['url'], entry['page_no'],
+                                  entry['category'])
+
+    if 'ext' in entry:
+        return planner.video_path(blog, record['id'], record['caption'], entry['url'], entry['ext'],
+                                  entry['category'])
+
+    return planner.claim(os.path.join(planner.directory(blog, entry['category']),
+                                      os.path.splitext(os.path.basename(entry['path']))[0]),
+                         os.path.splitext(entry['path'])[1], entry['url'], record['id'])
+
+
+def _relocate(planner, old, new, link=False):
+    """
+    Move or hard link a file to its new path
+
+    Args:
+        planner(tumdlr.paths.PathPlanner)
+        old(str): Current path of the file
+        new(str): New path of the file
+        link(bool): Hard link the file instead of moving it
+
+    Returns:
+        bool|None: True if the file was relocated, False if an earlier run already did, None if it's missing
+    """
+    if os.path.exists(new):
+        if os.path.exists(old) and not os.path.samefile(old, new):
+            raise FileExistsError(errno.EEXIST, 'A different file already exists at the new path', new)
+
+        if os.path.exists(old) and not link:
+            os.remove(old)
+
+        return False
+
+    if not os.path.exists(old):
+        return None
+
+    planner.makedirs(os.path.dirname(new))
+
+    if link:
+        os.link(old, new)
+        return True
+
+    try:
+        os.replace(old, new)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+        shutil.move(old, new)
+
+    return True
+
+
+def _prune(directories, root):
+    """
+    Remove directories left empty by moving their files, along with any parents that become empty, up to the root
+
+    Args:
+        directories(Iterable[str])
+        root(str): Directory to stop at
+    """
+    root = os.path.abspath(root or os.curdir)
+
+    for directory in sorted(directories, key=len, reverse=True):
+        directory = os.path.abspath(directory)
+
+        while directory != root and directory.startswith(root + os.sep):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                break
+
+            directory = os.path.dirname(directory)
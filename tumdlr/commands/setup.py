@@ -29,6 +29,9 @@ def cli(ctx, path, images, videos, pause):
             'SavePhotos': images,
             'SaveVideos': videos
         },
+        'Throttling': {
+            'Pause': pause
+        },
         'Development': {
             'AgreedToTerms': True
         }
@@ -1,12 +1,13 @@
+import hashlib
 import logging
 import os
-from hashlib import md5
-from pathlib import Path
 
-from youtube_dl import YoutubeDL
 from yurl import URL
 
-from tumdlr.downloader import sanitize_filename, download
+from tumdlr import metrics
+from tumdlr.dedupe import LINKED
+from tumdlr.downloader import download
+from tumdlr.extractor import extract_info
 from tumdlr.errors import TumdlrDownloadError, TumdlrParserError
 
 
@@ -17,6 +18,10 @@ class TumblrPost:
 
     Additional supported post types may extend this class to provide additional metadata parsing
     """
+    __slots__ = ('_post', 'blog', 'id', 'type', '_url', 'tags', 'post_date', 'timestamp', 'note_count', 'files')
+
+    log = logging.getLogger('tumdlr.containers.post')
+
     def __init__(self, post, blog):
         """
         Args:
@@ -25,13 +30,13 @@ class TumblrPost:
         """
         self._post = post
         self.blog = blog
-        self.log = logging.getLogger('tumdlr.containers.post')
 
         self.id         = None  # type: int
         self.type       = None  # type: str
-        self.url        = None  # type: URL
-        self.tags       = set()
+        self._url       = None  # type: str
+        self.tags       = ()    # type: tuple[str]
         self.post_date  = None  # type: str
+        self.timestamp  = None  # type: int
         self.note_count = None  # type: int
 
         self.files = []
@@ -42,6 +47,22 @@ class TumblrPost:
             self.log.warn('Failed to parse post data: %r', self, exc_info=e)
             raise TumdlrParserError(post_data=post)
 
+        # Everything we use has been pulled out of the API response by now
+        if not blog.keep_raw:
+            self._post = None
+
+    @property
+    def url(self):
+        """
+        Returns:
+            URL|None
+        """
+        return URL(self._url) if self._url else None
+
+    @url.setter
+    def url(self, url):
+        self._url = url.as_string() if isinstance(url, URL) else url
+
     @property
     def is_text(self):
         """
@@ -69,30 +90,33 @@ class TumblrPost:
     def _parse_post(self):
         self.id         = self._post['id']
         self.type       = self._post['type']
-        self.url        = URL(self._post['post_url']) if 'post_url' in self._post else None
-        self.tags       = set(self._post.get('tags', []))
+        self._url       = self._post.get('post_url')
+        self.tags       = tuple(self._post.get('tags', ()))
         self.note_count = self._post.get('note_count')
         self.post_date  = self._post['date']
+        self.timestamp  = self._post.get('timestamp')
 
     def __repr__(self):
         return "<TumblrPost id='{id}' type='{type}' url='{url}'>"\
-            .format(id=self.id, type=self.type, url=self.url)
+            .format(id=self.id, type=self.type, url=self._url)
 
     def __str__(self):
-        return self.url.as_string() if self.url else ''
+        return self._url or ''
 
 
 class TumblrPhotoSet(TumblrPost):
     """
     Container class for Photo and Photo Link post types
     """
+    __slots__ = ('title',)
+
     def __init__(self, post, blog):
         """
         Args:
             post(dict): API response
             blog(tumdlr.api.blog.TumblrBlog): Parent blog
         """
-        self.log = logging.getLogger('tumdlr.containers.post')
+        self.title = None  # type: str
         super().__init__(post, blog)
 
     def _parse_post(self):
@@ -118,37 +142,64 @@ class TumblrPhotoSet(TumblrPost):
 class TumblrVideoPost(TumblrPost):
     """
     Container class for Video post types
+
+    Video metadata is extracted lazily with youtube-dl, the first time it is needed (usually when the video is
+    downloaded), so enumerating posts never waits on an extraction.
     """
+    __slots__ = ('_video_info',)
+
     def __init__(self, post, blog):
         """
         Args:
             post(dict): API response
             blog(tumdlr.api.blog.TumblrBlog): Parent blog
         """
-        self.log = logging.getLogger('tumdlr.containers.post')
-
-        self.title          = None
-        self.description    = None
-        self.duration       = None
-        self.format         = None
+        self._video_info = None  # type: concurrent.futures.Future
 
         super().__init__(post, blog)
 
     def _parse_post(self):
         """
-        Parse all available photos using the best image sizes available
+        Register the video file. Its real URL is resolved when the video metadata is extracted
         """
         super()._parse_post()
+        self.files.append(TumblrVideo({'post_url': self._url}, self))
+
+    def extract(self):
+        """
+        Schedule the video metadata extraction in the background if it hasn't been already
+
+        Returns:
+            concurrent.futures.Future
+        """
+        if self._video_info is None:
+            self._video_info = extract_info(self._url)
 
-        video_info = YoutubeDL().extract_info(self.url.as_string(), False)
+        return self._video_info
 
-        self.title = video_info.get('title')
+    @property
+    def video_info(self):
+        """
+        Returns:
+            dict: youtube-dl info dict, blocking until the extraction has finished
+        """
+        return self.extract().result()
+
+    @property
+    def title(self):
+        return self.video_info.get('title')
 
-        self.description    = video_info.get('description')
-        self.duration       = int(video_info.get('duration', 0))
-        self.format         = video_info.get('format', 'Unknown')
+    @property
+    def description(self):
+        return self.video_info.get('description')
 
-        self.files.append(TumblrVideo(video_info, self))
+    @property
+    def duration(self):
+        return int(self.video_info.get('duration') or 0)
+
+    @property
+    def format(self):
+        return self.video_info.get('format', 'Unknown')
 
     def __repr__(self):
         return "<TumblrVideoPost id='{id}'>".format(id=self.id)
@@ -159,64 +210,96 @@ class TumblrFile:
     This is the base container class for all downloadable resources associated with Tumblr posts.
     """
 
+    __slots__ = ('_data', 'container', '_url')
+
     CATEGORY = 'misc'
 
+    log = logging.getLogger('tumdlr.containers.file')
+
     def __init__(self, data, container):
         """
         Args:
             data(dict): API response data
             container(TumblrPost): Parent container
         """
-        self.log = logging.getLogger('tumdlr.containers.file')
-
         self._data      = data
         self.container  = container
-        self.url        = URL(self._data.get('url', self._data.get('post_url')))
+        self._url       = self._data.get('url', self._data.get('post_url'))  # type: str
+
+    @property
+    def url(self):
+        """
+        Returns:
+            URL
+        """
+        return URL(self._url)
+
+    @url.setter
+    def url(self, url):
+        self._url = url.as_string() if isinstance(url, URL) else url
 
     def download(self, context, **kwargs):
         """
         Args:
             context(tumdlr.__main__.Context): CLI request context
-            kwargs(dict): Additional arguments to send with the download request
+            kwargs(dict): Additional arguments for tumdlr.downloader.download()
 
         Returns:
             str: Path to the saved file
         """
+        media = getattr(context, 'media', None)  # type: tumdlr.dedupe.MediaStore
+
         try:
-            download(self.url.as_string(), str(self.filepath(context, kwargs)), **kwargs)
+            filename = self.filepath(context)
+            context.planner.makedirs(os.path.dirname(filename))
+
+            with context.planner.writing(filename):
+                # Already downloaded this media, by an earlier run or for another post (or another blog)?
+                linked = media.link(self._url, filename) if media else None
+                if linked:
+                    if kwargs.get('progress'):
+                        kwargs['progress'].skip(self._url, filename, linked)
+
+                    metrics.count('downloads_linked' if linked == LINKED else 'downloads_skipped')
+                    return filename
+
+                digest = hashlib.sha1() if media else None
+                download(self._url, filename, create_dirs=False, digest=digest, **kwargs)
+
+                if media:
+                    media.add(self._url, filename, digest.hexdigest())
+
+            return filename
         except Exception as e:
+            metrics.count('download_errors')
             self.log.warn('Post download failed: %r', self, exc_info=e)
-            raise TumdlrDownloadError(error_message=str(e), download_url=self.url.as_string())
+            raise TumdlrDownloadError(error_message=str(e), download_url=self._url)
 
-    def filepath(self, context, request_data):
+    def filepath(self, context):
         """
         Args:
             context(tumdlr.__main__.Context): CLI request context
-            request_data(Optional[dict]): Additional arguments to send with the download request
 
         Returns:
-            Path
+            str: Directory to save the file in
         """
-        # Construct the save basedir
-        basedir = Path(context.config['Tumdlr']['SavePath'])
-
-        # Are we categorizing by user?
-        if context.config['Categorization']['User']:
-            self.log.debug('Categorizing by user: %s', self.container.blog.name)
-            basedir = basedir.joinpath(sanitize_filename(self.container.blog.name))
+        return context.planner.directory(self.container.blog.name, self.CATEGORY)
 
-        # Are we categorizing by post type?
-        if context.config['Categorization']['PostType']:
-            self.log.debug('Categorizing by type: %s', self.CATEGORY)
-            basedir = basedir.joinpath(self.CATEGORY)
-
-        self.log.debug('Basedir constructed: %s', basedir)
+    def manifest_entry(self, path):
+        """
+        Args:
+            path(str): Path the file was saved to
 
-        return basedir
+        Returns:
+            dict: What the manifest needs to know to plan the path of this file again
+        """
+        return {'url': self._url, 'path': path, 'category': self.CATEGORY}
 
 
 class TumblrPhoto(TumblrFile):
 
+    __slots__ = ('width', 'height', 'page_no')
+
     CATEGORY = 'photos'
 
     def __init__(self, photo, photoset):
@@ -231,48 +314,42 @@ class TumblrPhoto(TumblrFile):
         self.height  = self._data.get('height')
         self.page_no = self._data.get('page_no', False)
 
-    def filepath(self, context, request_data):
+        if not photoset.blog.keep_raw:
+            self._data = None
+
+    def filepath(self, context):
         """
         Get the full file path to save the downloaded file to
 
         Args:
             context(tumdlr.__main__.Context): CLI request context
-            request_data(Optional[dict]): Additional arguments to send with the download request
 
         Returns:
-            Path
+            str
         """
         assert isinstance(self.container, TumblrPhotoSet)
-        filepath = super().filepath(context, request_data)
 
-        request_data['progress_data']['Caption'] = self.container.title
+        return context.planner.photo_path(self.container.blog.name, self.container.id, self.container.title,
+                                          self._url, self.page_no, self.CATEGORY)
 
-        # Are we categorizing by photosets?
-        if self.page_no and context.config['Categorization']['Photosets']:
-            self.log.debug('Categorizing by photoset: %s', self.container.id)
-            filepath = filepath.joinpath(sanitize_filename(str(self.container.id)))
+    def manifest_entry(self, path):
+        entry = super().manifest_entry(path)
+        entry['page_no'] = self.page_no
 
-        # Prepend the page number for photosets
-        if self.page_no:
-            filepath = filepath.joinpath(sanitize_filename('p{pn}_{pt}'.format(pn=self.page_no,
-                                                                               pt=self.container.title)))
-            request_data['progress_data']['Photoset Page'] = '{cur} / {tot}'\
-                .format(cur=self.page_no, tot=len(self.container.files))
-        else:
-            filepath = filepath.joinpath(sanitize_filename(self.container.title))
-
-        # Work out the file extension and return
-        return str(filepath) + os.path.splitext(self.url.as_string())[1]
+        return entry
 
     def __repr__(self):
-        return "<TumblrPhoto url='{url}' width='{w}' height='{h}'>".format(url=self.url, w=self.width, h=self.height)
+        return "<TumblrPhoto url='{url}' width='{w}' height='{h}'>".format(url=self._url, w=self.width,
+                                                                           h=self.height)
 
     def __str__(self):
-        return self.url.as_string()
+        return self._url
 
 
 class TumblrVideo(TumblrFile):
 
+    __slots__ = ()
+
     CATEGORY = 'videos'
 
     def __init__(self, video, vpost):
@@ -283,41 +360,58 @@ class TumblrVideo(TumblrFile):
         """
         super().__init__(video, vpost)
 
-    def filepath(self, context, request_data):
+    def download(self, context, **kwargs):
         """
-        Get the full file path to save the video to
+        Resolve the video metadata and download the video
 
         Args:
             context(tumdlr.__main__.Context): CLI request context
-            request_data(Optional[dict]): Additional arguments to send with the download request
+            kwargs(dict): Additional arguments to send with the download request
 
         Returns:
-            Path
+            str: Path to the saved file
         """
-        assert isinstance(self.container, TumblrVideoPost)
-        filepath = super().filepath(context, request_data)
+        self.resolve()
+        return super().download(context, **kwargs)
+
+    def resolve(self, video_info=None):
+        """
+        Point this file at the real video URL, waiting for the video metadata extraction if necessary
+
+        Args:
+            video_info(Optional[dict]): Already extracted video metadata
+        """
+        try:
+            self._data = video_info or self.container.video_info
+        except Exception as e:
+            metrics.count('download_errors')
+            self.log.warn('Video extraction failed: %r', self, exc_info=e)
+            raise TumdlrDownloadError(error_message=str(e), download_url=self._url)
 
-        minutes  = int(self.container.duration / 60)
-        seconds  = self.container.duration % 60
-        duration = '{} minutes {} seconds'.format(minutes, seconds) if minutes else '{} seconds'.format(seconds)
+        self._url = self._data.get('url', self._data.get('post_url'))
 
-        if self.container.title:
-            request_data['progress_data']['Title'] = self.container.title
+    def filepath(self, context):
+        """
+        Get the full file path to save the video to
 
-        request_data['progress_data']['Description'] = self.container.description
-        request_data['progress_data']['Duration'] = duration
-        request_data['progress_data']['Format'] = self.container.format
+        Args:
+            context(tumdlr.__main__.Context): CLI request context
+
+        Returns:
+            str
+        """
+        assert isinstance(self.container, TumblrVideoPost)
+        return context.planner.video_path(self.container.blog.name, self.container.id, self.container.description,
+                                          self._url, self._data.get('ext', 'mp4'), self.CATEGORY)
 
-        filepath = filepath.joinpath(sanitize_filename(
-            self.container.description or
-            md5(self.url.as_string().encode('utf-8')).hexdigest())
-        )
+    def manifest_entry(self, path):
+        entry = super().manifest_entry(path)
+        entry['ext'] = self._data.get('ext', 'mp4')
 
-        # Work out the file extension and return
-        return '{}.{}'.format(str(filepath), self._data.get('ext', 'mp4'))
+        return entry
 
     def __repr__(self):
         return "<TumblrVideo id='{i}'>".format(i=self.container.id)
 
     def __str__(self):
-        return self.url.as_string()
+        return self._url
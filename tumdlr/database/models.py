@@ -1,15 +1,19 @@
-from sqlalchemy import Column, ForeignKey, Integer, BigInteger, Boolean, String, Text
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import Column, ForeignKey, Integer, BigInteger, Boolean, String, Text, UniqueConstraint
 from sqlalchemy.orm import relationship
 
+try:
+    from sqlalchemy.orm import declarative_base
+except ImportError:
+    from sqlalchemy.ext.declarative import declarative_base
+
 Base = declarative_base()
 
 
 class Archive(Base):
-    # __tablename__ = 'archives'
+    __tablename__ = 'archives'
     id              = Column(Integer, primary_key=True)
     blog_title      = Column(String(250), nullable=False)
-    url             = Column(Text, nullable=False)
+    url             = Column(Text, nullable=False, unique=True)
     total_photos    = Column(Integer, default=0)
     total_videos    = Column(Integer, default=0)
     total_generic   = Column(Integer, default=0)
@@ -17,7 +21,43 @@ class Archive(Base):
     complete        = Column(Boolean, default=False)
 
 
+class Post(Base):
+    __tablename__ = 'posts'
+    __table_args__ = (UniqueConstraint('archive_id', 't_post_id'),)
+    id          = Column(Integer, primary_key=True)
+    t_post_id   = Column(BigInteger, nullable=False)
+    archive_id  = Column(Integer, ForeignKey('archives.id'), nullable=False)
+    type        = Column(String(20), nullable=False)
+    url         = Column(Text)
+    timestamp   = Column(Integer)
+    created_at  = Column(Integer)
+
+    archive     = relationship(Archive)
+
+
+class File(Base):
+    __tablename__ = 'files'
+    id          = Column(Integer, primary_key=True)
+    post_id     = Column(Integer, ForeignKey('posts.id'), nullable=False)
+    url         = Column(Text, nullable=False)
+    filename    = Column(Text, nullable=False)
+    size        = Column(BigInteger)
+    created_at  = Column(Integer)
+
+    post        = relationship(Post)
+
+
+class Media(Base):
+    __tablename__ = 'media'
+    id          = Column(Integer, primary_key=True)
+    key         = Column(Text, nullable=False, unique=True)
+    sha1        = Column(String(40), nullable=False, index=True)
+    path        = Column(Text, nullable=False)
+    size        = Column(BigInteger)
+
+
 class Photoset(Base):
+    __tablename__ = 'photosets'
     id          = Column(Integer, primary_key=True)
     t_post_id   = Column(BigInteger)
     archive_id  = Column(Integer, ForeignKey('archives.id'))
@@ -29,6 +69,7 @@ class Photoset(Base):
 
 
 class Photo(Base):
+    __tablename__ = 'photos'
     id          = Column(Integer, primary_key=True)
     t_photo_id  = Column(BigInteger)
     archive_id  = Column(Integer, ForeignKey('archives.id'))
@@ -0,0 +1,27 @@
+import logging
+import os
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from tumdlr.database.models import Base
+
+
+def create_session(path):
+    """
+    Open (and create if needed) an SQLite database
+
+    Args:
+        path(str): Path to the database file
+
+    Returns:
+        sqlalchemy.orm.Session
+    """
+    log = logging.getLogger('tumdlr.database')
+    log.debug('Opening database: %s', path)
+
+    os.makedirs(os.path.dirname(path) or '.', 0o755, True)
+    engine = create_engine('sqlite:///{path}'.format(path=path), connect_args={'check_same_thread': False})
+    Base.metadata.create_all(engine)
+
+    return sessionmaker(bind=engine)()
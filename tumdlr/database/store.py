@@ -0,0 +1,189 @@
+import logging
+import threading
+import time
+
+from tumdlr.database.models import Archive, File, Media, Post
+from tumdlr.database.setup import create_session
+
+
+class ArchiveStore:
+    """
+    Persistent record of archived blogs and the posts and files downloaded from them
+    """
+
+    # Number of records to buffer before committing them
+    COMMIT_INTERVAL = 100
+
+    def __init__(self, path):
+        """
+        Args:
+            path(str): Path to the SQLite database file
+        """
+        self.log = logging.getLogger('tumdlr.database.store')
+
+        self.path       = path
+        self.session    = create_session(path)
+        self._lock      = threading.RLock()
+        self._pending   = 0
+        self._owners    = None  # Path => media URL of every recorded file, loaded on first use
+
+    def archive(self, blog):
+        """
+        Fetch the archive record for a blog, creating it if it doesn't exist yet
+
+        Args:
+            blog(tumdlr.api.TumblrBlog)
+
+        Returns:
+            Archive
+        """
+        url = blog.url.as_string()
+
+        with self._lock:
+            archive = self.session.query(Archive).filter_by(url=url).first()
+            if not archive:
+                self.log.debug('Creating a new archive record for %s', url)
+                archive = Archive(blog_title=blog.title or blog.name, url=url)
+                self.session.add(archive)
+                self.session.commit()
+
+            return archive
+
+    def record_post(self, archive, post):
+        """
+        Args:
+            archive(Archive)
+            post(tumdlr.containers.TumblrPost)
+
+        Returns:
+            Post
+        """
+        with self._lock:
+            record = self.session.query(Post).filter_by(archive_id=archive.id, t_post_id=post.id).first()
+            if record:
+                return record
+
+            record = Post(t_post_id=post.id, archive_id=archive.id, type=post.type, url=str(post),
+                          timestamp=post.timestamp, created_at=int(time.time()))
+            self.session.add(record)
+
+            if post.is_photo:
+                archive.total_photos = (archive.total_photos or 0) + 1
+            elif post.is_video:
+                archive.total_videos = (archive.total_videos or 0) + 1
+            else:
+                archive.total_generic = (archive.total_generic or 0) + 1
+
+            self._queue_commit()
+            return record
+
+    def record_file(self, archive, file, filename, size=None):
+        """
+        Args:
+            archive(Archive)
+            file(tumdlr.containers.TumblrFile)
+            filename(str): Path the file was saved to
+            size(Optional[int]): Size of the saved file in bytes
+        """
+        with self._lock:
+            post = self.record_post(archive, file.container)
+            if self.session.query(File).filter_by(post=post, url=file.url.as_string()).first():
+                return
+
+            self.session.add(File(post=post, url=file.url.as_string(), filename=filename, size=size,
+                                  created_at=int(time.time())))
+            self._queue_commit()
+
+            if self._owners is not None:
+                self._owners[filename] = file.url.as_string()
+
+    def file_owner(self, path):
+        """
+        Args:
+            path(str): Path of a saved file
+
+        Returns:
+            str|None: URL of the media file saved to the path, if any
+        """
+        with self._lock:
+            if self._owners is None:
+                self._owners = dict(self.session.query(File.filename, File.url))
+
+            return self._owners.get(path)
+
+    def find_media(self, key=None, sha1=None):
+        """
+        Look up known copies of a media file by its URL key or content hash
+
+        Args:
+            key(Optional[str]): Stable media identifier
+            sha1(Optional[str]): Content hash
+
+        Returns:
+            list[Media]
+        """
+        with self._lock:
+            query = self.session.query(Media)
+            if key is not None:
+                query = query.filter_by(key=key)
+            if sha1 is not None:
+                query = query.filter_by(sha1=sha1)
+
+            return query.all()
+
+    def record_media(self, key, sha1, path, size=None):
+        """
+        Args:
+            key(str): Stable media identifier
+            sha1(str): Content hash
+            path(str): Path of a stored copy
+            size(Optional[int]): Size in bytes
+        """
+        with self._lock:
+            media = self.session.query(Media).filter_by(key=key).first()
+            if media:
+                media.sha1, media.path, media.size = sha1, path, size
+            else:
+                self.session.add(Media(key=key, sha1=sha1, path=path, size=size))
+
+            self._queue_commit()
+
+    def relocate(self, old, new):
+        """
+        Point the file and media records of a file that has been moved (or linked) to a new path
+
+        Args:
+            old(str): Previous path of the file
+            new(str): New path of the file
+        """
+        with self._lock:
+            self.session.query(File).filter_by(filename=old).update({'filename': new}, synchronize_session=False)
+            self.session.query(Media).filter_by(path=old).update({'path': new}, synchronize_session=False)
+            self._queue_commit()
+
+            if self._owners is not None and old in self._owners:
+                self._owners[new] = self._owners.pop(old)
+
+    def mark_synced(self, archive, updated, complete=True):
+        """
+        Record a finished archive run
+
+        Args:
+            archive(Archive)
+            updated(int): The blog's last updated timestamp at the time of the run
+            complete(bool): Whether every post up to `updated` has been archived
+        """
+        with self._lock:
+            archive.last_updated = updated
+            archive.complete = complete
+            self.commit()
+
+    def commit(self):
+        with self._lock:
+            self.session.commit()
+            self._pending = 0
+
+    def _queue_commit(self):
+        self._pending += 1
+        if self._pending >= self.COMMIT_INTERVAL:
+            self.commit()
@@ -0,0 +1,180 @@
+import errno
+import hashlib
+import logging
+import os
+import shutil
+
+from yurl import URL
+
+# Linux FICLONE ioctl, creates a copy-on-write clone of a file on filesystems that support it (btrfs, XFS, ...)
+FICLONE = 0x40049409
+
+# Suffix of the temporary link made next to a file before it's swapped into place
+LINK_EXT = '.link'
+
+# Outcomes of MediaStore.link()
+LINKED      = 'duplicate'   # A known copy was linked into place
+IN_PLACE    = 'exists'      # The file is already the known copy, e.g. saved or linked by an earlier run
+
+
+class MediaStore:
+    """
+    Content-addressed index of downloaded media
+
+    Reblogs carry the same media under many post IDs. Every downloaded file is indexed by a stable identifier taken
+    from its URL and by the hash of its content, so a known file can be linked into place instead of being downloaded
+    again, and identical content fetched from different URLs is only kept on disk once. The index is persisted in the
+    archive database, so it works across runs and across blogs.
+    """
+    def __init__(self, database):
+        """
+        Args:
+            database(tumdlr.database.store.ArchiveStore): Archive database holding the index
+        """
+        self.log = logging.getLogger('tumdlr.dedupe')
+        self.database = database
+
+    @staticmethod
+    def media_key(url):
+        """
+        Get a stable identifier for a media URL. Tumblr serves the same file from numbered media hosts
+        (64.media.tumblr.com, 66.media.tumblr.com, ...), so only the path is significant for those
+
+        Args:
+            url(URL|str)
+
+        Returns:
+            str
+        """
+        url = url if isinstance(url, URL) else URL(url)
+
+        if url.host.endswith('media.tumblr.com'):
+            return 'tumblr:' + url.path
+
+        return url.host + url.path
+
+    def link(self, url, filename):
+        """
+        Put an already known copy of a media file in place. Copies that are no longer the size they were indexed with
+        (truncated or overwritten since) are never linked
+
+        Args:
+            url(URL|str): Media URL
+            filename(str): Path the file should be saved to
+
+        Returns:
+            str|None: LINKED or IN_PLACE if the file is in place, None if it still needs to be downloaded
+        """
+        exists = os.path.exists(filename)
+
+        for media in self.database.find_media(key=self.media_key(url)):
+            for source in self._copies(media):
+                if media.size is not None and os.path.getsize(source) != media.size:
+                    self.log.warning('%s is no longer the size it was indexed with, not linking it', source)
+                    continue
+
+                # Saved or linked into place by an earlier run?
+                if exists:
+                    if os.path.samefile(source, filename):
+                        return IN_PLACE
+
+                    continue
+
+                self.log.info('Linking known media %s to %s', source, filename)
+                os.makedirs(os.path.dirname(filename), 0o755, True)
+                _link(source, filename)
+                return LINKED
+
+        return None
+
+    def add(self, url, filename, sha1=None):
+        """
+        Index a freshly downloaded file. If identical content is already stored elsewhere the new file is replaced
+        with a link to it
+
+        Args:
+            url(URL|str): Media URL
+            filename(str): Path the file was saved to
+            sha1(Optional[str]): SHA-1 hex digest of the file, hashed while it was downloaded. The file is read and
+                hashed if not given
+        """
+        sha1 = sha1 or _hash(filename)
+        size = os.path.getsize(filename)
+
+        for media in self.database.find_media(sha1=sha1):
+            source = next(iter(self._copies(media)), None)
+            if source and not os.path.samefile(source, filename):
+                self.log.info('Duplicate content, replacing %s with a link to %s', filename, source)
+                _link(source, filename)
+                break
+
+        self.database.record_media(self.media_key(url), sha1, filename, size)
+
+    def _copies(self, media):
+        """
+        Yields:
+            str: Existing stored copies of the given content, in preference order
+        """
+        if os.path.isfile(media.path):
+            yield media.path
+
+        for other in self.database.find_media(sha1=media.sha1):
+            if other.path != media.path and os.path.isfile(other.path):
+                yield other.path
+
+
+def _hash(filename):
+    """
+    Returns:
+        str: SHA-1 hex digest of the file contents
+    """
+    sha1 = hashlib.sha1()
+
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            sha1.update(block)
+
+    return sha1.hexdigest()
+
+
+def _link(source, target):
+    """
+    Link a file into place, replacing whatever is at the target path. The link is made under a temporary name first
+    and then swapped in, so the target is never missing if we're interrupted halfway
+    """
+    temporary = target + LINK_EXT
+    if os.path.lexists(temporary):
+        os.remove(temporary)
+
+    try:
+        _make_link(source, temporary)
+        os.replace(temporary, target)
+    except BaseException:
+        if os.path.lexists(temporary):
+            os.remove(temporary)
+
+        raise
+
+
+def _make_link(source, target):
+    """
+    Hard link a file to a new path, falling back to a reflink and finally a plain copy when the two paths are on
+    different filesystems or the filesystem doesn't support hard links
+    """
+    try:
+        os.link(source, target)
+        return
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP):
+            raise
+
+    try:
+        import fcntl
+
+        with open(source, 'rb') as src, open(target, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return
+    except (ImportError, OSError):
+        pass
+
+    shutil.copy2(source, target)
@@ -1,67 +1,368 @@
 import html
+import json
 import os
 import re
+import time
 import unicodedata
+from functools import lru_cache
 
-import click
-from humanize import naturalsize
 from requests import Session
 
+from tumdlr import metrics
 
-def download(url, filename, progress_data=None, session=None, silent=False):
+# Default number of bytes read and written at a time
+CHUNK_SIZE = 256 * 1024
+
+# Suffix of partial downloads, and of the file recording what a partial download was started from
+PART_EXT        = '.part'
+PART_INFO_EXT   = '.json'
+
+
+def download(url, filename, progress=None, session=None, preflight=False, headers=None, create_dirs=True,
+             chunk_size=CHUNK_SIZE, digest=None):
     """
-    Initiate a file download and display the progress
+    Initiate a file download and report its progress
+
+    A file already saved at `filename` is kept if it's as long as the remote file and downloaded again from scratch
+    otherwise, it is never appended to. Only partial downloads (.part files) are resumed, and only with an If-Range
+    request carrying the validators recorded when they were started, so a partial download of a file that has changed
+    since, or one left behind by a different URL, is replaced instead of being completed with someone else's bytes.
 
     Args:
         url(str):               Download URL
         filename(str):          Path to save the file to
-        progress_data(dict):    Static information to display above the progress bar
+        progress(Progress):     Where to report the progress of the download. Nothing is reported if not given
         session(Session):       An optional download session to use
-        silent(bool):           Download the file, but don't print any output
+        preflight(bool):        Test the connection with a HEAD request before starting the download
+        headers(dict):          Additional headers to send with the requests, e.g. the Referer
+        create_dirs(bool):      Create the parent directory of the file. Callers that keep track of the directories
+                                they've created already pass False
+        chunk_size(int):        Number of bytes to read from the network and write to disk at a time
+        digest(hashlib.Hash):   Hash to update with the content of the saved file. Chunks are hashed as they are
+                                written, so the file doesn't have to be read back to index it
 
     Returns:
-
+        str: Path to the saved file
     """
+    started = time.perf_counter()
+
     # Set up our requests session and make sure the filepath exists
     session = session or Session()
-    os.makedirs(os.path.dirname(filename), 0o755, True)
+    if create_dirs:
+        os.makedirs(os.path.dirname(filename), 0o755, True)
 
     # Test the connection
-    response = session.head(url, allow_redirects=True)  # type: Response
-    response.raise_for_status()
-
-    # Get some information about the file we are downloading
-    filesize    = naturalsize(response.headers.get('content-length', 0))
-    filetype    = response.headers.get('content-type', 'Unknown')
-
-    # Format the information output
-    info_lines = [
-        click.style('Saving to: ', bold=True) + filename,
-        click.style('File type: ', bold=True) + filetype,
-        click.style('File size: ', bold=True) + filesize
-    ]
-
-    if progress_data:
-        for key, value in progress_data.items():
-            info_lines.append('{key} {value}'.format(key=click.style(key + ':', bold=True), value=value))
-
-    # Print the static information now
-    click.echo()
-    for line in info_lines:
-        click.echo(line)
-
-    # Now let's make the real download request
-    response = session.get(url, allow_redirects=True)  # type: Response
-
-    # Process the download
-    with open(filename, 'wb') as file:
-        length = int(response.headers.get('content-length', 0))
-
-        with click.progressbar(response.iter_content(1024), (length / 1024)) as progress:
-            for chunk in progress:
-                if chunk:
+    if preflight:
+        response = session.head(url, allow_redirects=True, headers=headers)  # type: Response
+        response.raise_for_status()
+
+    # Is the file we already have complete?
+    if os.path.isfile(filename):
+        if _is_complete(session, url, filename, headers):
+            if digest is not None:
+                hash_file(digest, filename)
+
+            if progress:
+                progress.skip(url, filename, 'exists')
+
+            metrics.count('downloads_skipped')
+            return filename
+
+    # Downloads are written to a temporary file and only moved into place once they are complete
+    partname = filename + PART_EXT
+    offset, validator = resume_point(partname, url)
+
+    request_headers = dict(headers or {})
+    if offset:
+        request_headers['Range'] = 'bytes={offset}-'.format(offset=offset)
+        request_headers['If-Range'] = validator
+
+    # Stream the download, the file information is read from the response headers before the body is consumed
+    response = session.get(url, allow_redirects=True, stream=True, headers=request_headers)  # type: Response
+
+    with response:
+        length = total_length(response.status_code, response.headers)
+
+        # Did the server honour our range request? If the file changed since the partial download was started it
+        # sends the whole file instead, and we start from scratch
+        resumed = offset if response.status_code in (206, 416) else 0
+
+        if resumed and not resume_matches(partname, response.status_code, length):
+            # The partial download can't be completed, e.g. it's already longer than the remote file. Start over,
+            # after handing back this response's connection (and throttle slot)
+            response.close()
+            remove_partial(partname)
+            return download(url, filename, progress, session, False, headers, False, chunk_size, digest)
+
+        # The bytes downloaded earlier are only hashed now, the rest as it comes in
+        if resumed and digest is not None:
+            hash_file(digest, partname)
+
+        # Nothing left to fetch, the partial download was in fact complete
+        if resumed and response.status_code == 416:
+            finish_partial(partname, filename)
+
+            if progress:
+                progress.skip(url, filename, 'exists')
+
+            metrics.count('downloads_skipped')
+            return filename
+
+        response.raise_for_status()
+
+        if not resumed:
+            record_partial(partname, url, response.headers, length)
+
+        if progress:
+            progress.start(url, filename, length, resumed, response.headers.get('content-type'))
+
+        # Process the download. The file object buffers the writes, nothing is flushed until the file is closed.
+        # The body is read through urllib3, which hands the connection back to the pool once it has been consumed
+        chunks = response.iter_content(chunk_size)
+
+        with open(partname, 'ab' if resumed else 'wb') as file:
+            if progress or digest is not None:
+                for chunk in chunks:
+                    file.write(chunk)
+
+                    if digest is not None:
+                        digest.update(chunk)
+
+                    if progress:
+                        progress.advance(url, len(chunk))
+            else:
+                for chunk in chunks:
                     file.write(chunk)
-                    file.flush()
+
+            written = file.tell() - resumed
+
+    # Not every urllib3 version checks the body against the Content-Length. Keep a truncated download as a partial
+    # download, so it's resumed rather than taken for the whole file
+    check_length(url, length, resumed + written)
+    finish_partial(partname, filename)
+
+    metrics.observe('download', time.perf_counter() - started)
+    metrics.count('downloads_saved')
+    metrics.count('download_bytes', written)
+
+    if progress:
+        progress.done(url, filename)
+
+    return filename
+
+
+def resume_point(partname, url):
+    """
+    Find out whether a partial download can be resumed
+
+    Args:
+        partname(str): Path of the partial download
+        url(str): URL being downloaded
+
+    Returns:
+        tuple[int, Optional[str]]: Number of bytes already downloaded and the If-Range validator to resume with, or
+            (0, None) if the download has to start from scratch
+    """
+    if not os.path.isfile(partname):
+        return 0, None
+
+    info = _read_partial(partname)
+    if info is None or info.get('url') != url or not info.get('validator'):
+        # Left behind by another URL, or without anything to tell whether the remote file is still the same one
+        return 0, None
+
+    return os.path.getsize(partname), info['validator']
+
+
+def resume_matches(partname, status, length):
+    """
+    Check a response to a resume request against what was recorded when the partial download was started
+
+    Args:
+        partname(str): Path of the partial download
+        status(int): Response status, 206 or 416
+        length(Optional[int]): Full size of the remote file, taken from the Content-Range header
+
+    Returns:
+        bool: The partial download can be completed (or is complete already, for a 416)
+    """
+    info = _read_partial(partname) or {}
+    expected = info.get('length')
+
+    if length is None or (expected is not None and length != expected):
+        return False
+
+    return status == 206 or length == os.path.getsize(partname)
+
+
+def record_partial(partname, url, headers, length):
+    """
+    Record the URL and validators of a download being started, so it can be resumed safely later
+
+    Args:
+        partname(str): Path of the partial download
+        url(str): URL being downloaded
+        headers(Mapping): Response headers
+        length(Optional[int]): Full size of the remote file
+    """
+    etag = headers.get('etag')
+    validator = etag if etag and not etag.startswith('W/') else headers.get('last-modified')
+
+    with open(partname + PART_INFO_EXT, 'w') as file:
+        json.dump({'url': url, 'validator': validator, 'length': length}, file)
+
+
+def remove_partial(partname):
+    """
+    Delete a partial download along with its recorded validators
+    """
+    _remove(partname, partname + PART_INFO_EXT)
+
+
+def _read_partial(partname):
+    try:
+        with open(partname + PART_INFO_EXT, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def finish_partial(partname, filename):
+    """
+    Move a completed download into place
+    """
+    os.replace(partname, filename)
+    _remove(partname + PART_INFO_EXT)
+
+
+def hash_file(digest, filename, chunk_size=CHUNK_SIZE):
+    """
+    Update a hash with the content of a file
+
+    Args:
+        digest(hashlib.Hash)
+        filename(str)
+        chunk_size(int): Number of bytes to read at a time
+
+    Returns:
+        hashlib.Hash: The updated hash
+    """
+    with open(filename, 'rb') as file:
+        for block in iter(lambda: file.read(chunk_size), b''):
+            digest.update(block)
+
+    return digest
+
+
+def _is_complete(session, url, filename, headers=None):
+    """
+    Check whether an existing file is as long as the remote file, without downloading its content
+
+    Args:
+        session(Session)
+        url(str)
+        filename(str)
+        headers(Optional[dict]): Additional request headers
+
+    Returns:
+        bool
+    """
+    size = os.path.getsize(filename)
+    request_headers = dict(headers or {}, Range='bytes={size}-'.format(size=size))
+
+    with session.get(url, allow_redirects=True, stream=True, headers=request_headers) as response:
+        return is_complete_copy(response.status_code, total_length(response.status_code, response.headers), size)
+
+
+def is_complete_copy(status, length, size):
+    """
+    Args:
+        status(int): Response status to a request for everything past the end of a local copy
+        length(Optional[int]): Full size of the remote file
+        size(int): Size of the local copy
+
+    Returns:
+        bool: The local copy is as long as the remote file
+    """
+    # A 416 means there's nothing past the end of our copy
+    if status == 416:
+        return length in (None, size)
+
+    return status == 200 and length == size
+
+
+def check_length(url, length, size):
+    """
+    Make sure a download received the whole file
+
+    Args:
+        url(str): Download URL
+        length(Optional[int]): Full size of the remote file, if known
+        size(int): Size of the saved file
+
+    Raises:
+        IOError: The connection was closed before the whole file was received
+    """
+    if length is not None and size != length:
+        raise IOError('Download of {url} ended after {size} of {length} bytes'.format(url=url, size=size,
+                                                                                     length=length))
+
+
+def total_length(status, headers):
+    """
+    Get the full size of the requested file from a (possibly partial) response
+
+    Args:
+        status(int): Response status
+        headers(Mapping): Response headers
+
+    Returns:
+        int|None
+    """
+    content_range = headers.get('content-range')
+
+    # "bytes 100-199/200" for partial content or "bytes */200" for an unsatisfiable range
+    if content_range and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1].strip()
+        return int(total) if total.isdigit() else None
+
+    if status == 416:
+        return None
+
+    length = headers.get('content-length')
+    return int(length) if length is not None else None
+
+
+def _remove(*paths):
+    """
+    Delete any of the given files that exist
+    """
+    for path in paths:
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+# Reserved characters that are replaced with an underscore
+_BAD_CHARS = re.compile(r'[?:<>|*"/]' if os.sep == '/' else r'[?:<>/|*"\\]')
+
+# Leading and trailing dots and spaces, or an empty name. `$` also matches just before a trailing newline
+_BAD_EDGES = re.compile(r'^\.|\.$|^ | $|^$')
+_BAD_NAMES = re.compile(r'(aux|com[1-9]|con|lpt[1-9]|prn)(\.|$)')
+
+# Dots directly in front of a backslash
+_DOTS_BEFORE_BACKSLASH = re.compile(r'\.+(?=\\)')
+
+
+class _ControlCharacters(dict):
+    """
+    str.translate() table deleting unicode control characters (category C). Filled in as characters are first seen
+    """
+    def __missing__(self, code):
+        self[code] = None if unicodedata.category(chr(code))[0] == 'C' else code
+        return self[code]
+
+
+_CONTROL_CHARS_TABLE = _ControlCharacters()
 
 
 def sanitize_filename(name):
@@ -77,39 +378,51 @@ def sanitize_filename(name):
     if isinstance(name, int):
         return str(name)
 
-    if os.sep == '/':
-        bad_chars = re.compile(r'^\.|\.$|^ | $|^$|\?|:|<|>|\||\*|\"|/')
-    else:
-        bad_chars = re.compile(r'^\.|\.$|^ | $|^$|\?|:|<|>|/|\||\*|\"|\\')
+    return _sanitize_filename(name)
+
 
-    bad_names = re.compile(r'(aux|com[1-9]|con|lpt[1-9]|prn)(\.|$)')
+@lru_cache(maxsize=4096)
+def _sanitize_filename(name):
+    """
+    sanitize_filename() for strings. The same blog names and photoset titles come up for many files in a row, so the
+    results are memoized
+
+    Args:
+        name(str)
 
+    Returns:
+        str
+    """
     # Unescape '&amp;', '&lt;', and '&gt;'
     name = html.unescape(name)
 
     # Replace bad characters with an underscore
-    name = bad_chars.sub('_', name)
-    if bad_names.match(name):
+    if not name or name[0] in '. ' or name[-1] in '. \n':
+        name = _BAD_EDGES.sub('_', name)
+
+    if _BAD_NAMES.match(name):
         name = '_' + name
 
-    # Replace newlines with spaces
-    name = name.replace("\r", '')
-    name = name.replace("\n", ' ')
+    # Drop carriage returns. Of the replacements left, only removing dots in front of a backslash changes the length,
+    # so long captions can usually be cut to 125 characters up front
+    name = name.replace('\r', '')
+    if '.\\' not in name:
+        name = name[:125]
 
-    # Yavos (?)
-    while name.find('.\\') != -1:
-        name = name.replace('.\\', '\\')
+    name = _BAD_CHARS.sub('_', name)
 
-    name = name.replace('\\', os.sep)
+    # Replace newlines and tab characters with spaces
+    name = name.replace('\n', ' ').replace('\t', ' ')
 
-    # Replace tab characters with spaces
-    name = name.replace('\t', ' ')
+    # Yavos (?)
+    if '\\' in name:
+        name = _DOTS_BEFORE_BACKSLASH.sub('', name).replace('\\', os.sep)
 
     # Cut to 125 characters
-    if len(name) > 125:
-        name = name[:125]
+    name = name[:125]
 
-    # Remove unicode control characters
-    name = ''.join(char for char in name if unicodedata.category(char)[0] != "C")
+    # Remove unicode control characters. Printable strings never contain any
+    if not name.isprintable():
+        name = name.translate(_CONTROL_CHARS_TABLE)
 
     return name.strip()
@@ -0,0 +1,61 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from tumdlr import metrics
+
+# Number of video extractions allowed to run at the same time
+WORKERS = 4
+
+_executor = None
+_executor_lock = threading.Lock()
+_local = threading.local()
+
+
+def extract_info(url):
+    """
+    Schedule a video metadata extraction on the extractor worker pool
+
+    Args:
+        url(str): Video (or post) URL
+
+    Returns:
+        concurrent.futures.Future: Resolves to the youtube-dl info dict
+    """
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=WORKERS)
+
+    return _executor.submit(_extract, url)
+
+
+def _extract(url):
+    """
+    Run an extraction using the calling worker's extractor instance
+
+    YoutubeDL instances aren't safe to share between threads, so each worker builds one on first use and reuses it
+    for every extraction after that. youtube-dl itself is only imported then too, as loading its extractors takes
+    longer than everything else tumdlr imports put together and photo-only runs never need it.
+
+    Args:
+        url(str)
+
+    Returns:
+        dict
+    """
+    ydl = getattr(_local, 'ydl', None)
+    if ydl is None:
+        from youtube_dl import YoutubeDL
+
+        logging.getLogger('tumdlr.extractor').debug('Creating a YoutubeDL instance for %s',
+                                                    threading.current_thread().name)
+        ydl = _local.ydl = YoutubeDL({'quiet': True, 'no_warnings': True})
+
+    try:
+        with metrics.timer('video_extraction'):
+            return ydl.extract_info(url, False)
+    except Exception:
+        metrics.count('video_extraction_errors')
+        raise
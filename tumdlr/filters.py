@@ -0,0 +1,111 @@
+import calendar
+from datetime import datetime
+
+# Accepted date formats, always read as UTC (Tumblr's post dates are GMT)
+DATE_FORMATS = ('%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%dT%H:%M')
+
+
+def parse_date(value):
+    """
+    Args:
+        value(str|int): A date, a date and time, or a UNIX timestamp
+
+    Returns:
+        int: UNIX timestamp
+
+    Raises:
+        ValueError: The value isn't in any of the accepted formats
+    """
+    if isinstance(value, int) or str(value).strip().isdigit():
+        return int(value)
+
+    for date_format in DATE_FORMATS:
+        try:
+            return calendar.timegm(datetime.strptime(value.strip(), date_format).timetuple())
+        except ValueError:
+            continue
+
+    raise ValueError('{!r} is not a date (YYYY-MM-DD), date and time (YYYY-MM-DD HH:MM:SS) or UNIX timestamp'
+                     .format(value))
+
+
+class PostFilter:
+    """
+    Selects the posts to archive by publication date, tags and note count.
+
+    Filters are applied as early as they can be. A single tag and the upper date bound are passed on to the API, so
+    posts outside of them aren't even sent. Everything else is checked against the raw API data before any post
+    container is built. Since the API returns posts newest first, the first post published before the lower date
+    bound ends the pagination.
+    """
+    __slots__ = ('since', 'until', 'tags', 'min_notes')
+
+    def __init__(self, since=None, until=None, tags=(), min_notes=None):
+        """
+        Args:
+            since(Optional[int]): Only keep posts published at or after this UNIX timestamp
+            until(Optional[int]): Only keep posts published before this UNIX timestamp
+            tags(Iterable[str]): Only keep posts with at least one of these tags (compared case insensitively)
+            min_notes(Optional[int]): Only keep posts with at least this many notes
+        """
+        self.since      = since
+        self.until      = until
+        self.tags       = frozenset(tag.lower() for tag in tags)
+        self.min_notes  = min_notes
+
+    def __bool__(self):
+        return any((self.since, self.until, self.tags, self.min_notes))
+
+    def api_query(self):
+        """
+        Returns:
+            dict: API query parameters doing part of the filtering server side
+        """
+        query = {}
+
+        if len(self.tags) == 1:
+            query['tag'] = next(iter(self.tags))
+
+        if self.until:
+            query['before'] = str(self.until)
+
+        return query
+
+    def accepts(self, post):
+        """
+        Args:
+            post(dict): Raw post data from the API
+
+        Returns:
+            bool: The post should be archived
+        """
+        timestamp = post.get('timestamp')
+
+        if timestamp:
+            if self.since and timestamp < self.since:
+                return False
+
+            if self.until and timestamp >= self.until:
+                return False
+
+        if self.min_notes and (post.get('note_count') or 0) < self.min_notes:
+            return False
+
+        if self.tags and not self.tags.intersection(tag.lower() for tag in post.get('tags', ())):
+            return False
+
+        return True
+
+    def ended(self, timestamp):
+        """
+        Args:
+            timestamp(Optional[int]): Publication time of a post
+
+        Returns:
+            bool: The post was published before the lower date bound, so every post after it will be as well
+        """
+        return bool(self.since and timestamp and timestamp < self.since)
+
+    def __repr__(self):
+        return "<PostFilter since='{s}' until='{u}' tags='{t}' min_notes='{n}'>"\
+            .format(s=self.since, u=self.until, t=','.join(sorted(self.tags)), n=self.min_notes)
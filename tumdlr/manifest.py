@@ -0,0 +1,241 @@
+import json
+import logging
+import os
+import tempfile
+import threading
+
+from tumdlr.downloader import sanitize_filename
+
+# File extension of manifests
+MANIFEST_EXT = '.jsonl'
+
+
+class Manifest:
+    """
+    Per-blog record of the archived posts and where their files were saved.
+
+    A manifest is a JSON lines file. The first line describes the blog, every line after that describes one post: its
+    ID, type, date, tags and caption, and the URL and local path of each of its files along with everything needed to
+    plan the file's path again (category, photoset page number, video extension). That's enough to rebuild the whole
+    directory layout without the API, see the reorganize command.
+
+    Each run appends the posts it archived, and a post is written as soon as all of its files have been reported.
+    When a post shows up more than once, the line written last wins and the files of both lines are merged. Manifests
+    that have grown mostly redundant are compacted when they are closed.
+    """
+    # Compact the manifest when it holds this many lines per distinct post
+    COMPACT_RATIO = 2
+
+    def __init__(self, path, blog=None, url=None):
+        """
+        Args:
+            path(str): Manifest file
+            blog(Optional[str]): Blog name, when writing
+            url(Optional[str]): Blog URL, when writing
+        """
+        self.log = logging.getLogger('tumdlr.manifest')
+
+        self.path   = path
+        self.blog   = blog
+        self.url    = url
+
+        self._pending   = {}    # Post ID => [post, file entries, files still to be reported]
+        self._file      = None
+        self._lock      = threading.Lock()
+
+    @staticmethod
+    def directory(config):
+        """
+        Args:
+            config(configparser.ConfigParser): Tumdlr configuration
+
+        Returns:
+            str: Directory the manifests are kept in
+        """
+        tumdlr = config['Tumdlr']
+        return os.path.expanduser(tumdlr.get('Manifests') or os.path.join(tumdlr.get('SavePath', ''), '.tumdlr'))
+
+    @classmethod
+    def for_blog(cls, config, name, url=None):
+        """
+        Args:
+            config(configparser.ConfigParser): Tumdlr configuration
+            name(str): Blog name
+            url(Optional[str]): Blog URL
+
+        Returns:
+            Manifest
+        """
+        return cls(os.path.join(cls.directory(config), sanitize_filename(name) + MANIFEST_EXT), name, url)
+
+    def post(self, post):
+        """
+        Start recording a post. It is written once all of its files have been reported
+
+        Args:
+            post(tumdlr.containers.TumblrPost)
+        """
+        with self._lock:
+            self._pending[post.id] = [post, [], len(post.files)]
+
+        if not post.files:
+            self._complete(post.id)
+
+    def file(self, file, path=None):
+        """
+        Report the outcome of a file download
+
+        Args:
+            file(tumdlr.containers.TumblrFile)
+            path(Optional[str]): Path the file was saved to, None if the download failed
+        """
+        post_id = file.container.id
+
+        with self._lock:
+            pending = self._pending.get(post_id)
+            if pending is None:
+                return
+
+            if path is not None:
+                pending[1].append(file.manifest_entry(path))
+
+            pending[2] -= 1
+            if pending[2] > 0:
+                return
+
+        self._complete(post_id)
+
+    def close(self):
+        """
+        Write the posts that still have files outstanding, then compact the manifest if it has grown redundant
+        """
+        for post_id in list(self._pending):
+            self._complete(post_id)
+
+        if self._file is None:
+            return
+
+        self._file.close()
+        self._file = None
+
+        records = self.records()
+        if self._lines() >= self.COMPACT_RATIO * max(1, len(records)):
+            self.log.info('Compacting %s', self.path)
+            self.rewrite(records)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def records(self):
+        """
+        Read the manifest, merging the lines of posts recorded more than once. Also loads the blog name and URL
+
+        Returns:
+            list[dict]: Post records, in the order they were first recorded
+        """
+        records = {}
+
+        if not os.path.isfile(self.path):
+            return []
+
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for number, line in enumerate(file, 1):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A run that was killed may have left half a line behind
+                    self.log.warning('Skipping unreadable line %d of %s', number, self.path)
+                    continue
+
+                if 'blog' in record:
+                    self.blog, self.url = record['blog'], record.get('url')
+                    continue
+
+                previous = records.get(record['id'])
+                if previous is not None:
+                    files = {entry['url']: entry for entry in previous['files']}
+                    files.update((entry['url'], entry) for entry in record['files'])
+                    record['files'] = list(files.values())
+
+                records[record['id']] = record
+
+        return list(records.values())
+
+    def rewrite(self, records):
+        """
+        Replace the manifest with the given post records
+
+        Args:
+            records(list[dict])
+        """
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, 0o755, True)
+
+        fd, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as file:
+                file.write(self._header())
+                for record in records:
+                    file.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+            os.replace(temp, self.path)
+        except OSError:
+            os.unlink(temp)
+            raise
+
+    def _complete(self, post_id):
+        with self._lock:
+            pending = self._pending.pop(post_id, None)
+            if pending is None:
+                return
+
+            post, files, __ = pending
+            line = json.dumps(self._record(post, files), ensure_ascii=False) + '\n'
+
+            if self._file is None:
+                new = not os.path.isfile(self.path)
+                os.makedirs(os.path.dirname(self.path) or '.', 0o755, True)
+
+                self._file = open(self.path, 'a', encoding='utf-8')
+                if new:
+                    self._file.write(self._header())
+
+            self._file.write(line)
+
+    @staticmethod
+    def _record(post, files):
+        """
+        Returns:
+            dict: Manifest record of a post
+        """
+        caption = None
+
+        try:
+            if post.is_photo:
+                caption = post.title
+            elif post.is_video and files:
+                caption = post.description
+        except Exception:
+            # Video metadata that couldn't be extracted, nothing was saved for the post anyway
+            pass
+
+        return {
+            'id': post.id,
+            'type': post.type,
+            'date': post.post_date,
+            'timestamp': post.timestamp,
+            'url': str(post),
+            'tags': list(post.tags),
+            'caption': caption,
+            'files': files
+        }
+
+    def _header(self):
+        return json.dumps({'blog': self.blog, 'url': self.url}) + '\n'
+
+    def _lines(self):
+        with open(self.path, 'rb') as file:
+            return sum(1 for __ in file) - 1
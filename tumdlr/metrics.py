@@ -0,0 +1,270 @@
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Instruments recorded by tumdlr, with their descriptions for the Prometheus export
+TIMERS = {
+    'api_request':          'Time spent waiting for API pages',
+    'api_decode':           'Time spent decoding API responses',
+    'api_parse':            'Time spent building post containers from API responses',
+    'video_extraction':     'Time spent extracting video metadata with youtube-dl',
+    'download':             'Time spent transferring files',
+}
+
+COUNTERS = {
+    'api_pages':                'API pages fetched from the API',
+    'api_cache_hits':           'API pages served from the response cache',
+    'posts_parsed':             'Posts parsed from API responses',
+    'downloads_saved':          'Files downloaded',
+    'downloads_skipped':        'Files already downloaded by an earlier run',
+    'downloads_linked':         'Files linked to an already downloaded copy of the same media',
+    'download_errors':          'Failed file downloads',
+    'download_bytes':           'Bytes downloaded',
+    'video_extraction_errors':  'Failed video metadata extractions',
+}
+
+
+class Metrics:
+    """
+    Timers and counters for the hot paths of a run.
+
+    Timers keep the number of observations along with their total, minimum and maximum duration. Counters are plain
+    totals. Everything is updated under a single lock and only once per API page or file, never per chunk, so the
+    instrumentation costs next to nothing. The collected data can be rendered as a summary for the terminal, as JSON
+    or in the Prometheus text exposition format.
+    """
+    def __init__(self):
+        self.started = time.time()
+
+        self._timers    = {}    # name => [count, total, minimum, maximum]
+        self._counters  = {}
+        self._lock      = threading.Lock()
+
+    def count(self, name, value=1):
+        """
+        Args:
+            name(str): Counter name
+            value(int): Amount to add
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        """
+        Args:
+            name(str): Timer name
+            seconds(float): Duration of the observation
+        """
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                self._timers[name] = [1, seconds, seconds, seconds]
+                return
+
+            timer[0] += 1
+            timer[1] += seconds
+            timer[2] = min(timer[2], seconds)
+            timer[3] = max(timer[3], seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Time the body of a with statement, whether it raises or not
+
+        Args:
+            name(str): Timer name
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def reset(self):
+        with self._lock:
+            self._timers.clear()
+            self._counters.clear()
+            self.started = time.time()
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: Counters and timers collected so far
+        """
+        with self._lock:
+            timers = {
+                name: {'count': count, 'seconds': round(total, 6), 'mean': round(total / count, 6),
+                       'min': round(minimum, 6), 'max': round(maximum, 6)}
+                for name, (count, total, minimum, maximum) in self._timers.items()
+            }
+
+            return {
+                'elapsed': round(time.time() - self.started, 3),
+                'counters': dict(self._counters),
+                'timers': timers
+            }
+
+    def to_json(self):
+        """
+        Returns:
+            str
+        """
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self, prefix='tumdlr'):
+        """
+        Render the metrics in the Prometheus text exposition format, e.g. for the node_exporter textfile collector.
+        Timers are exported as summaries, counters as counters
+
+        Args:
+            prefix(str): Metric name prefix
+
+        Returns:
+            str
+        """
+        snapshot = self.snapshot()
+        lines = []
+
+        for name, timer in sorted(snapshot['timers'].items()):
+            metric = '{}_{}_seconds'.format(prefix, name)
+            lines += [
+                '# HELP {} {}'.format(metric, TIMERS.get(name, name)),
+                '# TYPE {} summary'.format(metric),
+                '{}_count {}'.format(metric, timer['count']),
+                '{}_sum {}'.format(metric, timer['seconds']),
+            ]
+
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = '{}_{}_total'.format(prefix, name)
+            lines += [
+                '# HELP {} {}'.format(metric, COUNTERS.get(name, name)),
+                '# TYPE {} counter'.format(metric),
+                '{} {}'.format(metric, value),
+            ]
+
+        metric = '{}_run_seconds'.format(prefix)
+        lines += ['# HELP {} Duration of the run'.format(metric), '# TYPE {} gauge'.format(metric),
+                  '{} {}'.format(metric, snapshot['elapsed'])]
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """
+        Returns:
+            list[str]: Human readable summary of where the time went
+        """
+        from humanize import naturalsize
+
+        snapshot = self.snapshot()
+        counters = snapshot['counters']
+        lines = []
+
+        for name, timer in sorted(snapshot['timers'].items(), key=lambda item: -item[1]['seconds']):
+            lines.append('{:<18} {:7d} x {:>10}  mean {:>10}  max {:>10}'.format(
+                name, timer['count'], _duration(timer['seconds']), _duration(timer['mean']), _duration(timer['max'])
+            ))
+
+        for name, value in sorted(counters.items()):
+            lines.append('{:<24} {:>12}'.format(name, naturalsize(value) if name.endswith('bytes') else value))
+
+        transferred, transfer_time = counters.get('download_bytes', 0), snapshot['timers'].get('download')
+        if transferred and transfer_time:
+            lines.append('Throughput: {}/s per transfer, {}/s overall in {}'.format(
+                naturalsize(transferred / max(transfer_time['seconds'], 0.001)),
+                naturalsize(transferred / max(snapshot['elapsed'], 0.001)),
+                _duration(snapshot['elapsed'])
+            ))
+
+        return lines
+
+    def write(self, path):
+        """
+        Export the metrics to a file, as JSON if its name ends in .json and in the Prometheus text format otherwise
+
+        Args:
+            path(str)
+        """
+        content = self.to_json() if path.lower().endswith('.json') else self.to_prometheus()
+
+        with open(path, 'w') as file:
+            file.write(content)
+
+
+class Profiler:
+    """
+    cProfile for every thread of a run.
+
+    cProfile only profiles the thread it is enabled in, but most of a run happens in the pager, download and
+    extractor worker threads. Each thread started while profiling gets a profiler of its own, and all of them are
+    merged into a single dump at the end. Python versions where one profiler already sees every thread simply keep
+    the first one.
+    """
+    def __init__(self):
+        self._profiles  = []
+        self._lock      = threading.Lock()
+
+    def start(self):
+        threading.setprofile(self._thread_started)
+        self._enable()
+
+    def stop(self, path):
+        """
+        Stop profiling and write the merged profile to a file, to be read with pstats or a viewer like snakeviz
+
+        Args:
+            path(str)
+        """
+        import pstats
+
+        threading.setprofile(None)
+        stats = None
+
+        with self._lock:
+            for profile in self._profiles:
+                profile.disable()
+
+                if stats is None:
+                    stats = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+
+            self._profiles = []
+
+        if stats is not None:
+            stats.dump_stats(path)
+
+    def _enable(self):
+        import cProfile
+
+        profile = cProfile.Profile()
+
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is already active and already sees this thread, drop the hook that brought us here
+            sys.setprofile(None)
+            return
+
+        with self._lock:
+            self._profiles.append(profile)
+
+    def _thread_started(self, frame, event, arg):
+        # Called on the first event of every new thread, enabling its profiler replaces this hook
+        self._enable()
+
+
+def _duration(seconds):
+    if seconds >= 1:
+        return '{:.2f} s'.format(seconds)
+
+    return '{:.1f} ms'.format(seconds * 1000)
+
+
+# Metrics of the current run
+REGISTRY = Metrics()
+
+count   = REGISTRY.count
+observe = REGISTRY.observe
+timer   = REGISTRY.timer
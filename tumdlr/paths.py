@@ -0,0 +1,218 @@
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from hashlib import md5
+from itertools import chain, count
+
+from yurl import URL
+
+from tumdlr.downloader import sanitize_filename
+
+
+class PathPlanner:
+    """
+    Works out where downloaded files are saved for the length of a run.
+
+    The save path and categorization settings are read from the configuration once, the directory for each blog,
+    category and photoset is built once, and directories are only created the first time a file is saved to them.
+    Only plain values (names, IDs, captions and URLs) are taken, so paths can be planned from stored metadata as
+    well as from live post containers.
+
+    Posts sharing a caption would otherwise be saved to the same path and overwrite each other. The first media URL
+    to claim a path keeps it and any other URL gets the post ID appended to its filename. Paths saved to by earlier
+    runs stay with the URL recorded for them. A file found on disk with no record of its URL (saved by an older
+    version, with another database, or by a run that was cut short) goes to the first URL planned to it, and the
+    downloader decides whether it can be kept.
+    """
+    def __init__(self, save_path='', by_user=True, by_type=True, by_photoset=True, owner=None):
+        """
+        Args:
+            save_path(str): Base directory for all downloads
+            by_user(bool): Save each blog into its own directory
+            by_type(bool): Save photos and videos into separate directories
+            by_photoset(bool): Save the photos of each photoset into their own directory
+            owner(Optional[Callable[[str], Optional[str]]]): Looks up the media URL an earlier run saved to a path
+        """
+        self.log = logging.getLogger('tumdlr.paths')
+
+        self.save_path      = save_path
+        self.by_user        = by_user
+        self.by_type        = by_type
+        self.by_photoset    = by_photoset
+        self.owner          = owner
+
+        self._directories   = {}
+        self._created       = set()
+        self._claims        = {}
+        self._writers       = {}    # Path => [lock, number of threads holding or waiting for it]
+        self._lock          = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config, owner=None):
+        """
+        Build a planner from the [Tumdlr] and [Categorization] configuration sections
+
+        Args:
+            config(configparser.ConfigParser): Tumdlr configuration
+            owner(Optional[Callable[[str], Optional[str]]]): Looks up the media URL an earlier run saved to a path
+
+        Returns:
+            PathPlanner
+        """
+        categorization = config['Categorization']
+
+        return cls(
+            save_path=config['Tumdlr'].get('SavePath', ''),
+            by_user=categorization.getboolean('User', True),
+            by_type=categorization.getboolean('PostType', True),
+            by_photoset=categorization.getboolean('Photosets', True),
+            owner=owner
+        )
+
+    def directory(self, blog, category, photoset=None):
+        """
+        Args:
+            blog(str): Blog name
+            category(str): File category, e.g. photos or videos
+            photoset(Optional[int]): Post ID of the photoset the file belongs to
+
+        Returns:
+            str
+        """
+        key = (blog, category, photoset if self.by_photoset else None)
+
+        try:
+            return self._directories[key]
+        except KeyError:
+            pass
+
+        parts = [self.save_path]
+
+        if self.by_user:
+            parts.append(sanitize_filename(blog))
+
+        if self.by_type:
+            parts.append(category)
+
+        if key[2] is not None:
+            parts.append(sanitize_filename(str(photoset)))
+
+        directory = os.path.join(*parts)
+        self.log.debug('Directory planned: %s', directory)
+
+        self._directories[key] = directory
+        return directory
+
+    def photo_path(self, blog, post_id, caption, url, page_no=False, category='photos'):
+        """
+        Args:
+            blog(str): Blog name
+            post_id(int): Post ID
+            caption(str): Photo caption
+            url(str): Photo URL
+            page_no(int|False): Page number within a photoset, or False for a single photo
+            category(str): File category
+
+        Returns:
+            str
+        """
+        directory = self.directory(blog, category, post_id if page_no else None)
+
+        if page_no:
+            name = sanitize_filename('p{pn}_{pt}'.format(pn=page_no, pt=caption))
+        else:
+            name = sanitize_filename(caption)
+
+        return self.claim(os.path.join(directory, name), os.path.splitext(url)[1], url, post_id)
+
+    def video_path(self, blog, post_id, description, url, ext='mp4', category='videos'):
+        """
+        Args:
+            blog(str): Blog name
+            post_id(int): Post ID
+            description(Optional[str]): Video description
+            url(str): Video URL
+            ext(str): File extension, without the dot
+            category(str): File category
+
+        Returns:
+            str
+        """
+        name = sanitize_filename(description or md5(url.encode('utf-8')).hexdigest())
+        return self.claim(os.path.join(self.directory(blog, category), name), '.' + ext, url, post_id)
+
+    def claim(self, base, ext, url, post_id):
+        """
+        Reserve a path for a media URL. A path already claimed by another URL, during this run or an earlier one,
+        gets the post ID (and if need be a counter) appended
+
+        Args:
+            base(str): Path without the file extension
+            ext(str): File extension, including the dot
+            url(str): Media URL the path is for
+            post_id(int): Post ID, used to tell colliding files apart
+
+        Returns:
+            str
+        """
+        candidates = chain(
+            [base + ext, '{} ({}){}'.format(base, post_id, ext)],
+            ('{} ({}_{}){}'.format(base, post_id, number, ext) for number in count(2))
+        )
+
+        with self._lock:
+            for path in candidates:
+                owner = self._claims.get(path)
+                if owner is None:
+                    owner = self._claims[path] = (self.owner(path) if self.owner else None) or url
+
+                if owner == url or _same_url(owner, url):
+                    return path
+
+                self.log.info('%s is already used by %s, trying another name for %s', path, owner, url)
+
+    @contextmanager
+    def writing(self, path):
+        """
+        Hold the path exclusively while a file is saved to it. Reblogs of the same media get the same path, and two
+        workers downloading to it at once would trample each other's partial download
+
+        Args:
+            path(str)
+        """
+        with self._lock:
+            writer = self._writers.setdefault(path, [threading.Lock(), 0])
+            writer[1] += 1
+
+        try:
+            with writer[0]:
+                yield
+        finally:
+            with self._lock:
+                writer[1] -= 1
+                if not writer[1]:
+                    del self._writers[path]
+
+    def makedirs(self, directory):
+        """
+        Create a directory (and its parents) unless it has been created during this run already
+
+        Args:
+            directory(str)
+        """
+        if not directory or directory in self._created:
+            return
+
+        os.makedirs(directory, 0o755, True)
+        self._created.add(directory)
+
+
+def _same_url(first, second):
+    """
+    Compare URLs the way they're recorded in the archive database, e.g. with the host in lower case
+    """
+    try:
+        return URL(first).as_string() == URL(second).as_string()
+    except Exception:
+        return False
@@ -0,0 +1,132 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class DownloadPool:
+    """
+    Bounded worker pool for concurrent file downloads.
+
+    At most `jobs` downloads are kept in flight at any time, and at most `per_host` of those may target the same
+    host. A file only takes a worker once its host has a free slot, so workers are never tied up waiting for one.
+    Results are handed back in the order the files were submitted, regardless of which download finishes first.
+    """
+    def __init__(self, jobs=1, per_host=None):
+        """
+        Args:
+            jobs(int): Maximum number of downloads in flight
+            per_host(Optional[int]): Maximum number of concurrent downloads per host
+        """
+        self.log = logging.getLogger('tumdlr.pool')
+
+        self.jobs       = max(1, int(jobs))
+        self.per_host   = max(1, int(per_host)) if per_host else self.jobs
+
+        self._executor      = ThreadPoolExecutor(max_workers=self.jobs)
+        self._slots         = threading.BoundedSemaphore(self.jobs)
+        self._hosts         = {}
+        self._hosts_lock    = threading.Lock()
+        self._pending       = deque()
+
+    def submit(self, file, context, **kwargs):
+        """
+        Queue a file for download, blocking while its host or the pool is already saturated
+
+        Args:
+            file(tumdlr.containers.TumblrFile): File to download
+            context(tumdlr.__main__.Context): CLI request context
+            kwargs(dict): Additional arguments to send with the download request
+        """
+        # Videos are only served from their real host once the extraction has finished
+        try:
+            if hasattr(file, 'resolve'):
+                file.resolve()
+        except Exception as e:
+            future = Future()
+            future.set_exception(e)
+            self._pending.append((file, future))
+            return
+
+        host = self._host_slot(file.url.host)
+        host.acquire()
+
+        try:
+            self._slots.acquire()
+        except BaseException:
+            host.release()
+            raise
+
+        try:
+            future = self._executor.submit(file.download, context, **kwargs)
+        except BaseException:
+            self._slots.release()
+            host.release()
+            raise
+
+        future.add_done_callback(lambda f: self._release(host))
+        self._pending.append((file, future))
+
+    def completed(self):
+        """
+        Collect finished downloads without blocking, stopping at the first one still in progress
+
+        Yields:
+            tuple[tumdlr.containers.TumblrFile, str, Exception]: The file, its saved path and the download error (if
+                any)
+        """
+        while self._pending and self._pending[0][1].done():
+            yield self._result(*self._pending.popleft())
+
+    def join(self):
+        """
+        Wait for every queued download to finish
+
+        Yields:
+            tuple[tumdlr.containers.TumblrFile, str, Exception]: The file, its saved path and the download error (if
+                any)
+        """
+        while self._pending:
+            yield self._result(*self._pending.popleft())
+
+    def shutdown(self, wait=True):
+        """
+        Args:
+            wait(bool): Block until all running downloads have finished
+        """
+        self._executor.shutdown(wait)
+
+    def _release(self, host):
+        """
+        Give back the worker and host slots of a finished download
+
+        Args:
+            host(threading.BoundedSemaphore): Slot of the file's host
+        """
+        self._slots.release()
+        host.release()
+
+    def _host_slot(self, host):
+        """
+        Args:
+            host(str)
+
+        Returns:
+            threading.BoundedSemaphore
+        """
+        with self._hosts_lock:
+            if host not in self._hosts:
+                self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+
+            return self._hosts[host]
+
+    @staticmethod
+    def _result(file, future):
+        error = future.exception()
+        return file, (None if error else future.result()), error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown(exc_type is None)
@@ -0,0 +1,355 @@
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+
+import click
+from humanize import naturalsize
+
+# Event types
+POST        = 'post'
+START       = 'start'
+ADVANCE     = 'advance'
+SAVED       = 'saved'
+SKIPPED     = 'skipped'
+FAILED      = 'failed'
+MESSAGE     = 'message'
+
+_STOP = object()
+
+
+class Progress:
+    """
+    Download progress reporting, kept out of the download loop.
+
+    Downloads and commands report what happens by calling the event methods below from any thread. Each call only
+    puts a small tuple on a queue. A single renderer thread takes the events off the queue, keeps the running totals
+    and hands them to a renderer, which redraws at its own fixed refresh rate no matter how many downloads are
+    running::
+
+        with Progress.create('auto') as progress:
+            download(url, filename, progress=progress)
+    """
+    def __init__(self, renderer):
+        """
+        Args:
+            renderer(TerminalRenderer|JsonRenderer|QuietRenderer)
+        """
+        self.renderer = renderer
+
+        self.posts          = 0
+        self.total_posts    = None  # type: int
+        self.saved          = 0
+        self.skipped        = 0
+        self.failed         = 0
+        self.bytes          = 0
+        self.active         = {}    # URL => [filename, bytes received, total bytes]
+        self.started        = time.monotonic()
+
+        self._events = queue.SimpleQueue()
+        self._thread = None  # type: threading.Thread
+
+    @classmethod
+    def create(cls, mode='auto'):
+        """
+        Args:
+            mode(str): auto (terminal output), json (JSON lines on standard output) or quiet (no output)
+
+        Returns:
+            Progress
+        """
+        return cls(RENDERERS[mode]())
+
+    @property
+    def elapsed(self):
+        """
+        Returns:
+            float: Seconds since reporting started
+        """
+        return time.monotonic() - self.started
+
+    def open(self):
+        """
+        Start the renderer thread
+
+        Returns:
+            Progress
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='tumdlr-progress', daemon=True)
+            self._thread.start()
+
+        return self
+
+    def close(self):
+        """
+        Render the remaining events and the final summary, then stop the renderer thread
+        """
+        if self._thread is not None:
+            self._events.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def post(self, post, total=None):
+        """
+        A post has been enumerated
+
+        Args:
+            post(tumdlr.containers.TumblrPost)
+            total(Optional[int]): Number of posts expected
+        """
+        self._events.put((POST, post.id, {'type': post.type, 'url': str(post), 'total': total}))
+
+    def start(self, url, filename, size=None, resumed=0, content_type=None):
+        """
+        A download has started
+
+        Args:
+            url(str): Download URL
+            filename(str): Path the file is saved to
+            size(Optional[int]): Full size of the file in bytes, if known
+            resumed(int): Number of bytes already on disk from an earlier attempt
+            content_type(Optional[str]): MIME type of the file
+        """
+        self._events.put((START, url, {'path': filename, 'size': size, 'resumed': resumed, 'type': content_type}))
+
+    def advance(self, url, size):
+        """
+        Bytes have been written to a download in progress
+
+        Args:
+            url(str): Download URL
+            size(int): Number of bytes written
+        """
+        self._events.put((ADVANCE, url, size))
+
+    def done(self, url, filename):
+        """
+        A download has been saved
+
+        Args:
+            url(str): Download URL
+            filename(str): Path the file was saved to
+        """
+        self._events.put((SAVED, url, {'path': filename}))
+
+    def skip(self, url, filename, reason):
+        """
+        A file didn't have to be downloaded
+
+        Args:
+            url(str): Download URL
+            filename(str): Path of the existing file
+            reason(str): exists (downloaded by an earlier run) or duplicate (linked to a copy of the same media)
+        """
+        self._events.put((SKIPPED, url, {'path': filename, 'reason': reason}))
+
+    def fail(self, url, error):
+        """
+        A download has failed
+
+        Args:
+            url(str): Download URL
+            error(Exception)
+        """
+        self._events.put((FAILED, url, {'error': str(error)}))
+
+    def message(self, text, err=False, **data):
+        """
+        Report a message that isn't about a single file
+
+        Args:
+            text(str): Message for the terminal
+            err(bool): The message is an error
+            data(dict): Structured fields for machine readable output
+        """
+        self._events.put((MESSAGE, None, dict(data, message=text, err=err)))
+
+    def _run(self):
+        interval = self.renderer.interval
+        next_refresh = time.monotonic() + interval if interval else None
+
+        while True:
+            timeout = max(0.0, next_refresh - time.monotonic()) if next_refresh else None
+
+            try:
+                event = self._events.get(timeout=timeout)
+            except queue.Empty:
+                event = None
+
+            if event is _STOP:
+                break
+
+            if event is not None:
+                self._apply(*event)
+
+            if next_refresh and time.monotonic() >= next_refresh:
+                self.renderer.refresh(self)
+                next_refresh = time.monotonic() + interval
+
+        self.renderer.close(self)
+
+    def _apply(self, kind, key, data):
+        """
+        Update the running totals with an event and pass it on to the renderer
+        """
+        # Byte counts are only aggregated, they're rendered with the next refresh
+        if kind == ADVANCE:
+            self.bytes += data
+            if key in self.active:
+                self.active[key][1] += data
+
+            return
+
+        if kind == POST:
+            self.posts += 1
+            self.total_posts = data.pop('total') or self.total_posts
+        elif kind == START:
+            self.active[key] = [data['path'], data['resumed'], data['size']]
+        elif kind == SAVED:
+            self.active.pop(key, None)
+            self.saved += 1
+        elif kind == SKIPPED:
+            self.active.pop(key, None)
+            self.skipped += 1
+        elif kind == FAILED:
+            self.active.pop(key, None)
+            self.failed += 1
+
+        self.renderer.event(kind, key, data, self)
+
+    def summary(self):
+        """
+        Returns:
+            dict: Running totals
+        """
+        return {
+            'posts': self.posts,
+            'saved': self.saved,
+            'skipped': self.skipped,
+            'failed': self.failed,
+            'active': len(self.active),
+            'bytes': self.bytes,
+            'seconds': round(self.elapsed, 2)
+        }
+
+
+class TerminalRenderer:
+    """
+    Prints a line for every saved, skipped or failed file. When writing to a terminal, a status line with the overall
+    progress and the downloads in flight is kept at the bottom and redrawn a few times per second
+    """
+    interval = 0.2
+
+    def __init__(self):
+        self.live = click.get_text_stream('stdout').isatty()
+        self._drawn = False
+
+    def event(self, kind, key, data, progress):
+        if kind == SAVED:
+            line, err = '{} {}'.format(click.style('Saved:', bold=True), data['path']), False
+        elif kind == SKIPPED:
+            label = 'Linked duplicate:' if data['reason'] == 'duplicate' else 'Already downloaded:'
+            line, err = '{} {}'.format(click.style(label, bold=True), data['path']), False
+        elif kind == FAILED:
+            line, err = '{} {} ({})'.format(click.style('Failed:', bold=True, fg='red'), key, data['error']), True
+        elif kind == MESSAGE:
+            line, err = data['message'], data['err']
+        else:
+            return
+
+        self._clear()
+        click.echo(line, err=err)
+
+    def refresh(self, progress):
+        if not self.live:
+            return
+
+        posts = '{}/{}'.format(progress.posts, progress.total_posts) if progress.total_posts else progress.posts
+        status = '{} posts, {} saved, {} skipped, {} failed, {} at {}/s'.format(
+            posts, progress.saved, progress.skipped, progress.failed, naturalsize(progress.bytes),
+            naturalsize(progress.bytes / max(progress.elapsed, 0.001))
+        )
+
+        for filename, received, size in list(progress.active.values())[:3]:
+            percent = '{:.0%}'.format(received / size) if size else naturalsize(received)
+            status += ' | {} {}'.format(os.path.basename(filename)[:24], percent)
+
+        width = shutil.get_terminal_size().columns - 1
+        click.echo('\r\033[K' + status[:width], nl=False)
+        self._drawn = True
+
+    def close(self, progress):
+        self._clear()
+
+        if progress.posts or progress.saved or progress.skipped or progress.failed:
+            click.echo('{posts} posts, {saved} files saved, {skipped} skipped, {failed} failed, {size} in {seconds}s'
+                       .format(size=naturalsize(progress.bytes), **progress.summary()))
+
+    def _clear(self):
+        if self._drawn:
+            click.echo('\r\033[K', nl=False)
+            self._drawn = False
+
+
+class JsonRenderer:
+    """
+    Writes one JSON object per line to standard output for unattended runs: one for every post, file and message,
+    a snapshot of the running totals every few seconds and a final summary
+    """
+    interval = 5.0
+
+    def __init__(self):
+        self.stream = click.get_text_stream('stdout')
+
+    def event(self, kind, key, data, progress):
+        record = {'event': kind, 'time': round(time.time(), 3)}
+
+        if kind == POST:
+            record['id'] = key
+        elif kind != MESSAGE:
+            record['url'] = key
+
+        record.update(data)
+        self._write(record)
+
+    def refresh(self, progress):
+        self._write(dict(progress.summary(), event='progress', time=round(time.time(), 3)))
+
+    def close(self, progress):
+        self._write(dict(progress.summary(), event='summary', time=round(time.time(), 3)))
+
+    def _write(self, record):
+        self.stream.write(json.dumps(record) + '\n')
+        self.stream.flush()
+
+
+class QuietRenderer:
+    """
+    Renders nothing. Failures are still logged
+    """
+    interval = None
+
+    def event(self, kind, key, data, progress):
+        pass
+
+    def refresh(self, progress):
+        pass
+
+    def close(self, progress):
+        pass
+
+
+RENDERERS = {
+    'auto': TerminalRenderer,
+    'json': JsonRenderer,
+    'quiet': QuietRenderer
+}
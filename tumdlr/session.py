@@ -0,0 +1,56 @@
+import logging
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from tumdlr import __version__
+from tumdlr.throttle import Throttle, ThrottledSession
+
+
+def build_session(config, min_pool_size=0):
+    """
+    Build the HTTP session shared by the API client and the downloader
+
+    A single session means a single connection pool, so TCP/TLS connections to the API and media hosts are reused
+    across posts and files rather than being set up again for each of them. Every request made through it also goes
+    through the same rate limiter, see tumdlr.throttle.
+
+    Args:
+        config(configparser.ConfigParser): Tumdlr configuration
+        min_pool_size(int): Lower bound for the number of connections kept per host, e.g. the number of concurrent
+            downloads
+
+    Returns:
+        ThrottledSession
+    """
+    log = logging.getLogger('tumdlr.session')
+    connection = config['Connection'] if config.has_section('Connection') else {}
+
+    pool_connections    = int(connection.get('PoolConnections', 10))
+    pool_maxsize        = max(int(connection.get('PoolMaxSize', 10)), min_pool_size)
+    retries             = int(connection.get('Retries', 3))
+    keep_alive          = str(connection.get('KeepAlive', True)).lower() in ('1', 'yes', 'true', 'on')
+
+    log.debug('Building HTTP session (pools: %d, connections per host: %d, retries: %d, keep-alive: %s)',
+              pool_connections, pool_maxsize, retries, keep_alive)
+
+    # Connection errors are retried here, rate limiting and server errors are left to the throttle. urllib3 would
+    # otherwise retry responses carrying a Retry-After header itself, sleeping while it holds a throttle slot
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+        max_retries=Retry(total=retries, status=0, backoff_factor=0.5, status_forcelist=(), raise_on_status=False,
+                          respect_retry_after_header=False)
+    )
+
+    session = ThrottledSession(Throttle.from_config(config, max_concurrency=pool_maxsize))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    user_agent = config['Advanced']['UserAgent'] if config.has_section('Advanced') else 'tumdlr/{version}'
+    session.headers['User-Agent'] = user_agent.format(version=__version__)
+
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
+
+    return session
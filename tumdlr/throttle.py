@@ -0,0 +1,404 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+import weakref
+from contextlib import asynccontextmanager, contextmanager
+from email.utils import parsedate_to_datetime
+
+from requests import RequestException, Session
+
+# Responses that mean we're going too fast (or the server is struggling) and the request should be retried
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter. Allows bursts of up to `burst` requests, refilled at `rate` requests per second
+    """
+    def __init__(self, rate, burst=1):
+        """
+        Args:
+            rate(float): Requests per second. 0 disables the limit
+            burst(int): Bucket capacity
+        """
+        self.rate   = float(rate)
+        self.burst  = max(1, int(burst))
+
+        self._tokens    = float(self.burst)
+        self._updated   = time.monotonic()
+        self._lock      = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, blocking until one is available
+        """
+        while True:
+            wait = self.reserve()
+            if not wait:
+                return
+
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """
+        Take a token, waiting without blocking the event loop until one is available
+        """
+        while True:
+            wait = self.reserve()
+            if not wait:
+                return
+
+            await asyncio.sleep(wait)
+
+    def reserve(self):
+        """
+        Take a token if one is available
+
+        Returns:
+            float: 0 if a token was taken, otherwise the number of seconds until one will be available
+        """
+        if not self.rate:
+            return 0
+
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+
+            return (1 - self._tokens) / self.rate
+
+
+class Throttle:
+    """
+    Request throttle shared by the API client and the downloader
+
+    Combines a token bucket for the overall request rate with an adaptive concurrency limit. The limit grows by
+    roughly one request for every window of successful requests and is halved on every rate limit or server error
+    (AIMD), so parallel runs settle at the highest rate the server tolerates. A Retry-After header pauses every
+    request, not only the one that received it.
+    """
+    def __init__(self, rate=0, burst=1, max_concurrency=8, retries=5, pause=None, backoff=1.0, max_backoff=60.0):
+        """
+        Args:
+            rate(float): Maximum requests per second. 0 disables the limit
+            burst(int): Number of requests that may be sent back to back
+            max_concurrency(int): Upper bound of the adaptive concurrency limit
+            retries(int): Number of times to retry a rate limited or failed request
+            pause(Optional[tuple[float, float]]): Random pause range (in seconds) before each request
+            backoff(float): Base delay of the exponential backoff, in seconds
+            max_backoff(float): Maximum backoff delay, in seconds
+        """
+        self.log = logging.getLogger('tumdlr.throttle')
+
+        self.bucket             = TokenBucket(rate, burst)
+        self.max_concurrency    = max(1, int(max_concurrency))
+        self.retries            = max(0, int(retries))
+        self.pause              = pause
+        self.backoff            = backoff
+        self.max_backoff        = max_backoff
+
+        self.limit = float(self.max_concurrency)
+        self._in_flight = 0
+        self._blocked_until = 0.0
+        self._condition = threading.Condition()
+        self._async_conditions = weakref.WeakKeyDictionary()  # Event loop => asyncio.Condition its tasks wait on
+
+    @classmethod
+    def from_config(cls, config, max_concurrency=8):
+        """
+        Build a throttle from the [Throttling] configuration section
+
+        Args:
+            config(configparser.ConfigParser): Tumdlr configuration
+            max_concurrency(int): Upper bound of the adaptive concurrency limit
+
+        Returns:
+            Throttle
+        """
+        throttling = config['Throttling'] if config.has_section('Throttling') else None
+        if throttling is None:
+            return cls(max_concurrency=max_concurrency)
+
+        pause = None
+        if throttling.getboolean('Pause', False):
+            pause = (throttling.getint('PauseMin', 0) / 1000, throttling.getint('PauseMax', 0) / 1000)
+
+        return cls(
+            rate=throttling.getfloat('Rate', 0),
+            burst=throttling.getint('Burst', 1),
+            max_concurrency=max_concurrency,
+            retries=throttling.getint('MaxRetries', 5),
+            pause=pause
+        )
+
+    @property
+    def in_flight(self):
+        """
+        Returns:
+            int: Number of concurrency slots currently held
+        """
+        return self._in_flight
+
+    def acquire(self):
+        """
+        Wait for permission to send a request and take a concurrency slot. Every acquire() has to be paired with a
+        release() once the request is done
+        """
+        if self.pause:
+            time.sleep(random.uniform(*self.pause))
+
+        with self._condition:
+            while True:
+                wait = self._blocked_until - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                elif self._in_flight >= int(self.limit):
+                    self._condition.wait()
+                else:
+                    break
+
+            self._in_flight += 1
+
+        try:
+            self.bucket.acquire()
+        except BaseException:
+            self.release()
+            raise
+
+    async def acquire_async(self):
+        """
+        acquire() for asyncio tasks. The limits and backoff state are shared with threads, so a single throttle can
+        cover the threaded downloader and aiohttp requests alike
+        """
+        if self.pause:
+            await asyncio.sleep(random.uniform(*self.pause))
+
+        condition = self._async_condition()
+
+        # Slots freed by other threads are signalled through the condition, see _notify()
+        async with condition:
+            while True:
+                with self._condition:
+                    wait = self._blocked_until - time.monotonic()
+                    if wait <= 0 and self._in_flight < int(self.limit):
+                        self._in_flight += 1
+                        break
+
+                try:
+                    await asyncio.wait_for(condition.wait(), wait if wait > 0 else None)
+                except asyncio.TimeoutError:
+                    pass
+
+        try:
+            await self.bucket.acquire_async()
+        except BaseException:
+            self.release()
+            raise
+
+    def release(self):
+        """
+        Give back a concurrency slot taken with acquire() or acquire_async()
+        """
+        with self._condition:
+            self._in_flight -= 1
+            self._notify()
+
+    @contextmanager
+    def slot(self):
+        """
+        Hold a concurrency slot for the length of the block
+        """
+        self.acquire()
+
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def async_slot(self):
+        """
+        slot() for asyncio tasks
+        """
+        await self.acquire_async()
+
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _async_condition(self):
+        """
+        Returns:
+            asyncio.Condition: The condition the running event loop's tasks wait on for a free slot
+        """
+        loop = asyncio.get_event_loop()
+
+        with self._condition:
+            condition = self._async_conditions.get(loop)
+            if condition is None:
+                condition = self._async_conditions[loop] = asyncio.Condition()
+
+            return condition
+
+    def _notify(self):
+        """
+        Wake up the threads and tasks waiting for a slot. Called with the lock held
+        """
+        self._condition.notify_all()
+
+        for loop, condition in list(self._async_conditions.items()):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_notify_async, condition)
+
+    def success(self):
+        """
+        Additive increase, about one extra concurrent request per window of successful requests
+        """
+        with self._condition:
+            if self.limit < self.max_concurrency:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+                self._notify()
+
+    def failure(self, retry_after=None):
+        """
+        Multiplicative decrease, and pause all requests if the server told us how long to wait
+
+        Args:
+            retry_after(Optional[float]): Seconds to hold off every request for
+        """
+        with self._condition:
+            self.limit = max(1.0, self.limit / 2)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+
+            self.log.info('Backing off, concurrency limit is now %d', int(self.limit))
+
+    def delay(self, attempt, retry_after=None):
+        """
+        Exponential backoff with full jitter, never shorter than the server's Retry-After
+
+        Args:
+            attempt(int): Zero based retry attempt
+            retry_after(Optional[float]): Seconds the server asked us to wait
+
+        Returns:
+            float
+        """
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+        return max(delay, retry_after or 0)
+
+
+class ThrottledSession(Session):
+    """
+    Requests session that routes every request through a shared Throttle and retries rate limited or failed requests
+    """
+    def __init__(self, throttle):
+        """
+        Args:
+            throttle(Throttle)
+        """
+        super().__init__()
+        self.throttle = throttle
+
+    def request(self, method, url, *args, **kwargs):
+        attempt = 0
+
+        while True:
+            self.throttle.acquire()
+
+            try:
+                response = super().request(method, url, *args, **kwargs)
+            except BaseException as e:
+                self.throttle.release()
+
+                if isinstance(e, RequestException):
+                    self.throttle.failure()
+
+                raise
+
+            # A streamed body is only read once we've returned, so the slot is held until the connection is released
+            # back to the pool, by reading the whole body or closing the response
+            release_conn = getattr(response.raw, 'release_conn', None)
+            if kwargs.get('stream') and release_conn is not None:
+                release_on_close(response.raw, self.throttle.release, 'release_conn')
+            else:
+                self.throttle.release()
+
+            if response.status_code not in RETRY_STATUSES:
+                self.throttle.success()
+                return response
+
+            retry_after = parse_retry_after(response.headers.get('retry-after'))
+            self.throttle.failure(retry_after)
+
+            if attempt >= self.throttle.retries:
+                return response
+
+            delay = self.throttle.delay(attempt, retry_after)
+            self.throttle.log.warning('%s returned %d, retrying in %.1f seconds', url, response.status_code, delay)
+
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+
+def release_on_close(target, release, *methods):
+    """
+    Call `release` once, as soon as any of the given methods of `target` is called, or when `target` is garbage
+    collected without any of them being called
+
+    Args:
+        target(object): HTTP response, or the raw response of one
+        release(Callable[[], None])
+        methods(str): Names of the methods releasing the response's connection
+    """
+    finalizer = weakref.finalize(target, release)
+
+    for name in methods:
+        def wrapper(*args, _method=getattr(target, name), **kwargs):
+            try:
+                return _method(*args, **kwargs)
+            finally:
+                finalizer()
+
+        setattr(target, name, wrapper)
+
+
+def _notify_async(condition):
+    """
+    Wake up the tasks waiting on an asyncio condition. Runs in the condition's event loop
+    """
+    async def notify():
+        async with condition:
+            condition.notify_all()
+
+    asyncio.ensure_future(notify())
+
+
+def parse_retry_after(value):
+    """
+    Args:
+        value(Optional[str]): Retry-After header, either delay seconds or an HTTP date
+
+    Returns:
+        float|None: Seconds to wait
+    """
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None